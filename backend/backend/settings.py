@@ -16,6 +16,11 @@ from dotenv import load_dotenv, find_dotenv
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Before any setting below is read from the environment
+ENV_FILE = find_dotenv()
+if ENV_FILE:
+    load_dotenv(ENV_FILE)
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -45,6 +50,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mainlogic.metrics.MetricsMiddleware',  # first, so it times the whole request
+    'mainlogic.profiling.ProfilingMiddleware',  # removes itself unless PROFILING_ENABLED
+    'mainlogic.compression.CompressionMiddleware',  # gzip/Brotli for larger text and JSON responses
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware should be at the top
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -59,7 +67,7 @@ MIDDLEWARE = [
 CORS_ALLOW_ALL_ORIGINS = True  # For development only
 CORS_ALLOWED_ORIGINS = ['http://localhost:3000', 'http://127.0.0.1:3000', "https://story-mail-olive.vercel.app"]
 CORS_ALLOW_CREDENTIALS = True
-CORS_EXPOSE_HEADERS = ['Content-Type', 'Authorization']
+CORS_EXPOSE_HEADERS = ['Content-Type', 'Authorization', 'ETag']
 CORS_ALLOW_METHODS = [
     'DELETE',
     'GET',
@@ -106,8 +114,17 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
     ),
+    # orjson (mainlogic/renderers.py); the browsable API isn't used
+    'DEFAULT_RENDERER_CLASSES': (
+        'mainlogic.renderers.ORJSONRenderer',
+    ),
 }
 
+# Response compression (mainlogic/compression.py); smaller bodies are sent as is
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))  # used when the brotli package is installed
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -144,9 +161,30 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': False,
         },
+        # httpx logs every request at INFO; outbound calls are tracked in mainlogic.http_client
+        'httpx': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
 
+# Fraction of routine per-request log events kept (mainlogic/logs.py); warnings and errors are always logged
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+
+# Bearer token required to scrape /metrics; while unset, /metrics is a 404
+# unless DEBUG is on
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# Request profiling (mainlogic/profiling.py), browsable by staff at /admin/profiling/
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() == "true"
+# Requests slower than this are captured with their SQL and outbound HTTP calls
+PROFILING_SLOW_MS = float(os.environ.get("PROFILING_SLOW_MS", "500"))
+# Fraction of requests captured regardless of latency, with a cProfile call profile
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0.01"))
+PROFILING_BUFFER_SIZE = int(os.environ.get("PROFILING_BUFFER_SIZE", "200"))
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 pwd = os.environ.get('DB_PASSWORD')
@@ -161,6 +199,141 @@ DATABASES = {
     }
 }
 
+# Database connection reuse
+# "pool": psycopg 3 connection pool shared by all threads of the process (default)
+# "persistent": one connection per thread kept open for DB_CONN_MAX_AGE seconds
+# "none": open a new connection for every request (Django's default)
+DB_CONN_MODE = os.environ.get("DB_CONN_MODE", "pool")
+
+# Web and worker processes size their pools separately; run workers and
+# management commands with PROCESS_ROLE=worker
+PROCESS_ROLE = os.environ.get("PROCESS_ROLE", "web")
+DB_POOL_SIZES = {
+    'web': (
+        int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+        int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+    ),
+    'worker': (
+        int(os.environ.get("DB_WORKER_POOL_MIN_SIZE", "1")),
+        int(os.environ.get("DB_WORKER_POOL_MAX_SIZE", "4")),
+    ),
+}
+
+def configure_connection_reuse(database):
+    # Drop broken connections before use instead of failing the request
+    database['CONN_HEALTH_CHECKS'] = True
+    if DB_CONN_MODE == "pool":
+        min_size, max_size = DB_POOL_SIZES[PROCESS_ROLE]
+        database['CONN_MAX_AGE'] = 0  # the pool owns connection lifetime
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': min_size,
+            'max_size': max_size,
+            'timeout': float(os.environ.get("DB_POOL_TIMEOUT", "10")),  # wait for a free connection
+            'max_idle': 300,
+            'max_lifetime': 1800,
+        }
+    elif DB_CONN_MODE == "persistent":
+        database['CONN_MAX_AGE'] = int(os.environ.get("DB_CONN_MAX_AGE", "600"))
+    else:
+        database['CONN_MAX_AGE'] = 0
+
+# Read replicas for the dashboard/stats/list/chat endpoints (mainlogic/db_router.py)
+# Comma-separated host[:port] list, e.g. DB_REPLICA_HOSTS=localhost:5433
+DB_REPLICA_HOSTS = [h.strip() for h in os.environ.get("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+for i, replica_host in enumerate(DB_REPLICA_HOSTS):
+    replica_name, _, replica_port = replica_host.partition(':')
+    DATABASES[f'replica_{i}'] = {
+        **DATABASES['default'],
+        'HOST': replica_name,
+        'PORT': replica_port or '5432',
+        'TEST': {'MIRROR': 'default'},
+    }
+
+for database in DATABASES.values():
+    configure_connection_reuse(database)
+
+DATABASE_ROUTERS = ['mainlogic.db_router.ReplicaRouter']
+# Replicas further behind than this are skipped and reads go to the primary
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", "2"))
+# After a user's own write, their reads stay on the primary this long
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "10"))
+
+# Monthly email partitions (mainlogic/partitions.py, `manage.py email_partitions`)
+# Partitions are created this many months ahead by `email_partitions ensure`
+EMAIL_PARTITION_MONTHS_AHEAD = int(os.environ.get("EMAIL_PARTITION_MONTHS_AHEAD", "3"))
+# Months older than this are exported and dropped by `email_partitions archive`; 0 keeps everything
+EMAIL_RETENTION_MONTHS = int(os.environ.get("EMAIL_RETENTION_MONTHS", "0"))
+EMAIL_ARCHIVE_DIR = os.environ.get("EMAIL_ARCHIVE_DIR", str(BASE_DIR / "archive"))
+
+# Content-addressed file store for rendered digest PDFs (mainlogic/blobstore.py)
+BLOB_STORE_DIR = os.environ.get("BLOB_STORE_DIR", str(BASE_DIR / "blobs"))
+
+
+
+# Cache
+# Local memory by default (per process). Set REDIS_URL to share the cache across
+# processes; this needs the redis package installed.
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+# Response caching, read-your-writes pins (and with them replica reads) and the
+# volume chart's history cache are invalidated from whichever process writes:
+# other web workers, llm_worker, backfill_emails, purge_emails. They are only
+# used when every process sees the same cache. Set CACHE_SHARED=true to use them
+# with the local-memory cache anyway, for a single-process server.
+CACHE_SHARED = os.environ.get("CACHE_SHARED", "true" if REDIS_URL else "false").lower() == "true"
+
+# Upper bound on how long a cached read endpoint response is served (mainlogic/response_cache.py)
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get("RESPONSE_CACHE_TIMEOUT", "300"))
+
+# Delta sync of emails (mainlogic/sync.py, GET /api/sync/)
+SYNC_PAGE_SIZE = int(os.environ.get("SYNC_PAGE_SIZE", "200"))
+SYNC_MAX_PAGE_SIZE = int(os.environ.get("SYNC_MAX_PAGE_SIZE", "1000"))
+# Deletions are replayable for this long (`manage.py prune_tombstones`); older cursors must resync
+SYNC_TOMBSTONE_DAYS = int(os.environ.get("SYNC_TOMBSTONE_DAYS", "30"))
+
+# Email volume chart (mainlogic/timeseries.py, GET /api/stats/timeseries/)
+TIMESERIES_MAX_BUCKETS = int(os.environ.get("TIMESERIES_MAX_BUCKETS", "400"))
+# Settled buckets are invalidated explicitly; this only bounds how long unused ones take up cache
+TIMESERIES_CACHE_TIMEOUT = int(os.environ.get("TIMESERIES_CACHE_TIMEOUT", str(7 * 24 * 3600)))
+
+# Mailbox export (mainlogic/export.py, GET /api/export/, `manage.py export_emails`)
+# Rows fetched per round trip of the server-side cursor
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "500"))
+# Output is written out in pieces of about this size
+EXPORT_BUFFER_BYTES = int(os.environ.get("EXPORT_BUFFER_BYTES", str(64 * 1024)))
+
+# Batched account deletion and retention (mainlogic/purge.py, `manage.py purge_emails`)
+PURGE_BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE", "1000"))
+# Deletes are paced to stay under this many rows per second (0: unthrottled)
+PURGE_MAX_ROWS_PER_SECOND = int(os.environ.get("PURGE_MAX_ROWS_PER_SECOND", "5000"))
+# `purge_emails --retention` deletes emails older than this many days; unset keeps everything
+EMAIL_RETENTION_DAYS = int(os.environ["EMAIL_RETENTION_DAYS"]) if os.environ.get("EMAIL_RETENTION_DAYS") else None
+
+# Server-sent email events (mainlogic/events.py, GET /api/events/)
+EVENTS_ENABLED = os.environ.get("EVENTS_ENABLED", "true").lower() == "true"
+# "postgres": LISTEN/NOTIFY, reaches every process; "local": this process only
+EVENTS_BACKEND = os.environ.get("EVENTS_BACKEND", "postgres")
+EVENTS_CHANNEL = os.environ.get("EVENTS_CHANNEL", "storymail_events")
+# Events buffered per stream before it is told to resync instead
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", "100"))
+# Comment line sent when idle, so proxies don't time the stream out
+EVENTS_KEEPALIVE_SECONDS = float(os.environ.get("EVENTS_KEEPALIVE_SECONDS", "15"))
+# Streams are closed after this long; clients reconnect (with a fresh token)
+EVENTS_STREAM_MAX_SECONDS = float(os.environ.get("EVENTS_STREAM_MAX_SECONDS", "600"))
 
 
 # Password validation
@@ -205,10 +378,6 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-ENV_FILE = find_dotenv()
-if ENV_FILE:
-    load_dotenv(ENV_FILE)
-
 
 # Load Auth0 application settings into memory
 
@@ -216,5 +385,86 @@ AUTH0_DOMAIN = os.environ.get("AUTH0_DOMAIN")
 AUTH0_CLIENT_ID = os.environ.get("AUTH0_CLIENT_ID")
 AUTH0_CLIENT_SECRET = os.environ.get("AUTH0_CLIENT_SECRET")
 AUTH0_AUDIENCE = os.environ.get("AUTH0_AUDIENCE")  # API audience - defaults to client_id
+AUTH0_JWKS_URL = os.environ.get("AUTH0_JWKS_URL") or f"https://{AUTH0_DOMAIN}/.well-known/jwks.json"
+# The JWKS is cached per process for AUTH0_JWKS_CACHE_SECONDS. A token signed
+# by a key it doesn't list (Auth0 rotated its keys) triggers a refetch, at most
+# once every AUTH0_JWKS_MIN_REFRESH_SECONDS so bogus key ids can't force one
+# per request
+AUTH0_JWKS_CACHE_SECONDS = float(os.environ.get("AUTH0_JWKS_CACHE_SECONDS", "600"))
+AUTH0_JWKS_MIN_REFRESH_SECONDS = float(os.environ.get("AUTH0_JWKS_MIN_REFRESH_SECONDS", "30"))
+
+POSTMARK_API_URL = os.environ.get("POSTMARK_API_URL", "https://api.postmarkapp.com")
+
+FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:3000")
+
+# Outbound HTTP calls to Postmark, Auth0, etc. (mainlogic/http_client.py)
+OUTBOUND_HTTP = {
+    'CONNECT_TIMEOUT': float(os.environ.get("OUTBOUND_HTTP_CONNECT_TIMEOUT", "3.05")),
+    'READ_TIMEOUT': float(os.environ.get("OUTBOUND_HTTP_READ_TIMEOUT", "10")),
+    'POOL_MAXSIZE': 10,             # keep-alive connections kept per host
+    'ASYNC_MAX_CONNECTIONS': 100,   # total concurrent connections per event loop
+    'MAX_RETRIES': 2,
+    'BACKOFF_SECONDS': 0.2,
+    'BREAKER_FAILURE_THRESHOLD': 5,
+    'BREAKER_RESET_SECONDS': 30,
+    # Per-host overrides of any of the keys above
+    'HOSTS': {
+        'api.postmarkapp.com': {'READ_TIMEOUT': 30},
+    },
+}
 
-FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:3000")
\ No newline at end of file
+# Timeout (seconds) for a single Gemini request
+GEMINI_TIMEOUT = float(os.environ.get("GEMINI_TIMEOUT", "60"))
+
+# Admission control (mainlogic/admission.py), per worker process
+# Concurrent Postmark webhook requests, and how many more may wait for a slot
+INGEST_MAX_IN_FLIGHT = int(os.environ.get("INGEST_MAX_IN_FLIGHT", "8"))
+INGEST_MAX_QUEUE = int(os.environ.get("INGEST_MAX_QUEUE", "32"))
+# Seconds a queued webhook waits for a slot before it is answered 503
+INGEST_QUEUE_TIMEOUT = float(os.environ.get("INGEST_QUEUE_TIMEOUT", "5"))
+# Concurrent Gemini calls; the reserved slots are only used by chat and digest
+LLM_MAX_IN_FLIGHT = int(os.environ.get("LLM_MAX_IN_FLIGHT", "16"))
+LLM_RESERVED_INTERACTIVE = int(os.environ.get("LLM_RESERVED_INTERACTIVE", "4"))
+# Bounds (seconds) for the Retry-After sent with 429/503 responses
+ADMISSION_RETRY_AFTER_MIN = int(os.environ.get("ADMISSION_RETRY_AFTER_MIN", "1"))
+ADMISSION_RETRY_AFTER_MAX = int(os.environ.get("ADMISSION_RETRY_AFTER_MAX", "300"))
+
+# Largest Postmark inbound webhook body accepted; attachments are streamed to
+# the blob store, so this bounds disk use rather than memory
+INBOUND_MAX_BODY_BYTES = int(os.environ.get("INBOUND_MAX_BODY_BYTES", str(50 * 1024 * 1024)))
+
+# Background categorization (mainlogic/llm_queue.py): with LLM_QUEUE_ENABLED the
+# webhook stores uncertain emails as pending and `manage.py llm_worker` labels them
+LLM_QUEUE_ENABLED = os.environ.get("LLM_QUEUE_ENABLED", "false").lower() == "true"
+LLM_WORKER_CONCURRENCY = int(os.environ.get("LLM_WORKER_CONCURRENCY", "8"))
+LLM_WORKER_POLL_INTERVAL = float(os.environ.get("LLM_WORKER_POLL_INTERVAL", "1"))
+# Pending emails held in memory per user; keeps new users' mail close to the front
+LLM_WORKER_PREFETCH = int(os.environ.get("LLM_WORKER_PREFETCH", "20"))
+# Deficit round-robin credit per user turn, in prompt characters
+LLM_DRR_QUANTUM = int(os.environ.get("LLM_DRR_QUANTUM", "4000"))
+# Emails per user per hour sent to the LLM by the worker (0 = unlimited)
+LLM_USER_QUOTA_PER_HOUR = int(os.environ.get("LLM_USER_QUOTA_PER_HOUR", "0"))
+# Users with at least this many pending emails are reported as "large" in queue-delay metrics
+LLM_LARGE_BACKLOG = int(os.environ.get("LLM_LARGE_BACKLOG", "100"))
+# A failed Gemini call leaves the email pending; it is retried after this many
+# seconds, doubling per failure up to LLM_WORKER_RETRY_MAX_DELAY
+LLM_WORKER_RETRY_DELAY = float(os.environ.get("LLM_WORKER_RETRY_DELAY", "30"))
+LLM_WORKER_RETRY_MAX_DELAY = float(os.environ.get("LLM_WORKER_RETRY_MAX_DELAY", "3600"))
+
+# Re-categorization backfill (manage.py backfill_emails, mainlogic/backfill.py)
+BACKFILL_CHUNK_SIZE = int(os.environ.get("BACKFILL_CHUNK_SIZE", "500"))
+BACKFILL_CONCURRENCY = int(os.environ.get("BACKFILL_CONCURRENCY", "8"))
+# Seconds Gemini results are cached by prompt hash, so identical emails and reruns are free
+BACKFILL_CACHE_TIMEOUT = int(os.environ.get("BACKFILL_CACHE_TIMEOUT", str(7 * 24 * 3600)))
+
+# Local fast-path classifier (mainlogic/classifier.py)
+# Emails it labels with at least CLASSIFIER_MIN_CONFIDENCE skip the Gemini call
+CLASSIFIER_ENABLED = os.environ.get("CLASSIFIER_ENABLED", "true").lower() == "true"
+CLASSIFIER_MIN_CONFIDENCE = float(os.environ.get("CLASSIFIER_MIN_CONFIDENCE", "0.9"))
+CLASSIFIER_MODEL_PATH = os.environ.get("CLASSIFIER_MODEL_PATH", str(BASE_DIR / "classifier_model.json"))
+
+# Near-duplicate detection at ingest (mainlogic/duplicates.py)
+# An email whose estimated similarity to an earlier one is at least
+# DUPLICATE_THRESHOLD copies its category and summary instead of being categorized
+DUPLICATES_ENABLED = os.environ.get("DUPLICATES_ENABLED", "true").lower() == "true"
+DUPLICATE_THRESHOLD = float(os.environ.get("DUPLICATE_THRESHOLD", "0.7"))
\ No newline at end of file
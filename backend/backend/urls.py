@@ -22,11 +22,18 @@ from custom_auth.views import (
 from mainlogic.views import (
     DashboardRedirectView, PostmarkInboundView, UserInfoView,
     CategoryStatsView, EmailListView, EmailDetailView, ChatAPIView,
-    DigestAPIView, DashboardStatsView
+    DigestAPIView, DigestHistoryView, DigestDetailView, DigestPdfView,
+    DashboardStatsView, EmailSyncView, EmailEventsView, VolumeTimeseriesView,
+    EmailExportView, ThreadListView, ThreadDetailView
 )
+from mainlogic.metrics import metrics_view
+from mainlogic.profiling import capture_detail_view, capture_list_view
 
 urlpatterns = [
+    path('admin/profiling/', capture_list_view, name='profiling_captures'),
+    path('admin/profiling/<int:capture_id>/', capture_detail_view, name='profiling_capture'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     
     path('api/auth/login/', LoginView.as_view(), name='auth_login'),
     path('api/auth/callback/', CallbackView.as_view(), name='auth_callback'),
@@ -37,7 +44,16 @@ urlpatterns = [
     path('api/categories/stats/', CategoryStatsView.as_view(), name='category_stats'),
     path('api/emails/', EmailListView.as_view(), name='email_list'),
     path('api/emails/<int:email_id>/', EmailDetailView.as_view(), name='email_detail'),
+    path('api/threads/', ThreadListView.as_view(), name='thread_list'),
+    path('api/threads/<int:thread_id>/', ThreadDetailView.as_view(), name='thread_detail'),
+    path('api/sync/', EmailSyncView.as_view(), name='email_sync'),
+    path('api/events/', EmailEventsView.as_view(), name='email_events'),
+    path('api/export/', EmailExportView.as_view(), name='email_export'),
     path('api/chat/', ChatAPIView.as_view(), name='chat_api'),
     path('api/digest/', DigestAPIView.as_view(), name='digest_api'),
+    path('api/digests/', DigestHistoryView.as_view(), name='digest_history'),
+    path('api/digests/<int:digest_id>/', DigestDetailView.as_view(), name='digest_detail'),
+    path('api/digests/<int:digest_id>/pdf/', DigestPdfView.as_view(), name='digest_pdf'),
     path('api/dashboard/stats/', DashboardStatsView.as_view(), name='dashboard_stats'),
+    path('api/stats/timeseries/', VolumeTimeseriesView.as_view(), name='volume_timeseries'),
 ]
@@ -0,0 +1,114 @@
+"""
+Load test for the async LLM-bound endpoints.
+
+Fires bursts of concurrent POST /api/chat/ requests at the ASGI application
+in-process, with Gemini and Auth0 replaced by fakes that just sleep for
+--latency seconds. If the view really yields while it waits upstream, a
+burst of N requests finishes in roughly one upstream latency regardless of
+N; a blocking view would need N / workers latencies instead.
+
+The client shares the process and event loop with the server, so per-request
+CPU (routing, middleware, ORM hops) is counted against the server as well.
+
+Usage (from backend/, against the configured database):
+    python -m benchmarks.async_load --concurrency 10,100,500,1000 --latency 1.0
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import logging  # noqa: E402
+
+import httpx  # noqa: E402
+
+from backend.asgi import application  # noqa: E402
+from benchmarks.fakes import FakeGemini  # noqa: E402
+from custom_auth.authentication import Auth0User  # noqa: E402
+from mainlogic import async_views, views  # noqa: E402
+from mainlogic.models import Email, StoryMailUser  # noqa: E402
+
+LOADTEST_SUB = "loadtest|async-user"
+
+
+def install_fakes(latency):
+    user = Auth0User({"sub": LOADTEST_SUB, "email": "loadtest@example.com"})
+
+    async def fake_authenticate(request):
+        return user
+
+    async_views.aauthenticate = fake_authenticate
+    views.genai = FakeGemini(latency)
+
+
+def seed():
+    user, _ = StoryMailUser.objects.get_or_create(
+        auth0_id=LOADTEST_SUB, defaults={"email": "loadtest@example.com", "name": "Load Test"}
+    )
+    if not user.emails.exists():
+        Email.objects.bulk_create(
+            Email(user=user, subject=f"Load test email {i}", from_email="sender@example.com",
+                  category="other", summary="Synthetic email for load testing")
+            for i in range(20)
+        )
+
+
+async def burst(client, concurrency):
+    latencies = []
+
+    async def one():
+        start = time.perf_counter()
+        response = await client.post("/api/chat/", json={"query": "What's new?"})
+        latencies.append(time.perf_counter() - start)
+        return response.status_code
+
+    start = time.perf_counter()
+    statuses = await asyncio.gather(*(one() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "ok": sum(1 for s in statuses if s == 200),
+        "wall_s": wall,
+        "throughput_rps": concurrency / wall,
+        "p50_s": statistics.median(latencies),
+        "p99_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    }
+
+
+async def main(levels, latency):
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost", timeout=None) as client:
+        print(f"Upstream latency {latency:.2f}s")
+        print(f"{'concurrency':>11} {'ok':>6} {'wall s':>8} {'req/s':>8} {'p50 s':>7} {'p99 s':>7}")
+        sustained = 0
+        for concurrency in levels:
+            r = await burst(client, concurrency)
+            print(f"{r['concurrency']:>11} {r['ok']:>6} {r['wall_s']:>8.2f} {r['throughput_rps']:>8.1f} "
+                  f"{r['p50_s']:>7.2f} {r['p99_s']:>7.2f}")
+            # Sustained means every request succeeded and even the slowest one
+            # spent less than one extra upstream latency queued behind the others
+            if r["ok"] < concurrency or r["p99_s"] > 2 * latency:
+                break
+            sustained = concurrency
+        print(f"Sustained {sustained} concurrent upstream calls in a single process")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="10,100,500,1000",
+                        help="Comma-separated burst sizes to try, in order")
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake upstream latency in seconds")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    install_fakes(args.latency)
+    seed()
+    asyncio.run(main([int(c) for c in args.concurrency.split(",")], args.latency))
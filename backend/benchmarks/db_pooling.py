@@ -0,0 +1,96 @@
+"""
+Requests per second with and without database connection reuse.
+
+Runs the same DB-bound endpoint (GET /api/categories/stats/) from a pool of
+client threads once per DB_CONN_MODE ("none", "persistent", "pool"), each in
+a fresh subprocess so the settings are read from scratch. Auth0 is faked so
+only Django and the database are measured.
+
+Point it at a local Postgres through the usual DB, DB_USER, DB_PASSWORD and
+DATABASE_URL variables. Connection setup is what pooling saves, so the gap
+grows with the latency to the database host.
+
+Usage (from backend/):
+    python -m benchmarks.db_pooling --requests 2000 --threads 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MODES = ("none", "persistent", "pool")
+LOADTEST_SUB = "loadtest|pool-user"
+
+
+def run_mode(n_requests, n_threads):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+
+    django.setup()
+
+    from django.test import Client
+
+    from custom_auth.authentication import Auth0JWTAuthentication, Auth0User
+    from mainlogic.models import Email, StoryMailUser
+
+    user = Auth0User({"sub": LOADTEST_SUB})
+    Auth0JWTAuthentication.authenticate = lambda self, request: (user, "token")
+
+    db_user, _ = StoryMailUser.objects.get_or_create(
+        auth0_id=LOADTEST_SUB, defaults={"email": "pool-loadtest@example.com"}
+    )
+    if not db_user.emails.exists():
+        Email.objects.bulk_create(
+            Email(user=db_user, subject=f"Pool test {i}", category=category)
+            for i, category in enumerate(["work", "newsletters", "other", "scam", "productivity"] * 20)
+        )
+
+    def worker(count):
+        # The test client fires request_started/finished, so Django opens and
+        # releases connections exactly as it would behind a real server
+        client = Client()
+        failures = 0
+        for _ in range(count):
+            failures += client.get("/api/categories/stats/").status_code != 200
+        return failures
+
+    per_thread = [n_requests // n_threads] * n_threads
+    start = time.perf_counter()
+    with ThreadPoolExecutor(n_threads) as executor:
+        failures = sum(executor.map(worker, per_thread))
+    elapsed = time.perf_counter() - start
+
+    done = sum(per_thread)
+    return {"requests": done, "failures": failures, "seconds": elapsed, "rps": done / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--run-mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        print(json.dumps(run_mode(args.requests, args.threads)))
+        return
+
+    print(f"{args.requests} requests from {args.threads} threads")
+    print(f"{'mode':<11} {'req/s':>8} {'seconds':>8} {'failures':>9}")
+    for mode in args.modes.split(","):
+        env = dict(os.environ, DB_CONN_MODE=mode)
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.db_pooling", "--run-mode", mode,
+             "--requests", str(args.requests), "--threads", str(args.threads)],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<11} {result['rps']:>8.1f} {result['seconds']:>8.2f} {result['failures']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Local stand-ins for the backend's upstreams, with configurable latency.
+
+- ``FakeUpstream``: a threaded HTTP server serving Auth0's JWKS and
+  Postmark's send endpoint. Requests reach it through the real
+  ``http_client`` (pooling, timeouts, breaker), so those costs are measured.
+- ``TokenFactory``: an RSA key whose public half the fake JWKS serves, used
+  to sign real RS256 access tokens, so JWT validation runs for real too.
+- ``FakeGemini``: replaces ``google.generativeai`` in ``mainlogic.views``;
+  calls sleep for the configured latency and report token usage.
+
+``configure_environment()`` must run before ``django.setup()`` so settings
+point Auth0 and Postmark at the fake server.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+AUTH0_DOMAIN = "bench.auth0.local"
+AUTH0_CLIENT_ID = "benchmark-client"
+
+
+class TokenFactory:
+    def __init__(self):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.kid = uuid.uuid4().hex
+        self.private_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        public = jwk.construct(public_pem, "RS256").to_dict()
+        self.jwks = {"keys": [{**public, "kid": self.kid, "use": "sig"}]}
+
+    def token(self, sub, email=None):
+        now = int(time.time())
+        claims = {
+            "sub": sub,
+            "email": email,
+            "aud": AUTH0_CLIENT_ID,
+            "iss": f"https://{AUTH0_DOMAIN}/",
+            "iat": now,
+            "exp": now + 24 * 3600,
+        }
+        return jwt.encode(claims, self.private_pem, algorithm="RS256", headers={"kid": self.kid})
+
+
+class FakeUpstream:
+    """Auth0 JWKS at /.well-known/jwks.json and Postmark at /email"""
+
+    def __init__(self, tokens, auth0_latency=0.02, postmark_latency=0.1):
+        self.tokens = tokens
+        self.auth0_latency = auth0_latency
+        self.postmark_latency = postmark_latency
+        self.requests = 0
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real upstreams
+
+            def _reply(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                upstream.requests += 1
+                if self.path == "/.well-known/jwks.json":
+                    time.sleep(upstream.auth0_latency)
+                    self._reply(200, upstream.tokens.jwks)
+                else:
+                    self._reply(404, {})
+
+            def do_POST(self):
+                upstream.requests += 1
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path == "/email":
+                    time.sleep(upstream.postmark_latency)
+                    self._reply(200, {"ErrorCode": 0, "Message": "OK", "MessageID": str(uuid.uuid4())})
+                else:
+                    self._reply(404, {})
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def configure_environment(upstream):
+    os.environ.update({
+        "AUTH0_DOMAIN": AUTH0_DOMAIN,
+        "AUTH0_CLIENT_ID": AUTH0_CLIENT_ID,
+        "AUTH0_JWKS_URL": f"{upstream.url}/.well-known/jwks.json",
+        "POSTMARK_API_URL": upstream.url,
+        "POSTMARK_SERVER_TOKEN": "benchmark",
+        "GEMINI_API_KEY": "benchmark",
+    })
+
+
+CATEGORY_REPLY = '{"category": "work", "summary": "A synthetic email about the project schedule."}'
+DIGEST_REPLY = json.dumps({
+    "narrative_summary": "This week was mostly work email, with a few newsletters.",
+    "category_counts": {"productivity": 3, "scam": 1, "newsletters": 5, "work": 12, "other": 2},
+    "highlights": ["Project kickoff scheduled", "Two new newsletters on AI"],
+    "clusters": {"Work": ["Kickoff", "Review"], "Newsletters": ["AI weekly"]},
+})
+
+
+class FakeGemini:
+    """Stands in for google.generativeai: every call waits `latency` seconds"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def configure(self, **kwargs):
+        pass
+
+    def _response(self, prompt, text):
+        self.calls += 1
+        usage = SimpleNamespace(prompt_token_count=len(prompt) // 4, candidates_token_count=len(text) // 4)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def _reply_for(self, prompt):
+        return CATEGORY_REPLY if "Categorize this email" in prompt else DIGEST_REPLY
+
+    def GenerativeModel(self, name):
+        gemini = self
+
+        class Model:
+            def generate_content(self, prompt, **kwargs):
+                time.sleep(gemini.latency)
+                return gemini._response(prompt, gemini._reply_for(prompt))
+
+            async def generate_content_async(self, prompt, **kwargs):
+                await asyncio.sleep(gemini.latency)
+                return gemini._response(prompt, gemini._reply_for(prompt))
+
+            def start_chat(self, history):
+                return Chat()
+
+        class Chat:
+            async def send_message_async(self, prompt, **kwargs):
+                await asyncio.sleep(gemini.latency)
+                return gemini._response(prompt, 'You have a few work emails, e.g. "Kickoff" (ID: 1).')
+
+        return Model()
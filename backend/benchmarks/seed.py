@@ -0,0 +1,105 @@
+"""
+Seed synthetic users and mailboxes for benchmarks.
+
+Users get auth0 ids ``bench|<n>`` and addresses ``bench<n>@example.com``, so
+they never collide with real accounts and can be removed with --reset. Each
+mailbox spreads its emails over the last --days days with a realistic mix of
+categories and repeat senders.
+
+Usage (from backend/, against the configured database):
+    python -m benchmarks.seed --users 100 --emails-per-user 2000
+"""
+import argparse
+import os
+import random
+from datetime import timedelta
+
+BENCH_PREFIX = "bench|"
+
+CATEGORY_WEIGHTS = {"work": 35, "newsletters": 30, "productivity": 15, "other": 15, "scam": 5}
+SUBJECTS = {
+    "work": ["Project kickoff", "Re: Q3 planning", "Design review notes", "Standup moved", "Contract draft"],
+    "newsletters": ["This week in AI", "Your weekly digest", "Top stories today", "New on the blog"],
+    "productivity": ["Your calendar for tomorrow", "3 tasks due today", "Weekly focus report"],
+    "other": ["Your order has shipped", "Photos from the weekend", "Dinner on Friday?"],
+    "scam": ["You have won a prize", "Urgent: verify your account", "Claim your refund now"],
+}
+BODY = (
+    "Hi there,\n\nThis is a synthetic email generated for benchmarking. "
+    "It has a couple of paragraphs so bodies have a realistic size.\n\n"
+) * 4
+
+
+def bench_sub(n):
+    return f"{BENCH_PREFIX}{n}"
+
+
+def bench_address(n):
+    return f"bench{n}@example.com"
+
+
+def senders_for(category, rng, count=8):
+    domain = {"newsletters": "news.example.com", "scam": "prizes.example.net"}.get(category, "example.org")
+    return [f"{category}{i}@{domain}" for i in range(rng.randint(2, count))]
+
+
+def seed(users, emails_per_user, days=90, reset=False, seed_value=0, batch_size=2000, log=print):
+    from django.utils import timezone
+
+    from mainlogic.models import Email, StoryMailUser
+
+    if reset:
+        StoryMailUser.objects.filter(auth0_id__startswith=BENCH_PREFIX).delete()
+
+    rng = random.Random(seed_value)
+    categories = list(CATEGORY_WEIGHTS)
+    weights = list(CATEGORY_WEIGHTS.values())
+    now = timezone.now()
+
+    created_users = 0
+    for n in range(users):
+        user, created = StoryMailUser.objects.get_or_create(
+            auth0_id=bench_sub(n), defaults={"email": bench_address(n), "name": f"Bench User {n}"}
+        )
+        created_users += created
+        missing = emails_per_user - user.emails.count()
+        senders = {category: senders_for(category, rng) for category in categories}
+        batch = []
+        for _ in range(max(missing, 0)):
+            category = rng.choices(categories, weights)[0]
+            subject = rng.choice(SUBJECTS[category])
+            batch.append(Email(
+                user=user,
+                from_email=rng.choice(senders[category]),
+                from_name=category.capitalize(),
+                to_email=user.email,
+                subject=subject,
+                date=now - timedelta(seconds=rng.randint(0, days * 86400)),
+                text_body=BODY,
+                category=category,
+                category_source="llm",
+                summary=f"{subject}: a synthetic {category} email.",
+            ))
+            if len(batch) >= batch_size:
+                Email.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Email.objects.bulk_create(batch)
+
+    total = Email.objects.filter(user__auth0_id__startswith=BENCH_PREFIX).count()
+    log(f"Seeded {users} benchmark users ({created_users} new) with {total} emails in total")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--emails-per-user", type=int, default=500)
+    parser.add_argument("--days", type=int, default=90, help="Spread email dates over this many days")
+    parser.add_argument("--reset", action="store_true", help="Delete existing benchmark users first")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+
+    django.setup()
+    seed(args.users, args.emails_per_user, days=args.days, reset=args.reset)
@@ -0,0 +1,131 @@
+"""
+JSON serialization time and bytes on the wire for the largest API payloads.
+
+Renders a synthetic email list (GET /api/emails/) and a digest response
+(POST /api/digest/) with DRF's stdlib-based JSONRenderer and with the orjson
+renderer now used by default (mainlogic/renderers.py), then compresses each
+body the way CompressionMiddleware would. The digest is measured both in
+its old shape, with the PDF inlined as base64 (``include_pdf``), and the
+current one that only links ``pdf_url``.
+
+No database or network is involved; the digest PDF is rendered by the real
+reportlab code from the synthetic digest.
+
+Usage (from backend/):
+    python -m benchmarks.serialization --emails 500 --repeat 50
+"""
+import argparse
+import base64
+import datetime
+import gzip
+import os
+import random
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from mainlogic.compression import brotli  # noqa: E402
+from mainlogic.digest_pdf import render_digest_pdf  # noqa: E402
+from mainlogic.models import EMAIL_CATEGORIES, DigestReport  # noqa: E402
+from mainlogic.renderers import ORJSONRenderer  # noqa: E402
+
+WORDS = (
+    "meeting invoice update schedule project report team review please attached "
+    "thanks order shipping account security newsletter offer weekly deadline"
+).split()
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def email_list(count, rng):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return [
+        {
+            "id": i,
+            "from_email": f"sender{i % 40}@example.com",
+            "from_name": f"Sender {i % 40}",
+            "to_email": "user@example.com",
+            "subject": sentence(rng, 6),
+            "date": (now - datetime.timedelta(minutes=17 * i)).isoformat(),
+            "text_body": " ".join(sentence(rng, 12) for _ in range(rng.randint(3, 30))),
+            "summary": sentence(rng, 20),
+            "category": rng.choice(EMAIL_CATEGORIES),
+        }
+        for i in range(count)
+    ]
+
+
+def digest_payloads(rng):
+    today = datetime.date.today()
+    digest_data = {
+        "narrative_summary": " ".join(sentence(rng, 15) for _ in range(8)),
+        "category_counts": {category: rng.randint(0, 40) for category in EMAIL_CATEGORIES},
+        "highlights": [sentence(rng, 14) for _ in range(5)],
+        "clusters": {category: [sentence(rng, 6) for _ in range(4)] for category in EMAIL_CATEGORIES},
+    }
+    digest = DigestReport(id=1, start_date=today - datetime.timedelta(days=7), end_date=today)
+    pdf = render_digest_pdf(digest, digest_data)
+    current = {
+        "id": digest.id,
+        "start_date": digest.start_date,
+        "end_date": digest.end_date,
+        "digest_data": digest_data,
+        "email_count": sum(digest_data["category_counts"].values()),
+        "email_sent": False,
+        "pdf_url": f"/api/digests/{digest.id}/pdf/",
+    }
+    inline = dict(current, pdf_included=True, pdf_base64=base64.b64encode(pdf).decode())
+    return inline, current, len(pdf)
+
+
+def time_render(renderer, data, repeat):
+    body = renderer.render(data)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        renderer.render(data)
+    return body, (time.perf_counter() - start) / repeat
+
+
+def wire_sizes(body):
+    sizes = {"raw": len(body), "gzip": len(gzip.compress(body, compresslevel=settings.GZIP_LEVEL, mtime=0))}
+    if brotli is not None:
+        sizes["br"] = len(brotli.compress(body, quality=settings.BROTLI_QUALITY))
+    return sizes
+
+
+def main(n_emails, repeat, seed):
+    rng = random.Random(seed)
+    inline_digest, digest, pdf_size = digest_payloads(rng)
+    payloads = [
+        (f"email list ({n_emails})", email_list(n_emails, rng)),
+        ("digest, inline PDF", inline_digest),
+        ("digest, pdf_url", digest),
+    ]
+    renderers = [("stdlib", JSONRenderer()), ("orjson", ORJSONRenderer())]
+
+    print(f"Digest PDF: {pdf_size} bytes; {repeat} renders per cell")
+    print(f"{'payload':<22} {'renderer':<8} {'ms':>8} {'raw B':>9} {'gzip B':>9} {'br B':>9}")
+    for name, data in payloads:
+        for renderer_name, renderer in renderers:
+            body, seconds = time_render(renderer, data, repeat)
+            sizes = wire_sizes(body)
+            print(f"{name:<22} {renderer_name:<8} {seconds * 1000:>8.3f} {sizes['raw']:>9} "
+                  f"{sizes['gzip']:>9} {sizes.get('br', '-'):>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=500, help="Emails in the list payload")
+    parser.add_argument("--repeat", type=int, default=50, help="Renders per measurement")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    main(args.emails, args.repeat, args.seed)
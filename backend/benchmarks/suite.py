@@ -0,0 +1,252 @@
+"""
+End-to-end benchmark suite.
+
+Seeds synthetic mailboxes (benchmarks/seed.py), starts local fakes for
+Auth0, Postmark and Gemini with configurable latency (benchmarks/fakes.py),
+then drives the ASGI application in-process with real signed access tokens
+and measures throughput and latency percentiles per scenario:
+
+    webhook_ingest   POST /api/postmark/inbound/
+    email_list       GET  /api/emails/?category=...
+    dashboard_stats  GET  /api/dashboard/stats/
+    chat             POST /api/chat/
+    digest           POST /api/digest/
+
+Results are written as JSON (git commit, scale, fake latencies and per
+scenario p50/p90/p99) to benchmarks/results/ by default. Pass --baseline
+with an earlier result file to print the change per scenario; with
+--max-regression the run exits non-zero when p99 latency or throughput got
+worse by more than that fraction.
+
+Usage (from backend/, against the configured database):
+    python -m benchmarks.suite --users 50 --emails-per-user 1000 --concurrency 20
+    python -m benchmarks.suite --baseline benchmarks/results/<earlier>.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks import fakes
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+SCENARIOS = ["webhook_ingest", "email_list", "dashboard_stats", "chat", "digest"]
+CATEGORIES = ["work", "newsletters", "productivity", "other", "scam"]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True
+        ).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+class Suite:
+    def __init__(self, client, tokens, users):
+        self.client = client
+        self.tokens = [tokens.token(sub, address) for sub, address in users]
+        self.users = users
+        self.rng = random.Random(0)
+
+    def _auth(self, i):
+        return {"Authorization": f"Bearer {self.tokens[i % len(self.tokens)]}"}
+
+    def request(self, scenario, i):
+        if scenario == "webhook_ingest":
+            _, address = self.users[i % len(self.users)]
+            category = self.rng.choice(CATEGORIES)
+            return self.client.post("/api/postmark/inbound/", json={
+                "MessageID": f"bench-{time.time_ns()}-{i}",
+                "From": f"{category}{self.rng.randint(0, 20)}@example.org",
+                "FromName": category.capitalize(),
+                "ToFull": [{"Email": address}],
+                "Subject": f"Benchmark {category} email {i}",
+                "TextBody": "Synthetic inbound email for benchmarking. " * 20,
+                "Date": datetime.now(timezone.utc).isoformat(),
+            })
+        if scenario == "email_list":
+            return self.client.get(f"/api/emails/?category={self.rng.choice(CATEGORIES)}", headers=self._auth(i))
+        if scenario == "dashboard_stats":
+            return self.client.get("/api/dashboard/stats/", headers=self._auth(i))
+        if scenario == "chat":
+            return self.client.post("/api/chat/", json={"query": "What happened this week?"}, headers=self._auth(i))
+        if scenario == "digest":
+            return self.client.post("/api/digest/", json={}, headers=self._auth(i))
+        raise ValueError(scenario)
+
+    async def run(self, scenario, requests, concurrency, warmup):
+        for i in range(warmup):
+            await self.request(scenario, i)
+
+        latencies = []
+        errors = 0
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await self.request(scenario, i)
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code >= 400
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - start
+        latencies.sort()
+        return {
+            "requests": requests,
+            "errors": errors,
+            "concurrency": concurrency,
+            "wall_s": round(wall, 3),
+            "throughput_rps": round(requests / wall, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+        }
+
+
+def compare(baseline, results, max_regression):
+    """Print per-scenario changes against a baseline; return the scenarios that regressed"""
+    regressed = []
+    print(f"\nCompared with {baseline.get('git_commit')} ({baseline.get('timestamp')}):")
+    print(f"{'scenario':<16} {'p50 ms':>18} {'p99 ms':>18} {'req/s':>18}")
+    for name, current in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+
+        def change(key):
+            old, new = before[key], current[key]
+            delta = (new - old) / old if old else 0.0
+            return f"{old:>7.1f}->{new:<7.1f}{delta:+.0%}", delta
+
+        p50, _ = change("p50_ms")
+        p99, p99_delta = change("p99_ms")
+        rps, rps_delta = change("throughput_rps")
+        print(f"{name:<16} {p50:>18} {p99:>18} {rps:>18}")
+        if max_regression is not None and (p99_delta > max_regression or -rps_delta > max_regression):
+            regressed.append(name)
+    return regressed
+
+
+async def main(args, tokens, upstream, gemini):
+    import httpx
+
+    from backend.asgi import application
+    from benchmarks.seed import bench_address, bench_sub
+
+    users = [(bench_sub(n), bench_address(n)) for n in range(args.users)]
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost", timeout=None) as client:
+        suite = Suite(client, tokens, users)
+        scenarios = {}
+        print(f"{'scenario':<16} {'reqs':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+        for name in args.scenarios:
+            requests = args.digest_requests if name == "digest" else args.requests
+            result = await suite.run(name, requests, args.concurrency, args.warmup)
+            scenarios[name] = result
+            print(f"{name:<16} {result['requests']:>6} {result['errors']:>6} {result['throughput_rps']:>8.1f} "
+                  f"{result['p50_ms']:>8.1f} {result['p90_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+
+    import django
+    from django.db import connection
+
+    commit, dirty = git_commit()
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "git_dirty": dirty,
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "scale": {"users": args.users, "emails_per_user": args.emails_per_user},
+        "fake_latency_s": {"gemini": args.gemini_latency, "auth0": args.auth0_latency, "postmark": args.postmark_latency},
+        "upstream_calls": {"gemini": gemini.calls, "auth0_postmark": upstream.requests},
+        "scenarios": scenarios,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--emails-per-user", type=int, default=500)
+    parser.add_argument("--skip-seed", action="store_true", help="Use the benchmark mailboxes already in the database")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--digest-requests", type=int, default=20, help="Measured requests for the digest scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--gemini-latency", type=float, default=0.5)
+    parser.add_argument("--auth0-latency", type=float, default=0.02)
+    parser.add_argument("--postmark-latency", type=float, default=0.1)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="With --baseline, exit 1 if p99 or throughput is worse by more than this fraction")
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # Fakes first: settings read the upstream URLs at import
+    tokens = fakes.TokenFactory()
+    upstream = fakes.FakeUpstream(tokens, args.auth0_latency, args.postmark_latency).start()
+    fakes.configure_environment(upstream)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+    import django
+
+    django.setup()
+
+    import logging
+
+    from benchmarks.seed import seed
+    from mainlogic import views
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    gemini = fakes.FakeGemini(args.gemini_latency)
+    views.genai = gemini
+    if not args.skip_seed:
+        seed(args.users, args.emails_per_user)
+
+    results = asyncio.run(main(args, tokens, upstream, gemini))
+    upstream.stop()
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{results['git_commit'] or 'nogit'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"\nWrote {output}")
+
+    if args.baseline:
+        regressed = compare(json.loads(Path(args.baseline).read_text()), results, args.max_regression)
+        if regressed:
+            print(f"Regressed beyond {args.max_regression:.0%}: {', '.join(regressed)}")
+            sys.exit(1)
@@ -1,7 +1,13 @@
+import logging
+import threading
+import time
+
 from rest_framework.authentication import BaseAuthentication
 from django.conf import settings
 from jose import jwt
-import requests
+from mainlogic import http_client, metrics
+
+logger = logging.getLogger(__name__)
 
 class Auth0User:
     def __init__(self, payload):
@@ -14,49 +20,126 @@ class Auth0User:
     def __getitem__(self, key):
         return self.payload[key]
 
+def get_bearer_token(headers):
+    auth = headers.get("Authorization", None)
+    if not auth:
+        return None
+
+    parts = auth.split()
+    if parts[0].lower() != "bearer" or len(parts) < 2:
+        return None
+    return parts[1]
+
+_jwks_lock = threading.Lock()
+_jwks_cache = {"jwks": None, "fetched_at": float("-inf")}
+
+
+def _cached_jwks(kid):
+    """The cached JWKS if it is fresh enough to check a token signed with `kid`, else None"""
+    jwks = _jwks_cache["jwks"]
+    age = time.monotonic() - _jwks_cache["fetched_at"]
+    if jwks is None or age >= settings.AUTH0_JWKS_CACHE_SECONDS:
+        return None
+    if any(key.get("kid") == kid for key in jwks["keys"]) or age < settings.AUTH0_JWKS_MIN_REFRESH_SECONDS:
+        return jwks
+    # Unknown key: Auth0 may have rotated its signing keys
+    return None
+
+
+def _store_jwks(response):
+    response.raise_for_status()
+    jwks = response.json()
+    _jwks_cache.update(jwks=jwks, fetched_at=time.monotonic())
+    return jwks
+
+
+def get_jwks(kid):
+    """The tenant's JWKS, fetched only when the cache is stale or lacks `kid`"""
+    jwks = _cached_jwks(kid)
+    if jwks is None:
+        with _jwks_lock:
+            jwks = _cached_jwks(kid)
+            if jwks is None:
+                with metrics.JWKS_FETCH_SECONDS.time():
+                    jwks = _store_jwks(http_client.get(settings.AUTH0_JWKS_URL))
+    return jwks
+
+
+async def aget_jwks(kid):
+    """Async counterpart of get_jwks"""
+    jwks = _cached_jwks(kid)
+    if jwks is None:
+        start = time.perf_counter()
+        response = await http_client.aget(settings.AUTH0_JWKS_URL)
+        metrics.JWKS_FETCH_SECONDS.observe(time.perf_counter() - start)
+        jwks = _store_jwks(response)
+    return jwks
+
+
+def decode_token(token, jwks):
+    """
+    Validate an Auth0 access token against the tenant's JWKS and return the user
+    """
+    with metrics.JWT_DECODE_SECONDS.time():
+        return _decode_token(token, jwks)
+
+def _decode_token(token, jwks):
+    unverified_header = jwt.get_unverified_header(token)
+    rsa_key = {}
+
+    for key in jwks["keys"]:
+        if key["kid"] == unverified_header["kid"]:
+            rsa_key = {
+                "kty": key["kty"],
+                "kid": key["kid"],
+                "use": key["use"],
+                "n": key["n"],
+                "e": key["e"]
+            }
+
+    if rsa_key:
+        payload = jwt.decode(
+            token,
+            rsa_key,
+            algorithms=["RS256"],
+            audience=settings.AUTH0_CLIENT_ID,
+            issuer=f"https://{settings.AUTH0_DOMAIN}/"
+        )
+        return Auth0User(payload)
+    return None
+
 class Auth0JWTAuthentication(BaseAuthentication):
     """
     Custom authentication for validating Auth0 JWT tokens
     """
     def authenticate(self, request):
-        auth = request.headers.get("Authorization", None)
-        if not auth:
-            return None
-            
-        parts = auth.split()
-        if parts[0].lower() != "bearer":
+        token = get_bearer_token(request.headers)
+        if not token:
             return None
-            
-        token = parts[1]
+
         try:
-            
-
-            jwks = requests.get(f"https://{settings.AUTH0_DOMAIN}/.well-known/jwks.json").json()
-            unverified_header = jwt.get_unverified_header(token)
-            rsa_key = {}
-            
-            for key in jwks["keys"]:
-                if key["kid"] == unverified_header["kid"]:
-                    rsa_key = {
-                        "kty": key["kty"],
-                        "kid": key["kid"],
-                        "use": key["use"],
-                        "n": key["n"],
-                        "e": key["e"]
-                    }
-                    
-            if rsa_key:
-                payload = jwt.decode(
-                    token,
-                    rsa_key,
-                    algorithms=["RS256"],
-                    audience=settings.AUTH0_CLIENT_ID,
-                    issuer=f"https://{settings.AUTH0_DOMAIN}/"
-                )
-                print("[Auth0JWTAuthentication] Decoded JWT payload:", payload)
-                return (Auth0User(payload), token)
+            jwks = get_jwks(jwt.get_unverified_header(token).get("kid"))
+            user = decode_token(token, jwks)
+            if user:
+                return (user, token)
         except Exception as e:
-            print(f"JWT validation error: {str(e)}")
+            logger.warning(f"JWT validation error: {str(e)}")
             return None
-            
-        return None
\ No newline at end of file
+
+        return None
+
+async def aauthenticate(request):
+    """
+    Async counterpart of Auth0JWTAuthentication for native async views.
+    Returns an Auth0User, or None if the request is not authenticated.
+    """
+    token = get_bearer_token(request.headers)
+    if not token:
+        return None
+
+    try:
+        jwks = await aget_jwks(jwt.get_unverified_header(token).get("kid"))
+        return decode_token(token, jwks)
+    except Exception as e:
+        logger.warning(f"JWT validation error: {str(e)}")
+        return None
@@ -1,36 +1,45 @@
 from django.shortcuts import render, redirect
 import json
-from authlib.integrations.django_client import OAuth
 from django.conf import settings
 from urllib.parse import quote_plus, urlencode
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework import status
-import requests
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+import functools
 import logging
 from django.http import HttpResponse
-from mainlogic.views import DashboardRedirectView
 # Import the Auth0JWTAuthentication class from the authentication module
 from custom_auth.authentication import Auth0JWTAuthentication
 from mainlogic.models import StoryMailUser
+from mainlogic.async_views import AsyncAPIView
+from mainlogic import http_client
+from mainlogic.renderers import FastJsonResponse
 # Set up logger
 logger = logging.getLogger(__name__)
 
-oauth = OAuth()
+@functools.cache
+def get_oauth():
+    """
+    authlib OAuth registry with the Auth0 client, built on first use: importing
+    authlib is slow and the login views below build their URLs directly.
+    """
+    from authlib.integrations.django_client import OAuth
 
-oauth.register(
-    "auth0",
-    client_id=settings.AUTH0_CLIENT_ID,
-    client_secret=settings.AUTH0_CLIENT_SECRET,
-    client_kwargs={
-        "scope": "openid profile email",
-        "audience": settings.AUTH0_AUDIENCE,
-    },
-    server_metadata_url=f"https://{settings.AUTH0_DOMAIN}/.well-known/openid-configuration",
-)
+    oauth = OAuth()
+    oauth.register(
+        "auth0",
+        client_id=settings.AUTH0_CLIENT_ID,
+        client_secret=settings.AUTH0_CLIENT_SECRET,
+        client_kwargs={
+            "scope": "openid profile email",
+            "audience": settings.AUTH0_AUDIENCE,
+        },
+        server_metadata_url=f"https://{settings.AUTH0_DOMAIN}/.well-known/openid-configuration",
+    )
+    return oauth
 
 # API endpoint for user information
 class UserInfoView(APIView):
@@ -98,20 +107,18 @@ class LoginView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # API callback endpoint that exchanges code for tokens
-@method_decorator(csrf_exempt, name='dispatch')
-class CallbackView(APIView):
-    permission_classes = [AllowAny]
-    authentication_classes = []      # Explicitly empty authentication classes
+class CallbackView(AsyncAPIView):
+    authenticated = False
 
-    def get(self, request):
+    async def get(self, request):
         """
         Handle callback from Auth0 (when user is redirected back from Auth0)
         """
         try:
-            code = request.query_params.get('code')
-            error = request.query_params.get('error')
-            error_description = request.query_params.get('error_description')
-            state = request.query_params.get('state', '')
+            code = request.GET.get('code')
+            error = request.GET.get('error')
+            error_description = request.GET.get('error_description')
+            state = request.GET.get('state', '')
             
             logger.info(f"Callback received: code={code}, error={error}, state={state}")
             
@@ -146,21 +153,12 @@ class CallbackView(APIView):
                 "redirect_uri": redirect_uri
             }
             
-            logger.info(f"Exchanging code for token with payload: {payload}")
-            response = requests.post(token_url, json=payload)
+            logger.info(f"Exchanging code for token (redirect_uri={redirect_uri})")
+            response = await http_client.apost(token_url, json=payload)
             
             if response.status_code == 200:
                 token_data = response.json()
                 logger.info("Successfully exchanged code for token")
-                id_token = token_data.get("id_token")
-                if id_token:
-                    from jose import jwt
-                    try:
-                        payload = jwt.get_unverified_claims(id_token)
-                        print("[CallbackView] Decoded ID token payload:", payload)
-                    except Exception as e:
-                        print("[CallbackView] Failed to decode ID token:", e)
-                
                 # Redirect to /dashboard/ with tokens as URL fragments
                 tokens_fragment = urlencode({
                     "access_token": token_data.get("access_token", ""),
@@ -178,17 +176,17 @@ class CallbackView(APIView):
             logger.error(f"Error in CallbackView.get: {str(e)}")
             return redirect(settings.FRONTEND_URL + "/login?error=server_error&error_description=Internal+server+error")
 
-    def post(self, request):
+    async def post(self, request):
         """
         Exchange authorization code for tokens (API method)
         """
         try:
-            code = request.data.get('code')
-            redirect_uri = request.data.get('redirect_uri')
+            code = self.data.get('code')
+            redirect_uri = self.data.get('redirect_uri')
             
             if not code or not redirect_uri:
                 logger.error("Missing code or redirect_uri")
-                return Response({"error": "Missing code or redirect_uri"}, status=status.HTTP_400_BAD_REQUEST)
+                return FastJsonResponse({"error": "Missing code or redirect_uri"}, status=status.HTTP_400_BAD_REQUEST)
                 
             token_url = f"https://{settings.AUTH0_DOMAIN}/oauth/token"
             payload = {
@@ -199,18 +197,18 @@ class CallbackView(APIView):
                 "redirect_uri": redirect_uri
             }
             
-            logger.info(f"Exchanging code for token with payload: {payload}")
-            response = requests.post(token_url, json=payload)
+            logger.info(f"Exchanging code for token (redirect_uri={redirect_uri})")
+            response = await http_client.apost(token_url, json=payload)
             
             if response.status_code == 200:
                 logger.info("Successfully exchanged code for token")
-                return Response(response.json())
+                return FastJsonResponse(response.json())
             else:
                 logger.error(f"Failed to exchange code: {response.status_code}, {response.text}")
-                return Response(response.json(), status=response.status_code)
+                return FastJsonResponse(response.json(), status=response.status_code)
         except Exception as e:
             logger.error(f"Error in CallbackView.post: {str(e)}")
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return FastJsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # API logout endpoint
 @method_decorator(csrf_exempt, name='dispatch')
@@ -0,0 +1,182 @@
+"""
+Admission control for inbound mail and Gemini calls.
+
+During an inbound mail storm every Postmark webhook used to be processed
+inline, and the pile of concurrent Gemini calls starved the rest of the web
+tier. Two per-process gates now bound that work:
+
+- ``INGEST`` limits concurrent webhook requests to INGEST_MAX_IN_FLIGHT.
+  Up to INGEST_MAX_QUEUE more wait (FIFO) for at most INGEST_QUEUE_TIMEOUT
+  seconds; beyond that the webhook answers 429, and a request that waited
+  without getting a slot answers 503.
+- ``LLM`` limits concurrent Gemini calls to LLM_MAX_IN_FLIGHT, of which
+  LLM_RESERVED_INTERACTIVE can only be used by interactive requests (chat,
+  digest), so ingestion can never take the last slots. An ingest request
+  that finds no background slot answers 503.
+
+Rejections carry a Retry-After estimated from the current queue depth and
+recent ingest latency. Postmark retries any non-200 webhook response on its
+own schedule, so shed mail arrives again once the burst has drained.
+
+The gates count work in this process only; each worker enforces its own
+limits.
+"""
+import asyncio
+import collections
+import contextlib
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+from .renderers import FastJsonResponse
+
+
+class Rejected(Exception):
+    """Raised when a gate sheds a request; ``response()`` builds the HTTP reply"""
+
+    def __init__(self, gate, reason, status, retry_after):
+        super().__init__(f"{gate.name}: {reason}")
+        self.gate = gate
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+    def response(self):
+        response = FastJsonResponse(
+            {"error": "Server busy, retry later", "reason": self.reason}, status=self.status
+        )
+        response["Retry-After"] = str(self.retry_after)
+        return response
+
+
+class _Waiter:
+    __slots__ = ("loop", "future", "granted")
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+
+class Gate:
+    """Bounded in-flight count with an optional bounded FIFO wait queue"""
+
+    def __init__(self, name, capacity, max_queue=0, queue_timeout=0.0):
+        self.name = name
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+        # Smoothed time a slot is held, for Retry-After estimates
+        self._avg_seconds = 1.0
+        metrics.ADMISSION_IN_FLIGHT.labels(gate=name).set_function(lambda: self.in_flight)
+        metrics.ADMISSION_QUEUED.labels(gate=name).set_function(lambda: len(self._waiters))
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def retry_after(self):
+        """Seconds until the current backlog has likely drained"""
+        backlog = (self.in_flight + len(self._waiters)) / max(self.capacity, 1)
+        seconds = math.ceil(backlog * self._avg_seconds)
+        return min(max(seconds, settings.ADMISSION_RETRY_AFTER_MIN), settings.ADMISSION_RETRY_AFTER_MAX)
+
+    def _reject(self, reason, status):
+        metrics.ADMISSION_REJECTED.labels(gate=self.name, reason=reason).inc()
+        return Rejected(self, reason, status, self.retry_after())
+
+    def try_acquire(self, limit=None):
+        """Take a slot if fewer than `limit` (default: capacity) are in use; never waits"""
+        limit = self.capacity if limit is None else limit
+        with self._lock:
+            if self.in_flight < limit and not self._waiters:
+                self.in_flight += 1
+                return True
+        return False
+
+    async def acquire(self):
+        """Take a slot, waiting in the queue if there is room; raises Rejected otherwise"""
+        with self._lock:
+            if self.in_flight < self.capacity and not self._waiters:
+                self.in_flight += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                raise self._reject("queue_full", 429)
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                    if isinstance(exc, asyncio.CancelledError):
+                        raise
+                    raise self._reject("queue_timeout", 503) from None
+            # Granted as the wait ended: the slot is ours
+            if isinstance(exc, asyncio.CancelledError):
+                self.release()
+                raise
+        finally:
+            metrics.ADMISSION_WAIT_SECONDS.labels(gate=self.name).observe(time.perf_counter() - start)
+
+    def release(self, held_seconds=None):
+        with self._lock:
+            if held_seconds is not None:
+                self._avg_seconds = 0.9 * self._avg_seconds + 0.1 * held_seconds
+            if self._waiters:
+                # Hand the slot straight to the oldest waiter; in_flight is unchanged
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+            else:
+                self.in_flight -= 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+INGEST = Gate(
+    "ingest",
+    settings.INGEST_MAX_IN_FLIGHT,
+    max_queue=settings.INGEST_MAX_QUEUE,
+    queue_timeout=settings.INGEST_QUEUE_TIMEOUT,
+)
+LLM = Gate("llm", settings.LLM_MAX_IN_FLIGHT)
+
+
+@contextlib.asynccontextmanager
+async def llm_slot(interactive):
+    """
+    Hold one of the Gemini slots for the duration of a call.
+
+    Background work (ingestion) may only use the slots not reserved for
+    interactive requests. Raises Rejected when none is free.
+    """
+    limit = LLM.capacity if interactive else LLM.capacity - settings.LLM_RESERVED_INTERACTIVE
+    if not LLM.try_acquire(limit):
+        raise LLM._reject("interactive_busy" if interactive else "llm_backlog", 503)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        LLM.release(time.perf_counter() - start)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MainlogicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mainlogic'
+
+    def ready(self):
+        # Register the read-your-writes, cache invalidation, query counting, sync cleanup and
+        # volume history signal handlers
+        from . import db_router, metrics, response_cache, sync, timeseries  # noqa: F401
@@ -0,0 +1,208 @@
+"""
+Resumable re-categorization and re-summarization of stored emails.
+
+After a change to the category prompt or to EMAIL_CATEGORIES,
+``manage.py backfill_emails`` runs existing emails through Gemini again:
+
+- Emails are read in keyset order (``id > last_id ORDER BY id``) in chunks,
+  so no query or transaction spans more than one chunk and the walk stays
+  cheap however deep into the table it gets.
+- Within a chunk, emails with identical subject and body are sent once, and
+  results are cached under a hash of the full prompt for
+  BACKFILL_CACHE_TIMEOUT. Newsletters sent to many users cost one call, and a
+  rerun with an unchanged prompt costs none.
+- Gemini calls run with bounded concurrency. A failed call, or an answer
+  that isn't valid JSON, leaves its email untouched and counts it as failed;
+  it never writes the placeholders the webhook falls back to.
+- Changed rows are written with one ``bulk_update`` per chunk, in the same
+  short transaction as the checkpoint (BackfillCheckpoint). An interrupted
+  run resumes after the last completed chunk.
+- ``--dry-run`` writes nothing and reports what would change (a CSV diff and
+  category transition counts) instead.
+
+bulk_update skips model signals, so the response cache of every affected user
+is invalidated explicitly.
+"""
+import asyncio
+import collections
+import csv
+import hashlib
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from . import duplicates, events, response_cache, threads, timeseries
+from .logs import log_event
+from .models import BackfillCheckpoint, Email, StoryMailUser
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("category", "summary")
+
+
+class CheckpointMismatch(Exception):
+    pass
+
+
+def _cache_key(subject, body):
+    from .views import build_category_prompt
+
+    prompt = build_category_prompt(subject, body)
+    return "llm-category:" + hashlib.sha256(prompt.encode()).hexdigest()
+
+
+def load_checkpoint(name, options, restart=False):
+    checkpoint, created = BackfillCheckpoint.objects.get_or_create(name=name, defaults={"options": options})
+    if restart and not created:
+        checkpoint.delete()
+        checkpoint = BackfillCheckpoint.objects.create(name=name, options=options)
+    elif checkpoint.options != options:
+        raise CheckpointMismatch(
+            f"Backfill {name!r} was started with {checkpoint.options}; "
+            f"rerun with the same options, --restart, or another --name"
+        )
+    return checkpoint
+
+
+class Backfill:
+    def __init__(self, queryset, checkpoint, fields=FIELDS, chunk_size=500, concurrency=8,
+                 dry_run=False, report=None, limit=None, pause=0.0, log=print):
+        self.queryset = queryset
+        self.checkpoint = checkpoint
+        self.fields = list(fields)
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.dry_run = dry_run
+        self.report = report
+        self.limit = limit
+        self.pause = pause
+        self.log = log
+        self.transitions = collections.Counter()
+        self.llm_calls = 0
+        self.cache_hits = 0
+
+    def _fetch(self, after_id, count):
+        return list(
+            self.queryset.filter(id__gt=after_id)
+            .order_by("id")
+            .only("id", "user_id", "thread_id", "duplicate_cluster_id", "subject", "text_body", "category", "summary",
+                  "category_source")[:count]
+        )
+
+    async def _categorize(self, emails):
+        """(subject, body) -> (category, summary), or the exception the call raised"""
+        from .views import acall_gemini_category
+
+        contents = {(email.subject or "", email.text_body or "") for email in emails}
+        keys = {content: _cache_key(*content) for content in contents}
+        cached = await cache.aget_many(list(keys.values()))
+        results = {content: tuple(cached[key]) for content, key in keys.items() if key in cached}
+        self.cache_hits += len(results)
+
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def call(content):
+            async with slots:
+                try:
+                    results[content] = await acall_gemini_category(*content, strict=True)
+                except Exception as exc:
+                    results[content] = exc
+
+        missing = [content for content in contents if content not in results]
+        self.llm_calls += len(missing)
+        await asyncio.gather(*(call(content) for content in missing))
+        fresh = {keys[c]: results[c] for c in missing if not isinstance(results[c], Exception)}
+        if fresh:
+            await cache.aset_many(fresh, settings.BACKFILL_CACHE_TIMEOUT)
+        return results
+
+    def _apply(self, emails, results, writer):
+        """Set new values on changed emails; returns (changed emails, failed count)"""
+        changed, failed = [], 0
+        for email in emails:
+            result = results[(email.subject or "", email.text_body or "")]
+            if isinstance(result, Exception):
+                failed += 1
+                log_event(logger, "backfill_email_failed", level=logging.WARNING, email_id=email.id, error=str(result))
+                continue
+            new = dict(zip(FIELDS, result))
+            diff = {field: (getattr(email, field), new[field]) for field in self.fields if getattr(email, field) != new[field]}
+            if "category" in self.fields:
+                self.transitions[(email.category, new["category"])] += 1
+            if not diff:
+                continue
+            for field, (old, value) in diff.items():
+                setattr(email, field, value)
+                if writer:
+                    writer.writerow([email.id, email.user_id, field, old, value])
+            if "category" in diff:
+                email.category_source = "llm"
+                email.category_confidence = None
+            changed.append(email)
+        return changed, failed
+
+    def _save(self, changed, emails, failed):
+        checkpoint = self.checkpoint
+        checkpoint.last_id = emails[-1].id
+        checkpoint.processed += len(emails)
+        checkpoint.changed += len(changed)
+        checkpoint.failed += failed
+        if self.dry_run:
+            return
+        update_fields = list(self.fields)
+        if "category" in update_fields:
+            update_fields += ["category_source", "category_confidence"]
+        with transaction.atomic():
+            if changed:
+                Email.objects.bulk_update(changed, update_fields)
+            checkpoint.save()
+        per_user = collections.Counter(email.user_id for email in changed)
+        for auth0_id in StoryMailUser.objects.filter(id__in=per_user).values_list("auth0_id", flat=True):
+            response_cache.bump_generation(auth0_id)
+        # One event per user and chunk rather than one per email
+        for user_id, count in per_user.items():
+            events.publish(user_id, events.emails_recategorized(count))
+        # bulk_update skips the signal that keeps settled volume buckets current
+        timeseries.bump_history(per_user)
+        if "summary" in self.fields:
+            for thread_id in {email.thread_id for email in changed if email.thread_id}:
+                threads.refresh_summary(thread_id)
+        # Near-duplicates arriving later copy the new labels
+        duplicates.relabel(changed)
+
+    async def run(self):
+        report = open(self.report, "w", newline="") if self.report else None
+        writer = csv.writer(report) if report else None
+        if writer:
+            writer.writerow(["email_id", "user_id", "field", "old", "new"])
+        checkpoint = self.checkpoint
+        done = 0
+        try:
+            while self.limit is None or done < self.limit:
+                count = self.chunk_size
+                if self.limit is not None:
+                    count = min(count, self.limit - done)
+                emails = await sync_to_async(self._fetch)(checkpoint.last_id, count)
+                if not emails:
+                    if not self.dry_run:
+                        checkpoint.finished_at = timezone.now()
+                        await checkpoint.asave(update_fields=["finished_at", "updated_at"])
+                    break
+                results = await self._categorize(emails)
+                changed, failed = self._apply(emails, results, writer)
+                await sync_to_async(self._save)(changed, emails, failed)
+                done += len(emails)
+                self.log(
+                    f"Up to id {checkpoint.last_id}: {checkpoint.processed} processed, "
+                    f"{checkpoint.changed} {'would change' if self.dry_run else 'changed'}, {checkpoint.failed} failed"
+                )
+                if self.pause:
+                    await asyncio.sleep(self.pause)
+        finally:
+            if report:
+                report.close()
+        return checkpoint
@@ -0,0 +1,320 @@
+"""
+Local fast-path email classifier.
+
+Runs before Gemini on every inbound email and labels the obvious ones
+locally so that only uncertain emails pay for an LLM call. Three stages,
+most specific first (the user's own labels outrank generic header rules,
+even though the rules alone need no query):
+
+1. Sender history - the user's own past labels for this sender (one
+   indexed query).
+2. Header rules - List-Unsubscribe / List-Id / Precedence headers and known
+   bulk-mail sender domains.
+3. A hashed n-gram logistic regression trained on LLM-labeled ``Email`` rows
+   (see ``manage.py train_classifier``).
+
+Each stage either returns a confident ``FastPathResult`` or defers to the
+next one. ``classify_fast`` returns ``None`` when the email should go to the LLM.
+"""
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import EMAIL_CATEGORIES
+
+logger = logging.getLogger(__name__)
+
+# Domains that only ever send bulk mail (newsletter platforms and ESPs)
+BULK_SENDER_DOMAINS = {
+    "substack.com", "beehiiv.com", "mailchimpapp.net", "mcsv.net", "mcdlv.net",
+    "sendgrid.net", "convertkit-mail.com", "convertkit-mail2.com", "ghost.io",
+    "buttondown.email", "mailerlite.com", "sendinblue.com", "brevo.com",
+    "medium.com", "e.linkedin.com", "news.google.com", "mailer.hubspot.com",
+}
+
+# Header names that mark an email as list/bulk mail
+LIST_HEADERS = {"list-unsubscribe", "list-id", "list-post"}
+BULK_PRECEDENCE = {"bulk", "list", "junk"}
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class FastPathResult:
+    category: str
+    confidence: float
+    source: str  # one of "history", "rules", "model"
+
+
+def _sender_domain(from_email):
+    if not from_email or "@" not in from_email:
+        return ""
+    return from_email.rsplit("@", 1)[1].lower().strip(" >")
+
+
+def _headers(data):
+    """Postmark sends headers as a list of {"Name": ..., "Value": ...} dicts"""
+    return {
+        (h.get("Name") or "").lower(): h.get("Value") or ""
+        for h in (data.get("Headers") or [])
+        if isinstance(h, dict)
+    }
+
+
+def classify_by_headers(data):
+    headers = _headers(data)
+    if LIST_HEADERS & headers.keys():
+        return FastPathResult("newsletters", 0.95, "rules")
+    if headers.get("precedence", "").strip().lower() in BULK_PRECEDENCE:
+        return FastPathResult("newsletters", 0.93, "rules")
+
+    domain = _sender_domain(data.get("From"))
+    if domain and any(domain == d or domain.endswith("." + d) for d in BULK_SENDER_DOMAINS):
+        return FastPathResult("newsletters", 0.97, "rules")
+    return None
+
+
+def history_result(counts):
+    """
+    counts: {category: n} of LLM labels this user's past emails from a sender got.
+    Returns a result when the sender has been labeled consistently often enough.
+    """
+    counts = {c: n for c, n in counts.items() if c}
+    if not counts:
+        return None
+
+    total = sum(counts.values())
+    category, n = max(counts.items(), key=lambda item: item[1])
+    # Laplace-smoothed so a sender with 3/3 is less certain than one with 30/30;
+    # this is also the minimum history: at CLASSIFIER_MIN_CONFIDENCE = 0.9 it
+    # takes 8 unanimous labels
+    confidence = (n + 1) / (total + 2)
+    if confidence < settings.CLASSIFIER_MIN_CONFIDENCE:
+        return None
+    return FastPathResult(category, round(confidence, 4), "history")
+
+
+def classify_by_history(user, from_email):
+    if user is None or not from_email:
+        return None
+    from .models import Email
+
+    counts = (
+        Email.objects.filter(user=user, from_email=from_email, category_source="llm")
+        .values("category")
+        .annotate(n=Count("id"))
+    )
+    return history_result({row["category"]: row["n"] for row in counts})
+
+
+def _features(subject, body, from_email):
+    text = f"{subject or ''} {subject or ''} {(body or '')[:2000]}".lower()
+    tokens = TOKEN_RE.findall(text)
+    features = set(tokens)
+    features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    domain = _sender_domain(from_email)
+    if domain:
+        features.add(f"__domain__{domain}")
+        features.add(f"__local__{from_email.split('@', 1)[0].lower()}")
+    return features
+
+
+class HashedNgramModel:
+    """
+    Multinomial logistic regression over hashed unigram/bigram features.
+
+    Weights are stored sparsely (only buckets seen in training), so the
+    model stays small and a prediction is a few hundred dict lookups.
+    ``trained_until`` is the creation time of the newest training email, so
+    evaluations can stick to emails the model has never seen.
+    """
+
+    def __init__(self, categories=None, n_buckets=2 ** 18):
+        self.categories = list(categories or EMAIL_CATEGORIES)
+        self.n_buckets = n_buckets
+        self.bias = [0.0] * len(self.categories)
+        self.weights = {}
+        self.trained_until = None
+
+    def _buckets(self, subject, body, from_email):
+        mask = self.n_buckets - 1
+        return {zlib.crc32(f.encode("utf-8")) & mask for f in _features(subject, body, from_email)}
+
+    def _scores(self, buckets):
+        scores = list(self.bias)
+        scale = 1.0 / math.sqrt(len(buckets) or 1)
+        for b in buckets:
+            w = self.weights.get(b)
+            if w is not None:
+                for k in range(len(scores)):
+                    scores[k] += w[k] * scale
+        return scores
+
+    @staticmethod
+    def _softmax(scores):
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict_proba(self, subject, body, from_email):
+        return self._softmax(self._scores(self._buckets(subject, body, from_email)))
+
+    def predict(self, subject, body, from_email):
+        probs = self.predict_proba(subject, body, from_email)
+        k = max(range(len(probs)), key=probs.__getitem__)
+        return self.categories[k], probs[k]
+
+    def fit(self, samples, epochs=5, learning_rate=0.5, l2=1e-6, seed=0):
+        """samples: list of (subject, body, from_email, category) tuples"""
+        index = {c: k for k, c in enumerate(self.categories)}
+        data = [
+            (self._buckets(subject, body, from_email), index[category])
+            for subject, body, from_email, category in samples
+            if category in index
+        ]
+        rng = random.Random(seed)
+        n_classes = len(self.categories)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            lr = learning_rate / (1 + epoch)
+            for buckets, label in data:
+                probs = self._softmax(self._scores(buckets))
+                scale = 1.0 / math.sqrt(len(buckets) or 1)
+                grads = [probs[k] - (1.0 if k == label else 0.0) for k in range(n_classes)]
+                for k in range(n_classes):
+                    self.bias[k] -= lr * grads[k]
+                for b in buckets:
+                    w = self.weights.setdefault(b, [0.0] * n_classes)
+                    for k in range(n_classes):
+                        w[k] -= lr * (grads[k] * scale + l2 * w[k])
+        return self
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "categories": self.categories,
+                "n_buckets": self.n_buckets,
+                "bias": self.bias,
+                "weights": {str(b): [round(x, 5) for x in w] for b, w in self.weights.items()},
+                "trained_until": self.trained_until.isoformat() if self.trained_until else None,
+            }, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            raw = json.load(f)
+        model = cls(raw["categories"], raw["n_buckets"])
+        model.bias = raw["bias"]
+        model.weights = {int(b): w for b, w in raw["weights"].items()}
+        if raw.get("trained_until"):
+            model.trained_until = datetime.fromisoformat(raw["trained_until"])
+        return model
+
+
+_model_lock = threading.Lock()
+_model_cache = {"mtime": None, "model": None}
+
+
+def get_model():
+    """Load the trained model from disk, reloading it when the file changes"""
+    path = settings.CLASSIFIER_MODEL_PATH
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _model_cache["mtime"] != mtime:
+        with _model_lock:
+            if _model_cache["mtime"] != mtime:
+                try:
+                    _model_cache["model"] = HashedNgramModel.load(path)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.error(f"Failed to load classifier model from {path}: {e}")
+                    _model_cache["model"] = None
+                _model_cache["mtime"] = mtime
+    return _model_cache["model"]
+
+
+def classify_by_model(subject, body, from_email, model=None):
+    model = model or get_model()
+    if model is None:
+        return None
+    category, confidence = model.predict(subject, body, from_email)
+    if confidence < settings.CLASSIFIER_MIN_CONFIDENCE:
+        return None
+    return FastPathResult(category, round(confidence, 4), "model")
+
+
+def classify_fast(user, data, model=None):
+    """
+    Try to label a Postmark inbound payload without the LLM.
+    Returns a FastPathResult, or None if the email should go to Gemini.
+    """
+    if not settings.CLASSIFIER_ENABLED:
+        return None
+    return (
+        classify_by_history(user, data.get("From"))
+        or classify_by_headers(data)
+        or classify_by_model(data.get("Subject"), data.get("TextBody"), data.get("From"), model)
+    )
+
+
+def local_summary(subject, body, max_length=200):
+    """Cheap extractive summary used when the LLM is skipped: the first sentence or two"""
+    text = " ".join((body or "").split())
+    if not text:
+        return subject or "No summary available"
+    summary = ""
+    for sentence in SENTENCE_END_RE.split(text):
+        if summary and len(summary) + len(sentence) + 1 > max_length:
+            break
+        summary = f"{summary} {sentence}".strip()
+    if len(summary) > max_length:
+        summary = summary[:max_length - 3].rstrip() + "..."
+    return summary
+
+
+def evaluate(samples, model=None):
+    """
+    Replay LLM-labeled emails through the fast path and measure how many it
+    would have labeled (coverage) and how often it agrees with the LLM label
+    (agreement).
+
+    samples: iterable of (user_id, data, llm_category) in arrival order, where
+    data is a Postmark-style dict. Sender history is rebuilt as the replay
+    goes, so each email only sees the labels that existed before it arrived.
+    """
+    model = model or get_model()
+    history = {}
+    stats = Counter()
+    for user_id, data, llm_category in samples:
+        stats["total"] += 1
+        sender_counts = history.setdefault((user_id, data.get("From")), Counter())
+        result = (
+            history_result(sender_counts)
+            or classify_by_headers(data)
+            or classify_by_model(data.get("Subject"), data.get("TextBody"), data.get("From"), model)
+        )
+        sender_counts[llm_category] += 1
+        if result is None:
+            continue
+        stats["covered"] += 1
+        stats[f"covered:{result.source}"] += 1
+        if result.category == llm_category:
+            stats["agreed"] += 1
+            stats[f"agreed:{result.source}"] += 1
+    return stats
@@ -0,0 +1,109 @@
+"""
+Response compression with Accept-Encoding negotiation.
+
+``CompressionMiddleware`` compresses successful text and JSON responses of
+at least COMPRESS_MIN_BYTES with Brotli when the client accepts ``br`` and
+the ``brotli`` package is installed, otherwise with gzip. Smaller bodies
+aren't worth the CPU, and PDFs, images and other binary types are already
+compressed. Streaming, partial (206) and already-encoded responses pass
+through untouched.
+
+Unlike Django's GZipMiddleware it runs natively in async mode, so async
+views don't pay a thread hop per response. As with GZipMiddleware, strong
+ETags are weakened on compressed responses; If-None-Match checks use weak
+comparison (mainlogic/response_cache.py).
+"""
+import gzip
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = re.compile(
+    r"^(text/|application/(json|javascript|xml|x-ndjson)|application/[\w.+-]+\+(json|xml))"
+)
+
+
+def accepted_encodings(header):
+    """Codings from an Accept-Encoding header with their q-values"""
+    encodings = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        encodings[name] = q
+    return encodings
+
+
+def choose_encoding(header):
+    encodings = accepted_encodings(header or "")
+    wildcard = encodings.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = max(candidates, key=lambda name: encodings.get(name, wildcard), default=None)
+    return best if encodings.get(best, wildcard) > 0 else None
+
+
+def compress_response(request, response):
+    if (
+        response.streaming
+        or response.status_code != 200
+        or response.has_header("Content-Encoding")
+        or not COMPRESSIBLE_TYPES.match(response.get("Content-Type", ""))
+    ):
+        return response
+
+    patch_vary_headers(response, ("Accept-Encoding",))
+    content = response.content
+    if len(content) < settings.COMPRESS_MIN_BYTES:
+        return response
+    encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+    if encoding is None:
+        return response
+
+    if encoding == "br":
+        compressed = brotli.compress(content, quality=settings.BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(content, compresslevel=settings.GZIP_LEVEL, mtime=0)
+    if len(compressed) >= len(content):
+        return response
+
+    response.content = compressed
+    response["Content-Length"] = str(len(compressed))
+    response["Content-Encoding"] = encoding
+    etag = response.get("ETag")
+    if etag and etag.startswith('"'):
+        response["ETag"] = "W/" + etag
+    return response
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return compress_response(request, await self.get_response(request))
@@ -0,0 +1,151 @@
+"""
+Read-replica routing.
+
+Reads only go to a replica inside views marked with ``@replica_reads`` (the
+dashboard, stats, email list and chat endpoints); everything else, and every
+write, uses the primary. Within a marked view a replica is skipped when:
+
+- the requesting user wrote something in the last READ_YOUR_WRITES_SECONDS
+  (new email ingested, digest created, profile updated), so they always see
+  their own writes
+- the view itself has already written during this request
+- the replica is lagging more than REPLICA_MAX_LAG_SECONDS behind the
+  primary, or can't be reached
+
+Replicas are configured with DB_REPLICA_HOSTS (see settings). The write pin
+lives in the Django cache, and a pin set by one process must be seen by all
+of them, so replicas are only read from when CACHE_SHARED is set.
+
+To try it locally, run a second Postgres as a streaming replica of the first:
+
+    pg_basebackup -h localhost -p 5432 -D /tmp/replica -R -X stream
+    pg_ctl -D /tmp/replica -o "-p 5433" start
+    DB_REPLICA_HOSTS=localhost:5433 python manage.py runserver
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_replica_reads = contextvars.ContextVar("replica_reads", default=False)
+
+# alias -> (monotonic time checked, lag in seconds)
+_lag_cache = {}
+_lag_lock = threading.Lock()
+
+LAG_QUERY = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith("replica_")]
+
+
+def _pin_key(auth0_id):
+    return f"rw-pin:{auth0_id}"
+
+
+def pin_to_primary(auth0_id):
+    """Send this user's reads to the primary for the next few seconds"""
+    if auth0_id and replica_aliases():
+        cache.set(_pin_key(auth0_id), True, settings.READ_YOUR_WRITES_SECONDS)
+
+
+def replica_lag(alias):
+    """Replication lag of a replica in seconds (inf if it can't be checked), cached briefly"""
+    now = time.monotonic()
+    checked = _lag_cache.get(alias)
+    if checked and now - checked[0] < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return checked[1]
+
+    with _lag_lock:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(LAG_QUERY)
+                lag = float(cursor.fetchone()[0] or 0)
+        except Exception as e:
+            logger.warning(f"Replica {alias} lag check failed: {e}")
+            lag = float("inf")
+        _lag_cache[alias] = (now, lag)
+    return lag
+
+
+def _can_use_replica(request):
+    if not replica_aliases() or not settings.CACHE_SHARED:
+        return False
+    user = getattr(request, "user", None)
+    auth0_id = user.get("sub") if user is not None and hasattr(user, "get") else None
+    return not (auth0_id and cache.get(_pin_key(auth0_id)))
+
+
+def replica_reads(view_method):
+    """
+    Mark a view handler as read-only so its queries may be served by a replica.
+    Works on both sync (DRF) and async view methods.
+    """
+    if asyncio.iscoroutinefunction(view_method):
+        @functools.wraps(view_method)
+        async def async_wrapper(self, request, *args, **kwargs):
+            token = _replica_reads.set(_can_use_replica(request))
+            try:
+                return await view_method(self, request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+        return async_wrapper
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        token = _replica_reads.set(_can_use_replica(request))
+        try:
+            return view_method(self, request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get():
+            return None
+        healthy = [
+            alias for alias in replica_aliases()
+            if replica_lag(alias) <= settings.REPLICA_MAX_LAG_SECONDS
+        ]
+        return random.choice(healthy) if healthy else None
+
+    def db_for_write(self, model, **hints):
+        # Anything read after a write in the same request must see it
+        _replica_reads.set(False)
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+@receiver(post_save, dispatch_uid="replica_pin_on_save")
+@receiver(post_delete, dispatch_uid="replica_pin_on_delete")
+def pin_owner_after_write(sender, instance, **kwargs):
+    from .models import DigestReport, Email, StoryMailUser, owner_auth0_id
+
+    if sender not in (StoryMailUser, Email, DigestReport) or not replica_aliases():
+        return
+    pin_to_primary(owner_auth0_id(instance))
@@ -0,0 +1,122 @@
+"""
+PDF rendering of digest reports (ReportLab).
+"""
+import io
+import logging
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def render_digest_pdf(digest, digest_data):
+    """Generate a PDF report for the digest"""
+    with metrics.PDF_RENDER_SECONDS.time():
+        return _render(digest, digest_data)
+
+
+def _render(digest, digest_data):
+    try:
+        from reportlab.lib.pagesizes import letter
+        from reportlab.lib import colors
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.graphics.shapes import Drawing
+        from reportlab.graphics.charts.piecharts import Pie
+        
+        buffer = io.BytesIO()
+        
+        # Create the PDF object
+        doc = SimpleDocTemplate(buffer, pagesize=letter)
+        elements = []
+        
+        # Get styles
+        styles = getSampleStyleSheet()
+        title_style = styles['Heading1']
+        heading2_style = styles['Heading2']
+        normal_style = styles['Normal']
+        
+        # Add title
+        elements.append(Paragraph(f"Email Digest: {digest.start_date} to {digest.end_date}", title_style))
+        elements.append(Spacer(1, 12))
+        
+        # Add narrative summary
+        elements.append(Paragraph("Weekly Summary", heading2_style))
+        elements.append(Paragraph(digest_data.get("narrative_summary", "No summary available"), normal_style))
+        elements.append(Spacer(1, 12))
+        
+        # Create a pie chart for category distribution
+        if "category_counts" in digest_data and digest_data["category_counts"]:
+            elements.append(Paragraph("Email Categories", heading2_style))
+            
+            # Create drawing for pie chart
+            drawing = Drawing(400, 200)
+            category_data = digest_data["category_counts"]
+            
+            # Filter out categories with zero counts
+            category_data = {k: v for k, v in category_data.items() if v > 0}
+            
+            if category_data:
+                # Create the pie chart
+                pie = Pie()
+                pie.x = 150
+                pie.y = 50
+                pie.width = 150
+                pie.height = 150
+                pie.data = list(category_data.values())
+                pie.labels = list(category_data.keys())
+                pie.slices.strokeWidth = 0.5
+                
+                # Add some colors
+                colors_list = [colors.blue, colors.green, colors.red, colors.orange, colors.purple]
+                for i in range(len(category_data)):
+                    pie.slices[i].fillColor = colors_list[i % len(colors_list)]
+                
+                drawing.add(pie)
+                elements.append(drawing)
+                elements.append(Spacer(1, 12))
+                
+                # Add a table with the category counts
+                data = [["Category", "Count"]]
+                for category, count in category_data.items():
+                    data.append([category.capitalize(), str(count)])
+                
+                table = Table(data, colWidths=[300, 100])
+                table.setStyle(TableStyle([
+                    ('BACKGROUND', (0, 0), (1, 0), colors.grey),
+                    ('TEXTCOLOR', (0, 0), (1, 0), colors.whitesmoke),
+                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ]))
+                
+                elements.append(table)
+                elements.append(Spacer(1, 24))
+        
+        # Add highlights
+        if "highlights" in digest_data and digest_data["highlights"]:
+            elements.append(Paragraph("Email Highlights", heading2_style))
+            for highlight in digest_data["highlights"]:
+                elements.append(Paragraph(f"• {highlight}", normal_style))
+            elements.append(Spacer(1, 12))
+        
+        # Add clusters
+        if "clusters" in digest_data and digest_data["clusters"]:
+            elements.append(Paragraph("Email Clusters", heading2_style))
+            for cluster_name, items in digest_data["clusters"].items():
+                elements.append(Paragraph(cluster_name, styles["Heading3"]))
+                for item in items:
+                    elements.append(Paragraph(f"• {item}", normal_style))
+                elements.append(Spacer(1, 6))
+        
+        # Build the PDF
+        doc.build(elements)
+        
+        # Get the PDF content
+        buffer.seek(0)
+        return buffer.getvalue()
+    
+    except Exception as e:
+        logger.exception(f"[render_digest_pdf] Error generating PDF: {e}")
+        return None
@@ -0,0 +1,213 @@
+"""
+Near-duplicate detection at ingest with MinHash signatures and an LSH index.
+
+Automated senders produce floods of near-identical emails (alerts, receipts,
+newsletter editions). The webhook computes a MinHash signature over each
+email's word 3-shingles, with digits folded so that order numbers and times
+don't count as differences, and looks it up in the user's LSH index:
+
+- The NUM_HASHES 32-bit minimums are cut into BANDS bands of ROWS values,
+  and each band is hashed to one DuplicateBucket key. Two emails with
+  Jaccard similarity s share a key with probability 1 - (1 - s^ROWS)^BANDS:
+  99% of the time at s = 0.7, 12% of the time at s = 0.3.
+- A lookup is one query on the (user, key) index for the email's BANDS keys.
+  At most MAX_CANDIDATES clusters found there, most shared bands first, are
+  compared on their signatures' estimated similarity, so the cost doesn't
+  grow with the mailbox.
+- An email at least DUPLICATE_THRESHOLD similar to a cluster joins it;
+  otherwise it starts a cluster and its bands are indexed.
+
+A cluster keeps the labels of its first labeled member. Later members take
+its category and summary (category_source "duplicate") without the
+fast-path classifier or Gemini; with LLM_QUEUE_ENABLED, members waiting in
+the queue are labeled along with the first of them, the only one the
+worker picks up.
+Chat and digest prompts use ``collapse`` to send a cluster as one entry.
+
+Two copies arriving at the same moment may both start a cluster; each is
+still a valid cluster for the copies after them.
+"""
+import hashlib
+import re
+import struct
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from . import events, response_cache, threads, timeseries
+from .models import DuplicateBucket, DuplicateCluster, Email, StoryMailUser
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+SHINGLE_WORDS = 3
+# Fewer distinct shingles than this ("Thanks!") say too little to compare
+MIN_SHINGLES = 8
+# Only the start of long bodies is hashed
+MAX_CHARS = 8000
+MAX_CANDIDATES = 20
+
+# Written by the webhook when the inline Gemini call fails; never copied
+ERROR_SUMMARY = "Error generating summary"
+
+_PACKING = struct.Struct(f"<{NUM_HASHES}I")
+_MASK = (1 << 64) - 1
+# Fixed, so signatures stay comparable across processes and releases
+_SEEDS = [
+    (int.from_bytes(hashlib.blake2b(b"a%d" % i, digest_size=8).digest(), "big") | 1,
+     int.from_bytes(hashlib.blake2b(b"b%d" % i, digest_size=8).digest(), "big"))
+    for i in range(NUM_HASHES)
+]
+
+_TOKEN_RE = re.compile(r"[^\W\d_]+|\d+")
+_HTML_SKIP_RE = re.compile(r"<(style|script)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_HTML_TAG_RE = re.compile(r"<[^>]*>")
+
+
+def _tokens(subject, body, html_body=None):
+    if not body and html_body:
+        body = _HTML_TAG_RE.sub(" ", _HTML_SKIP_RE.sub(" ", html_body[:4 * MAX_CHARS]))
+    text = f"{subject or ''}\n{(body or '')[:MAX_CHARS]}".lower()
+    return ["0" if token.isdigit() else token for token in _TOKEN_RE.findall(text)]
+
+
+def signature(subject, body, html_body=None):
+    """Packed MinHash signature of an email's text, or None if it is too short to compare"""
+    tokens = _tokens(subject, body, html_body)
+    shingles = {" ".join(tokens[i:i + SHINGLE_WORDS]) for i in range(len(tokens) - SHINGLE_WORDS + 1)}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles]
+    # One multiply-shift hash per permutation, keeping the top 32 bits
+    return _PACKING.pack(*(min([((a * x + b) & _MASK) >> 32 for x in hashes]) for a, b in _SEEDS))
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(x == y for x, y in zip(_PACKING.unpack(bytes(a)), _PACKING.unpack(bytes(b)))) / NUM_HASHES
+
+
+def band_keys(sig):
+    sig = bytes(sig)
+    width = 4 * ROWS
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([band]) + sig[band * width:(band + 1) * width], digest_size=8).digest(),
+                       "big", signed=True)
+        for band in range(BANDS)
+    ]
+
+
+def find_cluster(user, sig):
+    """(most similar cluster, similarity) at or above DUPLICATE_THRESHOLD, or (None, None)"""
+    keys = band_keys(sig)
+    candidates = list(
+        DuplicateBucket.objects.filter(user=user, key__in=keys)
+        .values("cluster_id").annotate(shared=Count("id")).order_by("-shared")
+        .values_list("cluster_id", flat=True)[:MAX_CANDIDATES]
+    )
+    best, best_similarity = None, None
+    for cluster in DuplicateCluster.objects.filter(id__in=candidates):
+        score = similarity(cluster.signature, sig)
+        if score >= settings.DUPLICATE_THRESHOLD and (best is None or score > best_similarity):
+            best, best_similarity = cluster, score
+    return best, best_similarity
+
+
+def join(user, sig, cluster, date, subject):
+    """
+    Count a new email in `cluster` (a find_cluster match), or start an
+    indexed cluster for it if None. Meant to run in the transaction that
+    inserts the email, so a failed insert leaves no trace.
+    """
+    if cluster is not None:
+        DuplicateCluster.objects.filter(pk=cluster.pk).update(
+            size=F("size") + 1, last_date=Greatest("last_date", date)
+        )
+        return cluster
+    with transaction.atomic():
+        cluster = DuplicateCluster.objects.create(user=user, signature=sig, subject=(subject or "")[:256],
+                                                  last_date=date)
+        DuplicateBucket.objects.bulk_create(
+            [DuplicateBucket(user=user, key=key, cluster=cluster) for key in set(band_keys(sig))]
+        )
+    return cluster
+
+
+def record_labels(cluster_id, email):
+    """Give an unlabeled cluster the labels of its member `email`, unless those are pending or an error"""
+    if not cluster_id or email.category_source == "pending" or not email.category or email.summary == ERROR_SUMMARY:
+        return False
+    return bool(
+        DuplicateCluster.objects.filter(pk=cluster_id, category__isnull=True)
+        .update(category=email.category, summary=email.summary)
+    )
+
+
+def relabel(emails):
+    """Let clusters follow their recategorized members (backfill_emails)"""
+    latest = {email.duplicate_cluster_id: email for email in emails if email.duplicate_cluster_id}
+    for cluster_id, email in latest.items():
+        if email.summary != ERROR_SUMMARY:
+            DuplicateCluster.objects.filter(pk=cluster_id).update(category=email.category, summary=email.summary)
+
+
+def label_pending(email):
+    """
+    After the LLM labeled `email`, label its cluster and the cluster's
+    members still waiting in the queue the same way; returns how many were
+    """
+    record_labels(email.duplicate_cluster_id, email)
+    cluster = DuplicateCluster.objects.filter(pk=email.duplicate_cluster_id).only("category", "summary").first()
+    if cluster is None or not cluster.category:
+        return 0
+    members = Email.objects.filter(user_id=email.user_id, category_source="pending",
+                                   duplicate_cluster_id=cluster.id)
+    thread_ids = set(members.exclude(thread__isnull=True).values_list("thread_id", flat=True))
+    count = members.update(category=cluster.category, summary=cluster.summary, category_source="duplicate",
+                           category_confidence=None)
+    if count:
+        # A bulk update skips the signals that keep these current
+        auth0_id = StoryMailUser.objects.filter(pk=email.user_id).values_list("auth0_id", flat=True).first()
+        if auth0_id:
+            response_cache.bump_generation(auth0_id)
+        timeseries.bump_history([email.user_id])
+        events.publish(email.user_id, events.emails_recategorized(count))
+        for thread_id in thread_ids:
+            threads.refresh_summary(thread_id)
+    return count
+
+
+def prune(user_id, before):
+    """Drop the user's clusters whose newest member is dated before `before` (retention)"""
+    ids = list(DuplicateCluster.objects.filter(user_id=user_id, last_date__lt=before).values_list("id", flat=True))
+    if ids:
+        DuplicateBucket.objects.filter(cluster_id__in=ids)._raw_delete(DuplicateBucket.objects.db)
+        DuplicateCluster.objects.filter(id__in=ids)._raw_delete(DuplicateCluster.objects.db)
+
+
+def collapse(entries):
+    """
+    `entries` (newest first; emails, or the pairs of ``threads.collapse``)
+    with the emails of each cluster that occurs more than once replaced by
+    one (cluster, emails) pair at its newest email
+    """
+    counts = {}
+    for entry in entries:
+        if isinstance(entry, Email) and entry.duplicate_cluster_id:
+            counts[entry.duplicate_cluster_id] = counts.get(entry.duplicate_cluster_id, 0) + 1
+    clusters = DuplicateCluster.objects.only("id", "subject", "summary", "size").in_bulk(
+        [cluster_id for cluster_id, count in counts.items() if count > 1]
+    )
+    collapsed, seen = [], {}
+    for entry in entries:
+        cluster = clusters.get(entry.duplicate_cluster_id) if isinstance(entry, Email) else None
+        if cluster is None:
+            collapsed.append(entry)
+        elif cluster.id in seen:
+            seen[cluster.id].append(entry)
+        else:
+            seen[cluster.id] = [entry]
+            collapsed.append((cluster, seen[cluster.id]))
+    return collapsed
@@ -0,0 +1,213 @@
+"""
+Per-user email events pushed to open dashboards (GET /api/events/, SSE).
+
+Ingestion and categorization call ``publish(user_id, event)`` with a small
+dict such as ``{"type": "email.added", "id": 7, "category": "work"}``. The
+configured backend (EVENTS_BACKEND) carries it to every web process, where
+the broker hands it to that user's open streams:
+
+- ``local``: in-process only; fine for a single process, but events from
+  the llm_worker or backfill processes never reach the web tier.
+- ``postgres``: ``pg_notify`` on the EVENTS_CHANNEL channel. Each web process
+  LISTENs on its own connection once it has a subscriber. A NOTIFY sent
+  inside a transaction is only delivered if and when it commits.
+
+Events are hints, not data: clients fetch what changed through the delta
+sync endpoint (mainlogic/sync.py). So when a stream falls behind (queue full,
+listener reconnecting) its backlog is dropped and it gets a single
+``{"type": "resync"}`` instead.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import threading
+
+import psycopg
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+from .logs import log_event
+
+logger = logging.getLogger(__name__)
+
+RESYNC = {"type": "resync"}
+
+# NOTIFY payloads must stay under 8000 bytes
+MAX_SUBJECT_CHARS = 120
+
+
+class Subscription:
+    """One open stream: a bounded queue filled from any thread, read on its event loop"""
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+
+    def _put(self, event):
+        if self.queue.full():
+            # Too far behind to be worth replaying; one resync replaces the backlog
+            metrics.EVENTS_DROPPED.inc(self.queue.qsize())
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = RESYNC
+        self.queue.put_nowait(event)
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    async def get(self, timeout):
+        """The next event, or None if none arrives within `timeout` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broker:
+    """Open streams of this process by user id"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def stream_count(self):
+        return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def add(self, subscription):
+        with self._lock:
+            self._subscribers.setdefault(subscription.user_id, set()).add(subscription)
+
+    def remove(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+
+    def dispatch(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def dispatch_all(self, event):
+        with self._lock:
+            subscriptions = [s for subscriptions in self._subscribers.values() for s in subscriptions]
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+
+broker = Broker()
+metrics.EVENT_STREAMS.labels().set_function(lambda: broker.stream_count)
+
+
+class LocalBackend:
+    def publish(self, user_id, event):
+        broker.dispatch(user_id, event)
+
+    def start(self):
+        pass
+
+
+class PostgresBackend:
+    """Cross-process delivery through LISTEN/NOTIFY on the default database"""
+
+    def __init__(self):
+        self._listener = None
+
+    def publish(self, user_id, event):
+        payload = json.dumps({"user": user_id, "event": event}, separators=(",", ":"))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [settings.EVENTS_CHANNEL, payload])
+
+    def start(self):
+        """Start this process's listener on the running event loop, once"""
+        loop = asyncio.get_running_loop()
+        if self._listener is None or self._listener.done() or self._listener.get_loop() is not loop:
+            self._listener = loop.create_task(self._listen())
+
+    @staticmethod
+    def _conninfo():
+        database = settings.DATABASES["default"]
+        return psycopg.conninfo.make_conninfo(
+            dbname=database["NAME"], user=database["USER"], password=database["PASSWORD"],
+            host=database["HOST"], port=database["PORT"],
+        )
+
+    async def _listen(self):
+        delay = 1
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self._conninfo(), autocommit=True) as conn:
+                    await conn.execute(f'LISTEN "{settings.EVENTS_CHANNEL}"')
+                    delay = 1
+                    # Anything sent while we weren't listening is lost
+                    broker.dispatch_all(RESYNC)
+                    async for notify in conn.notifies():
+                        try:
+                            message = json.loads(notify.payload)
+                            broker.dispatch(message["user"], message["event"])
+                        except (ValueError, KeyError, TypeError):
+                            logger.warning(f"Ignoring malformed event notification: {notify.payload[:200]}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_event(logger, "events_listener_error", level=logging.WARNING, error=str(e), retry_in=delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+BACKENDS = {"local": LocalBackend, "postgres": PostgresBackend}
+backend = BACKENDS[settings.EVENTS_BACKEND]()
+
+
+def publish(user_id, event):
+    """Send `event` to the user's open streams in every process; never raises"""
+    if not settings.EVENTS_ENABLED:
+        return
+    try:
+        backend.publish(user_id, event)
+        metrics.EVENTS_PUBLISHED.labels(type=event["type"]).inc()
+    except Exception as e:
+        log_event(logger, "events_publish_error", level=logging.WARNING, error=str(e), event_type=event.get("type"))
+
+
+async def apublish(user_id, event):
+    await sync_to_async(publish)(user_id, event)
+
+
+def email_added(email):
+    return {
+        "type": "email.added",
+        "id": email.id,
+        "subject": (email.subject or "")[:MAX_SUBJECT_CHARS],
+        "from": email.from_name or email.from_email,
+        "category": email.category,
+        "pending": email.category_source == "pending",
+    }
+
+
+def email_categorized(email):
+    return {"type": "email.categorized", "id": email.id, "category": email.category}
+
+
+def emails_recategorized(count):
+    return {"type": "emails.recategorized", "count": count}
+
+
+@contextlib.asynccontextmanager
+async def subscribe(user_id):
+    """Receive the user's events for the duration of the block"""
+    backend.start()
+    subscription = Subscription(user_id, asyncio.get_running_loop())
+    broker.add(subscription)
+    try:
+        yield subscription
+    finally:
+        broker.remove(subscription)
@@ -0,0 +1,200 @@
+"""
+Streaming mailbox export as NDJSON, CSV or mbox (GET /api/export/ and
+``manage.py export_emails``).
+
+Rows are read with a server-side cursor (``iterator(chunk_size=EXPORT_CHUNK_SIZE)``)
+in date order along the (user, date) index, so Postgres never sorts or
+materializes the mailbox. Each row is serialized and dropped right away, and
+the output is handed on in pieces of about EXPORT_BUFFER_BYTES, optionally
+gzipped on the fly. Memory therefore depends on the largest single email,
+never on the mailbox size.
+
+- ``ndjson``: one JSON object per email, attachments as metadata.
+- ``csv``: the same columns, attachment file names joined with "; ".
+- ``mbox``: one RFC 5322 message per email (mboxrd "From " quoting), with
+  attachments read back from the blob store.
+
+Under ASGI a StreamingHttpResponse with a plain iterator is read into memory
+in full before anything is sent, so the view wraps the generator with
+``aiter_chunks``.
+"""
+import base64
+import csv
+import io
+import logging
+import time
+import zlib
+from email import charset
+from email.generator import BytesGenerator
+from email.header import Header
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import format_datetime, formataddr
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+
+from . import blobstore
+from .models import Email
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("id", "date", "from_email", "from_name", "to_email", "subject",
+          "category", "summary", "text_body", "html_body")
+ATTACHMENT_FIELDS = ("Name", "ContentType", "ContentLength", "ContentSize", "ContentID", "ContentSHA256")
+
+# Bodies stay readable in the mbox, unlike with the default base64
+UTF8_QP = charset.Charset("utf-8")
+UTF8_QP.body_encoding = charset.QP
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "mbox": ("application/mbox", "mbox"),
+}
+
+
+def export_queryset(user):
+    return (
+        Email.objects.filter(user=user)
+        .order_by("date", "id")
+        .only(*FIELDS)
+        # Only the attachment list of the stored payload, not the whole payload
+        .annotate(attachments=F("raw_json__Attachments"))
+    )
+
+
+def _attachments(email):
+    return [
+        {field: attachment[field] for field in ATTACHMENT_FIELDS if field in attachment}
+        for attachment in (email.attachments if isinstance(email.attachments, list) else [])
+        if isinstance(attachment, dict)
+    ]
+
+
+def _ndjson(emails):
+    for email in emails:
+        row = {field: getattr(email, field) for field in FIELDS}
+        row["attachments"] = _attachments(email)
+        yield orjson.dumps(row) + b"\n"
+
+
+def _csv(emails):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS + ("attachments",))
+    for email in emails:
+        row = [getattr(email, field) for field in FIELDS]
+        row[FIELDS.index("date")] = email.date.isoformat()
+        row.append("; ".join(attachment.get("Name") or "" for attachment in _attachments(email)))
+        writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _header(value):
+    """A header value on one line, RFC 2047-encoded if it isn't ASCII"""
+    value = " ".join(str(value).split()) if value else None
+    if value and not value.isascii():
+        return Header(value, "utf-8").encode()
+    return value
+
+
+def _attachment_content(attachment):
+    key = attachment.get("ContentSHA256")
+    if key:
+        if not blobstore.exists(key):
+            return None
+        with blobstore.open_blob(key) as f:
+            return f.read()
+    # Stored before attachments moved to the blob store
+    content = attachment.get("Content")
+    return base64.b64decode(content) if content else None
+
+
+def _mbox_message(row):
+    # The compat32 MIME classes: the modern EmailMessage API spends several
+    # times longer parsing and refolding headers
+    message = MIMEText(row.text_body or "", "plain", UTF8_QP)
+    if row.html_body:
+        message = MIMEMultipart("alternative", _subparts=[message, MIMEText(row.html_body, "html", UTF8_QP)])
+    attachments = []
+    for attachment in row.attachments if isinstance(row.attachments, list) else []:
+        content = _attachment_content(attachment) if isinstance(attachment, dict) else None
+        if content is None:
+            continue
+        part = MIMEApplication(content)
+        part.replace_header("Content-Type", attachment.get("ContentType") or "application/octet-stream")
+        if attachment.get("Name"):
+            part.add_header("Content-Disposition", "attachment", filename=("utf-8", "", attachment["Name"]))
+        attachments.append(part)
+    if attachments:
+        message = MIMEMultipart("mixed", _subparts=[message, *attachments])
+
+    sender = formataddr((" ".join((row.from_name or "").split()), row.from_email), charset="utf-8")
+    for name, value in (("From", sender if row.from_email else None), ("To", row.to_email),
+                        ("Subject", row.subject), ("Date", format_datetime(row.date)),
+                        ("Message-ID", f"<storymail-{row.id}@storymail>"),
+                        ("X-StoryMail-Category", row.category)):
+        if _header(value):
+            message[name] = _header(value)
+    message.set_unixfrom(f"From {row.from_email or 'MAILER-DAEMON'} {time.asctime(row.date.utctimetuple())}")
+    return message
+
+
+def _mbox(emails):
+    for row in emails:
+        buffer = io.BytesIO()
+        BytesGenerator(buffer, mangle_from_=True).flatten(_mbox_message(row), unixfrom=True)
+        yield buffer.getvalue() + b"\n"
+
+
+WRITERS = {"ndjson": _ndjson, "csv": _csv, "mbox": _mbox}
+
+
+def _buffered(pieces):
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= settings.EXPORT_BUFFER_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(settings.GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(queryset, fmt, gzip=False):
+    """The export of `queryset` as byte chunks of about EXPORT_BUFFER_BYTES"""
+    chunks = _buffered(WRITERS[fmt](queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)))
+    return _gzipped(chunks) if gzip else chunks
+
+
+def filename(fmt, gzip=False):
+    return f"storymail-export-{time.strftime('%Y%m%d')}.{FORMATS[fmt][1]}{'.gz' if gzip else ''}"
+
+
+async def aiter_chunks(chunks):
+    """Iterate a database-reading generator from async code, one chunk per thread hop"""
+    get = sync_to_async(next)
+    try:
+        while (chunk := await get(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # Closes the server-side cursor in the thread that owns the connection
+        await sync_to_async(chunks.close)()
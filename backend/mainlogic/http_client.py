@@ -0,0 +1,368 @@
+"""
+Shared outbound HTTP client.
+
+Every call the backend makes to Postmark, Auth0 and other HTTP upstreams goes
+through here instead of bare ``requests``/``httpx`` calls, so that:
+
+- connections are kept alive and pooled per host (one ``requests.Session``
+  per host for sync code, one ``httpx.AsyncClient`` per event loop for async
+  code, which pools per origin)
+- every call has explicit connect and read timeouts
+- failed calls are retried with jittered exponential backoff; only
+  connect-phase failures are retried for non-idempotent methods, since the
+  request never reached the upstream
+- a per-host circuit breaker fails fast while an upstream is down instead of
+  tying up workers waiting on timeouts; a request counts as one failure once
+  its retries are exhausted, not one per attempt
+- per-host latency, error and retry counts are recorded (``host_stats()``)
+
+Configuration lives in ``settings.OUTBOUND_HTTP``; per-host overrides go in
+its ``HOSTS`` dict.
+"""
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+
+# Upper bounds (seconds) of the latency histogram buckets kept per host
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+# Set to a list by the profiling middleware to record this request's outbound calls
+call_log = contextvars.ContextVar("http_call_log", default=None)
+
+
+def _log_call(method, url, status, seconds):
+    calls = call_log.get()
+    if calls is not None:
+        calls.append({"method": method, "url": url, "status": status, "ms": round(seconds * 1000, 2)})
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit breaker is open"""
+
+
+def _config(host):
+    config = dict(settings.OUTBOUND_HTTP)
+    config.update(config.pop("HOSTS", {}).get(host, {}))
+    return config
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `reset_seconds`; then lets a single trial call through (half-open) and
+    closes again if it succeeds.
+    """
+
+    def __init__(self, threshold, reset_seconds):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+    def record_retry(self):
+        """
+        A failed attempt that will be retried. It only counts toward opening
+        the circuit once the request runs out of retries (record_failure),
+        but a failed trial call reopens it at once.
+        """
+        with self.lock:
+            if self.opened_at is not None:
+                self.trial_in_flight = False
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """Give up a trial call that ended without a verdict (cancelled), so another can be made"""
+        with self.lock:
+            self.trial_in_flight = False
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, error=False):
+        with self.lock:
+            self.requests += 1
+            self.errors += error
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    self.buckets[i] += 1
+                    break
+
+    def count(self, field):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "avg_seconds": self.total_seconds / self.requests if self.requests else 0.0,
+                "max_seconds": self.max_seconds,
+                "buckets": dict(zip(LATENCY_BUCKETS, self.buckets)),
+            }
+
+
+class _Host:
+    def __init__(self, host, hostname):
+        self.host = host
+        self.config = _config(hostname)
+        self.breaker = CircuitBreaker(
+            self.config["BREAKER_FAILURE_THRESHOLD"], self.config["BREAKER_RESET_SECONDS"]
+        )
+        self.stats = HostStats()
+        self.session = requests.Session()
+        # Retries are handled in request() so they are counted and respect the breaker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.config["POOL_MAXSIZE"], max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def backoff(self, attempt):
+        base = self.config["BACKOFF_SECONDS"] * (2 ** attempt)
+        return base + random.uniform(0, base)
+
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+def _get_host(url):
+    parts = urlsplit(url)
+    state = _hosts.get(parts.netloc)
+    if state is None:
+        with _hosts_lock:
+            state = _hosts.get(parts.netloc)
+            if state is None:
+                state = _hosts[parts.netloc] = _Host(parts.netloc, parts.hostname or "")
+    return state
+
+
+def _retry_allowed(method, retry):
+    return method.upper() in IDEMPOTENT_METHODS if retry is None else retry
+
+
+def _is_connect_error(exc):
+    """True when the request provably never reached the upstream"""
+    if isinstance(exc, (requests.exceptions.ConnectTimeout, httpx.ConnectError, httpx.ConnectTimeout)):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError) and exc.args:
+        reason = exc.args[0]
+        return isinstance(reason, MaxRetryError) and isinstance(reason.reason, NewConnectionError)
+    return False
+
+
+def request(method, url, retry=None, **kwargs):
+    """
+    Sync request through the per-host pooled session. Returns a
+    requests.Response; raises CircuitOpenError or requests exceptions.
+
+    retry: force retries on (True) or off (False); by default only
+    idempotent methods are retried after the request may have been sent.
+    """
+    host = _get_host(url)
+    config = host.config
+    kwargs.setdefault("timeout", (config["CONNECT_TIMEOUT"], config["READ_TIMEOUT"]))
+    retry_sent = _retry_allowed(method, retry)
+
+    for attempt in range(config["MAX_RETRIES"] + 1):
+        if not host.breaker.allow():
+            host.stats.count("rejected")
+            raise CircuitOpenError(f"Circuit open for {host.host}")
+
+        start = time.perf_counter()
+        try:
+            response = host.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            host.stats.observe(time.perf_counter() - start, error=True)
+            _log_call(method, url, type(e).__name__, time.perf_counter() - start)
+            if attempt < config["MAX_RETRIES"] and (retry_sent or _is_connect_error(e)):
+                host.breaker.record_retry()
+                host.stats.count("retries")
+                logger.warning(f"{method} {host.host} failed ({e}), retrying")
+                time.sleep(host.backoff(attempt))
+                continue
+            host.breaker.record_failure()
+            raise
+        except BaseException:
+            # Anything else (decoding, redirects, TLS) must still settle a
+            # half-open trial, or no trial would ever be allowed again
+            host.breaker.record_failure()
+            raise
+
+        failed = response.status_code >= 500
+        host.stats.observe(time.perf_counter() - start, error=failed)
+        _log_call(method, url, response.status_code, time.perf_counter() - start)
+        if failed:
+            if attempt < config["MAX_RETRIES"] and retry_sent and response.status_code in RETRY_STATUSES:
+                host.breaker.record_retry()
+                host.stats.count("retries")
+                logger.warning(f"{method} {host.host} returned {response.status_code}, retrying")
+                # Hand the connection back to the pool instead of leaving it to GC
+                response.close()
+                time.sleep(host.backoff(attempt))
+                continue
+            host.breaker.record_failure()
+        else:
+            host.breaker.record_success()
+        return response
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+# httpx clients are bound to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        config = settings.OUTBOUND_HTTP
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config["ASYNC_MAX_CONNECTIONS"],
+                max_keepalive_connections=config["POOL_MAXSIZE"],
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def arequest(method, url, retry=None, **kwargs):
+    """
+    Async counterpart of request() for async views. Returns an httpx.Response.
+    """
+    host = _get_host(url)
+    config = host.config
+    kwargs.setdefault("timeout", httpx.Timeout(config["READ_TIMEOUT"], connect=config["CONNECT_TIMEOUT"]))
+    retry_sent = _retry_allowed(method, retry)
+    client = _async_client()
+
+    for attempt in range(config["MAX_RETRIES"] + 1):
+        if not host.breaker.allow():
+            host.stats.count("rejected")
+            raise CircuitOpenError(f"Circuit open for {host.host}")
+
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            host.stats.observe(time.perf_counter() - start, error=True)
+            _log_call(method, url, type(e).__name__, time.perf_counter() - start)
+            if attempt < config["MAX_RETRIES"] and (retry_sent or _is_connect_error(e)):
+                host.breaker.record_retry()
+                host.stats.count("retries")
+                logger.warning(f"{method} {host.host} failed ({e!r}), retrying")
+                await asyncio.sleep(host.backoff(attempt))
+                continue
+            host.breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            # Our caller gave up, not the upstream: free the trial without a verdict
+            host.breaker.release()
+            raise
+        except BaseException:
+            # Anything else (decoding, redirects, TLS) must still settle a
+            # half-open trial, or no trial would ever be allowed again
+            host.breaker.record_failure()
+            raise
+
+        failed = response.status_code >= 500
+        host.stats.observe(time.perf_counter() - start, error=failed)
+        _log_call(method, url, response.status_code, time.perf_counter() - start)
+        if failed:
+            if attempt < config["MAX_RETRIES"] and retry_sent and response.status_code in RETRY_STATUSES:
+                host.breaker.record_retry()
+                host.stats.count("retries")
+                logger.warning(f"{method} {host.host} returned {response.status_code}, retrying")
+                await response.aclose()
+                await asyncio.sleep(host.backoff(attempt))
+                continue
+            host.breaker.record_failure()
+        else:
+            host.breaker.record_success()
+        return response
+
+
+async def aget(url, **kwargs):
+    return await arequest("GET", url, **kwargs)
+
+
+async def apost(url, **kwargs):
+    return await arequest("POST", url, **kwargs)
+
+
+def host_stats():
+    """Per-host latency/error/retry counters and circuit state, keyed by host[:port]"""
+    return {
+        host: dict(state.stats.snapshot(), circuit=state.breaker.state)
+        for host, state in list(_hosts.items())
+    }
@@ -0,0 +1,247 @@
+"""
+Incremental parsing of Postmark inbound webhook payloads.
+
+Inbound payloads carry attachments inline as base64 strings
+(``Attachments[].Content``) and can be tens of megabytes. ``parse_payload``
+reads the request body in READ_SIZE pieces and builds the payload dict as
+usual, except for attachment contents: those are base64-decoded as they are
+read and written straight to the blob store (mainlogic/blobstore.py). The
+attachment entry keeps its metadata plus ``ContentSHA256`` (the blob key) and
+``ContentSize``. Memory per request stays around READ_SIZE plus the
+non-attachment fields, whatever the attachment sizes.
+
+Only attachment contents are streamed; every other string (TextBody,
+HtmlBody, ...) is stored on the row anyway, so it is built in memory.
+Malformed input raises ValueError; a body longer than ``max_bytes`` raises
+PayloadTooLarge as soon as the excess is read, whether or not the request
+declared a Content-Length.
+"""
+import base64
+import codecs
+import re
+
+from . import blobstore
+
+READ_SIZE = 64 * 1024
+MAX_DEPTH = 64
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_STRING_SPECIAL = re.compile(r'["\\]')
+_NUMBER = re.compile(r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?")
+_BASE64_WHITESPACE = re.compile(r"[ \t\r\n]+")
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_LITERALS = (("true", True), ("false", False), ("null", None))
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class _Reader:
+    """Decoded text of a byte stream, buffered READ_SIZE bytes at a time"""
+
+    def __init__(self, stream, max_bytes=None):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Append more input to the buffer; False once the stream is exhausted"""
+        while not self.eof:
+            data = self.stream.read(READ_SIZE)
+            self.eof = not data
+            self.bytes_read += len(data)
+            if self.max_bytes is not None and self.bytes_read > self.max_bytes:
+                raise PayloadTooLarge(f"Body exceeds {self.max_bytes} bytes")
+            text = self.decoder.decode(data, final=self.eof)
+            if text:
+                self.buf = self.buf[self.pos:] + text
+                self.pos = 0
+                return True
+        return False
+
+    def ensure(self, count):
+        """Try to have `count` characters buffered past pos; False if the input ends first"""
+        while len(self.buf) - self.pos < count:
+            if not self.fill():
+                return False
+        return True
+
+    def peek(self):
+        return self.buf[self.pos] if self.ensure(1) else ""
+
+    def skip_whitespace(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                return
+
+    def expect(self, char):
+        self.skip_whitespace()
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r}")
+        self.pos += 1
+
+    def string_chunks(self):
+        """Yield the contents of a JSON string in pieces; the opening quote is already consumed"""
+        while True:
+            match = _STRING_SPECIAL.search(self.buf, self.pos)
+            if match is None:
+                if self.pos < len(self.buf):
+                    yield self.buf[self.pos:]
+                    self.pos = len(self.buf)
+                if not self.fill():
+                    raise ValueError("Unterminated string")
+                continue
+            if match.start() > self.pos:
+                yield self.buf[self.pos:match.start()]
+            self.pos = match.end()
+            if match.group() == '"':
+                return
+            yield self._escape()
+
+    def _escape(self):
+        if not self.ensure(1):
+            raise ValueError("Unterminated string")
+        char = self.buf[self.pos]
+        self.pos += 1
+        if char != "u":
+            if char not in _ESCAPES:
+                raise ValueError(f"Invalid escape \\{char}")
+            return _ESCAPES[char]
+        code = self._hex4()
+        # Characters outside the BMP arrive as a \uD8xx\uDCxx surrogate pair
+        if 0xD800 <= code < 0xDC00 and self.ensure(6) and self.buf.startswith("\\u", self.pos):
+            self.pos += 2
+            low = self._hex4()
+            if 0xDC00 <= low < 0xE000:
+                return chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00))
+            return chr(code) + chr(low)
+        return chr(code)
+
+    def _hex4(self):
+        if not self.ensure(4):
+            raise ValueError("Truncated \\u escape")
+        digits = self.buf[self.pos:self.pos + 4]
+        self.pos += 4
+        try:
+            return int(digits, 16)
+        except ValueError:
+            raise ValueError(f"Invalid \\u escape {digits!r}") from None
+
+
+class _Parser:
+    def __init__(self, stream, store_attachment, max_bytes=None):
+        self.reader = _Reader(stream, max_bytes)
+        self.store_attachment = store_attachment
+
+    def parse(self):
+        value = self._value((), 0)
+        self.reader.skip_whitespace()
+        if self.reader.peek():
+            raise ValueError("Extra data after JSON document")
+        return value
+
+    @staticmethod
+    def _is_attachment_content(path):
+        return len(path) == 3 and path[0] == "Attachments" and path[2] == "Content"
+
+    def _value(self, path, depth):
+        if depth > MAX_DEPTH:
+            raise ValueError("JSON nested too deeply")
+        reader = self.reader
+        reader.skip_whitespace()
+        char = reader.peek()
+        if char == "{":
+            reader.pos += 1
+            return self._object(path, depth + 1)
+        if char == "[":
+            reader.pos += 1
+            return self._array(path, depth + 1)
+        if char == '"':
+            reader.pos += 1
+            return "".join(reader.string_chunks())
+        for word, value in _LITERALS:
+            if reader.ensure(len(word)) and reader.buf.startswith(word, reader.pos):
+                reader.pos += len(word)
+                return value
+        # Numbers are short; make sure a whole one is buffered before matching
+        reader.ensure(64)
+        match = _NUMBER.match(reader.buf, reader.pos)
+        if not match:
+            raise ValueError("Invalid JSON value")
+        reader.pos = match.end()
+        text = match.group()
+        return float(text) if any(c in text for c in ".eE") else int(text)
+
+    def _object(self, path, depth):
+        reader = self.reader
+        obj = {}
+        reader.skip_whitespace()
+        if reader.peek() == "}":
+            reader.pos += 1
+            return obj
+        while True:
+            reader.expect('"')
+            key = "".join(reader.string_chunks())
+            reader.expect(":")
+            if self._is_attachment_content(path + (key,)):
+                reader.expect('"')
+                obj.update(self.store_attachment(reader.string_chunks()))
+            else:
+                obj[key] = self._value(path + (key,), depth)
+            reader.skip_whitespace()
+            char = reader.peek()
+            reader.pos += 1
+            if char == "}":
+                return obj
+            if char != ",":
+                raise ValueError("Expected ',' or '}'")
+
+    def _array(self, path, depth):
+        reader = self.reader
+        items = []
+        reader.skip_whitespace()
+        if reader.peek() == "]":
+            reader.pos += 1
+            return items
+        while True:
+            items.append(self._value(path + (len(items),), depth))
+            reader.skip_whitespace()
+            char = reader.peek()
+            reader.pos += 1
+            if char == "]":
+                return items
+            if char != ",":
+                raise ValueError("Expected ',' or ']'")
+
+
+def _decode_base64(chunks, sizes):
+    """Decode streamed base64 text into byte chunks, adding the decoded size to sizes[0]"""
+    pending = ""
+    for chunk in chunks:
+        pending += _BASE64_WHITESPACE.sub("", chunk)
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            data = base64.b64decode(pending[:usable], validate=True)
+            sizes[0] += len(data)
+            yield data
+            pending = pending[usable:]
+    if pending:
+        raise ValueError("Attachment content is not valid base64")
+
+
+def offload_attachment(chunks):
+    """Store one attachment's base64 content in the blob store; returns the fields kept on the payload"""
+    sizes = [0]
+    key = blobstore.put_stream(_decode_base64(chunks, sizes))
+    return {"ContentSHA256": key, "ContentSize": sizes[0]}
+
+
+def parse_payload(stream, store_attachment=offload_attachment, max_bytes=None):
+    """Parse a Postmark inbound JSON body from a file-like object, offloading attachment contents"""
+    return _Parser(stream, store_attachment, max_bytes).parse()
@@ -0,0 +1,247 @@
+"""
+Background LLM categorization with per-user fairness.
+
+With LLM_QUEUE_ENABLED the Postmark webhook no longer calls Gemini inline
+for emails the fast-path classifier is unsure about: it stores them with
+``category_source="pending"`` and the ``llm_worker`` command categorizes
+them. The pending rows are the queue, so nothing is lost when the worker
+restarts. A failed Gemini call leaves its email pending; it is retried after
+LLM_WORKER_RETRY_DELAY seconds, doubling with every further failure up to
+LLM_WORKER_RETRY_MAX_DELAY.
+
+The worker keeps a short in-memory queue per user (at most
+LLM_WORKER_PREFETCH emails, topped up every poll) and picks the next email
+by deficit round-robin over those queues: each turn a user's deficit grows
+by LLM_DRR_QUANTUM prompt characters and the user is served while its next
+email fits. A user with a 100k-email backfill therefore gets the same share
+of Gemini capacity as a user with one new email, and the small user's email
+waits for at most one round. LLM_USER_QUOTA_PER_HOUR additionally caps how
+many emails per hour a single user can send through the LLM; the rest stay
+pending until the quota refills. Once an email is labeled, its pending
+near-duplicates are labeled the same way without a call of their own
+(mainlogic/duplicates.py).
+
+``storymail_llm_queue_delay_seconds`` reports how long emails waited, split
+into "small" and "large" users by pending backlog (LLM_LARGE_BACKLOG).
+"""
+import asyncio
+import collections
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Exists, OuterRef, Q
+from django.db.models.functions import Coalesce, Length
+from django.utils import timezone
+
+from . import duplicates, events, metrics, threads
+from .logs import log_event
+from .models import Email
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+
+Job = collections.namedtuple("Job", "email_id user_id created_at cost user_class")
+
+
+class DeficitRoundRobin:
+    """Deficit round-robin over per-user FIFO queues of jobs with a ``cost``"""
+
+    def __init__(self, quantum):
+        self.quantum = quantum
+        self.queues = {}
+        self.deficit = {}
+        self.active = collections.deque()
+        self._in_turn = False
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def queued(self, user_id):
+        queue = self.queues.get(user_id)
+        return len(queue) if queue else 0
+
+    def push(self, user_id, job):
+        queue = self.queues.get(user_id)
+        if queue is None:
+            queue = self.queues[user_id] = collections.deque()
+            self.deficit[user_id] = 0
+            self.active.append(user_id)
+        queue.append(job)
+
+    def pop(self):
+        """Next job in fair order, or None when every queue is empty"""
+        while self.active:
+            user_id = self.active[0]
+            queue = self.queues[user_id]
+            if not self._in_turn:
+                self.deficit[user_id] += self.quantum
+                self._in_turn = True
+            if queue[0].cost <= self.deficit[user_id]:
+                job = queue.popleft()
+                self.deficit[user_id] -= job.cost
+                if not queue:
+                    # An idle user doesn't bank credit for later
+                    del self.queues[user_id], self.deficit[user_id]
+                    self.active.popleft()
+                    self._in_turn = False
+                return job
+            self.active.rotate(-1)
+            self._in_turn = False
+        return None
+
+
+class UserQuota:
+    """Token bucket per user: `per_hour` emails an hour, bursting up to `per_hour`"""
+
+    def __init__(self, per_hour):
+        self.per_hour = per_hour
+        self._buckets = {}
+
+    def available(self, user_id):
+        if not self.per_hour:
+            return float("inf")
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(user_id, (self.per_hour, now))
+        tokens = min(self.per_hour, tokens + (now - updated) * self.per_hour / 3600)
+        self._buckets[user_id] = (tokens, now)
+        return int(tokens)
+
+    def take(self, user_id, count):
+        if self.per_hour and count:
+            tokens, updated = self._buckets[user_id]
+            self._buckets[user_id] = (tokens - count, updated)
+
+
+class Worker:
+    def __init__(self, concurrency=None, poll_interval=None, prefetch=None):
+        self.concurrency = concurrency or settings.LLM_WORKER_CONCURRENCY
+        self.poll_interval = poll_interval if poll_interval is not None else settings.LLM_WORKER_POLL_INTERVAL
+        self.prefetch = prefetch or settings.LLM_WORKER_PREFETCH
+        self.scheduler = DeficitRoundRobin(settings.LLM_DRR_QUANTUM)
+        self.quota = UserQuota(settings.LLM_USER_QUOTA_PER_HOUR)
+        # Highest email id handed to the scheduler per user, so a refill only
+        # fetches newer pending rows
+        self.cursors = {}
+        self.in_flight = collections.Counter()
+        # email id -> (user id, failed attempts, monotonic time of the next try,
+        # inf while the retry is queued)
+        self.failures = {}
+        self.processed = 0
+
+    def refill(self):
+        """Top up each user's queue from the pending rows; returns how many jobs were added"""
+        backlog = dict(
+            Email.objects.filter(category_source=PENDING)
+            .values_list("user_id")
+            .annotate(pending=Count("id"))
+            .order_by()
+        )
+        for user_id in list(self.cursors):
+            if user_id not in backlog or (not self.scheduler.queued(user_id) and not self.in_flight[user_id]):
+                # Start over from the oldest pending row
+                del self.cursors[user_id]
+        now = time.monotonic()
+        # Failed emails sit below their user's cursor, so those due for a
+        # retry are fetched by id; the cursor only resets once a backlog drains
+        backing_off, due = collections.defaultdict(list), collections.defaultdict(list)
+        for email_id, (user_id, _, retry_at) in list(self.failures.items()):
+            if user_id not in backlog:
+                del self.failures[email_id]  # deleted or labeled elsewhere
+            elif retry_at > now:
+                backing_off[user_id].append(email_id)
+            else:
+                due[user_id].append(email_id)
+
+        added = 0
+        for user_id, pending in backlog.items():
+            room = min(self.prefetch - self.scheduler.queued(user_id), self.quota.available(user_id))
+            if room <= 0:
+                continue
+            # One email per duplicate cluster at a time; labeling it labels the rest
+            earlier_duplicate = Email.objects.filter(
+                user_id=user_id, category_source=PENDING, duplicate_cluster_id=OuterRef("duplicate_cluster_id"),
+                id__lt=OuterRef("id"),
+            )
+            rows = Email.objects.filter(user_id=user_id, category_source=PENDING).exclude(Exists(earlier_duplicate))
+            if user_id in self.cursors:
+                rows = rows.filter(Q(id__gt=self.cursors[user_id]) | Q(id__in=due[user_id]))
+            if backing_off[user_id]:
+                rows = rows.exclude(id__in=backing_off[user_id])
+            rows = rows.annotate(
+                chars=Coalesce(Length("subject"), 0) + Coalesce(Length("text_body"), 0)
+            ).order_by("id").values_list("id", "created_at", "chars")[:room]
+            user_class = "large" if pending >= settings.LLM_LARGE_BACKLOG else "small"
+            for email_id, created_at, chars in rows:
+                self.scheduler.push(user_id, Job(email_id, user_id, created_at, max(chars, 1), user_class))
+                self.cursors[user_id] = max(email_id, self.cursors.get(user_id, 0))
+                if email_id in self.failures:
+                    _, attempts, _ = self.failures[email_id]
+                    self.failures[email_id] = (user_id, attempts, float("inf"))
+                added += 1
+            self.quota.take(user_id, len(rows))
+        return added
+
+    async def process(self, job):
+        from .views import acall_gemini_category
+
+        metrics.LLM_QUEUE_DELAY_SECONDS.labels(user_class=job.user_class).observe(
+            (timezone.now() - job.created_at).total_seconds()
+        )
+        email = await Email.objects.filter(id=job.email_id, category_source=PENDING).only(
+            "id", "user_id", "thread_id", "duplicate_cluster_id", "subject", "text_body"
+        ).afirst()
+        if email is None:
+            self.failures.pop(job.email_id, None)
+            return  # deleted or labeled meanwhile
+        try:
+            email.category, email.summary = await acall_gemini_category(email.subject or "", email.text_body or "")
+        except Exception:
+            # The email stays pending and is retried (see _done)
+            metrics.LLM_ERRORS.labels(operation="category").inc()
+            raise
+        email.category_source = "llm"
+        await email.asave(update_fields=["category", "summary", "category_source"])
+        await events.apublish(email.user_id, events.email_categorized(email))
+        await sync_to_async(threads.refresh_summary)(email.thread_id)
+        if email.duplicate_cluster_id:
+            # Its near-duplicates still in the queue need no call of their own
+            await sync_to_async(duplicates.label_pending)(email)
+        self.failures.pop(email.id, None)
+        self.processed += 1
+
+    def _done(self, task, job, slots):
+        self.in_flight[job.user_id] -= 1
+        slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            _, attempts, _ = self.failures.get(job.email_id, (job.user_id, 0, 0))
+            attempts += 1
+            delay = min(settings.LLM_WORKER_RETRY_DELAY * 2 ** (attempts - 1), settings.LLM_WORKER_RETRY_MAX_DELAY)
+            self.failures[job.email_id] = (job.user_id, attempts, time.monotonic() + delay)
+            log_event(logger, "llm_worker_job_failed", level=logging.ERROR, email_id=job.email_id,
+                      user_id=job.user_id, error=str(task.exception()), attempts=attempts, retry_in=delay)
+
+    async def run(self, once=False):
+        """Categorize pending emails until stopped; with `once`, until none are left to start"""
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        last_refill = float("-inf")
+        while True:
+            await slots.acquire()
+            if not self.scheduler or time.monotonic() - last_refill >= self.poll_interval:
+                await sync_to_async(self.refill)()
+                last_refill = time.monotonic()
+            job = self.scheduler.pop()
+            if job is None:
+                slots.release()
+                if once and not tasks:
+                    return self.processed
+                await asyncio.sleep(self.poll_interval)
+                continue
+            self.in_flight[job.user_id] += 1
+            task = asyncio.create_task(self.process(job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            task.add_done_callback(lambda t, job=job: self._done(t, job, slots))
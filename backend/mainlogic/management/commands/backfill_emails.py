@@ -0,0 +1,96 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from mainlogic import backfill
+from mainlogic.models import BackfillCheckpoint, Email
+
+
+class Command(BaseCommand):
+    help = ("Re-run stored emails through the Gemini category/summary prompt in resumable chunks "
+            "(run with PROCESS_ROLE=worker)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--name", default="recategorize",
+                            help="Checkpoint name; a rerun with the same name resumes where it stopped")
+        parser.add_argument("--restart", action="store_true", help="Discard the checkpoint and start over")
+        parser.add_argument("--fields", default="category,summary",
+                            help="Comma-separated fields to rewrite: category, summary or both")
+        parser.add_argument("--source", default="llm",
+                            help="Only emails whose category came from this source (llm, rules, history, model, or all)")
+        parser.add_argument("--category", help="Only emails currently in this category")
+        parser.add_argument("--user", help="Only this user's emails (auth0 id)")
+        parser.add_argument("--since", help="Only emails dated on or after this ISO datetime")
+        parser.add_argument("--until", help="Only emails dated before this ISO datetime")
+        parser.add_argument("--chunk-size", type=int, default=settings.BACKFILL_CHUNK_SIZE)
+        parser.add_argument("--concurrency", type=int, default=settings.BACKFILL_CONCURRENCY,
+                            help="Concurrent Gemini calls")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks")
+        parser.add_argument("--limit", type=int, help="Stop after this many emails")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Write nothing; report what would change (use with --report and --limit)")
+        parser.add_argument("--report", help="Write a CSV of every changed field (email_id, user_id, field, old, new)")
+
+    def handle(self, *args, **options):
+        fields = [field.strip() for field in options["fields"].split(",") if field.strip()]
+        if not fields or set(fields) - set(backfill.FIELDS):
+            raise CommandError(f"--fields must be a subset of {', '.join(backfill.FIELDS)}")
+
+        filters = {"fields": fields}
+        queryset = Email.objects.exclude(category_source="pending")
+        if options["source"] != "all":
+            queryset = queryset.filter(category_source=options["source"])
+            filters["source"] = options["source"]
+        if options["category"]:
+            queryset = queryset.filter(category=options["category"])
+            filters["category"] = options["category"]
+        if options["user"]:
+            queryset = queryset.filter(user__auth0_id=options["user"])
+            filters["user"] = options["user"]
+        for option, lookup in (("since", "date__gte"), ("until", "date__lt")):
+            if options[option]:
+                value = parse_datetime(options[option])
+                if value is None:
+                    raise CommandError(f"--{option} is not an ISO datetime")
+                queryset = queryset.filter(**{lookup: value})
+                filters[option] = options[option]
+
+        if options["dry_run"]:
+            checkpoint = BackfillCheckpoint(name=options["name"], options=filters)
+        else:
+            try:
+                checkpoint = backfill.load_checkpoint(options["name"], filters, restart=options["restart"])
+            except backfill.CheckpointMismatch as exc:
+                raise CommandError(str(exc))
+            if checkpoint.finished_at:
+                self.stdout.write(f"Backfill {checkpoint.name!r} already finished; use --restart to run it again")
+                return
+            if checkpoint.last_id:
+                self.stdout.write(f"Resuming {checkpoint.name!r} after id {checkpoint.last_id}")
+
+        run = backfill.Backfill(
+            queryset,
+            checkpoint,
+            fields=fields,
+            chunk_size=options["chunk_size"],
+            concurrency=options["concurrency"],
+            dry_run=options["dry_run"],
+            report=options["report"],
+            limit=options["limit"],
+            pause=options["pause"],
+            log=self.stdout.write,
+        )
+        checkpoint = asyncio.run(run.run())
+
+        verb = "would change" if options["dry_run"] else "changed"
+        self.stdout.write(
+            f"Done: {checkpoint.processed} processed, {checkpoint.changed} {verb}, {checkpoint.failed} failed; "
+            f"{run.llm_calls} Gemini calls, {run.cache_hits} cached results"
+        )
+        moved = sorted(((old, new, n) for (old, new), n in run.transitions.items() if old != new), key=lambda t: -t[2])
+        if moved:
+            self.stdout.write("Category changes:")
+            for old, new, count in moved:
+                self.stdout.write(f"  {old} -> {new}: {count}")
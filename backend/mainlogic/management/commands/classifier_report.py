@@ -0,0 +1,76 @@
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from mainlogic.classifier import evaluate, get_model
+from mainlogic.models import Email
+
+
+class Command(BaseCommand):
+    help = "Report fast-path classifier coverage and agreement with LLM labels"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30,
+                            help="Look at emails received in the last N days")
+        parser.add_argument("--limit", type=int, default=50000,
+                            help="Replay at most this many LLM-labeled emails")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options["days"])
+        recent = Email.objects.filter(created_at__gte=since)
+
+        # Live coverage: how recent emails actually got their category
+        by_source = dict(
+            recent.values_list("category_source").annotate(n=Count("id")).values_list("category_source", "n")
+        )
+        total = sum(by_source.values())
+        self.stdout.write(f"Emails in the last {options['days']} days: {total}")
+        for source, n in sorted(by_source.items(), key=lambda item: -item[1]):
+            self.stdout.write(f"  {source or 'uncategorized':<14} {n:>8}  {n / total:.1%}")
+        if total:
+            skipped = total - by_source.get("llm", 0) - by_source.get(None, 0)
+            self.stdout.write(f"LLM calls skipped by the fast path: {skipped / total:.1%}")
+
+        # Replay: what the fast path would have done with emails the LLM
+        # labeled. The shipped model is refit on every labeled email, so only
+        # those that arrived after its training data measure it honestly.
+        replay = recent
+        model = get_model()
+        if model is not None:
+            trained_until = model.trained_until or datetime.fromtimestamp(
+                os.path.getmtime(settings.CLASSIFIER_MODEL_PATH), dt_timezone.utc
+            )
+            replay = replay.filter(created_at__gt=trained_until)
+            self.stdout.write(f"\nReplaying emails created after the model's training data ({trained_until:%Y-%m-%d %H:%M})")
+        rows = (
+            replay.filter(category_source="llm")
+            .exclude(category__isnull=True)
+            .order_by("created_at")
+            .values_list("user_id", "raw_json", "subject", "text_body", "from_email", "category")
+        )[:options["limit"]]
+        samples = (
+            (user_id, raw_json or {"Subject": subject, "TextBody": text_body, "From": from_email}, category)
+            for user_id, raw_json, subject, text_body, from_email, category in rows.iterator(chunk_size=2000)
+        )
+        stats = evaluate(samples, model)
+        replayed = stats["total"]
+        if not replayed:
+            self.stdout.write("No LLM-labeled emails to replay")
+            return
+
+        self.stdout.write(f"\nReplayed {replayed} LLM-labeled emails through the fast path:")
+        self.stdout.write(f"  coverage  {stats['covered'] / replayed:.1%}")
+        self.stdout.write(
+            f"  agreement {stats['agreed'] / stats['covered'] if stats['covered'] else 0:.1%}"
+        )
+        for source in ("history", "rules", "model"):
+            covered = stats[f"covered:{source}"]
+            if covered:
+                self.stdout.write(
+                    f"  {source:<8} coverage {covered / replayed:.1%}, "
+                    f"agreement {stats[f'agreed:{source}'] / covered:.1%}"
+                )
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from mainlogic import partitions
+
+
+class Command(BaseCommand):
+    help = "Manage monthly partitions of the email table (Postgres only)"
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest="action", required=True)
+
+        convert = subcommands.add_parser(
+            "convert", help="Convert the email table to a partitioned one online (resumable)"
+        )
+        convert.add_argument("--batch-size", type=int, default=5000,
+                             help="Rows copied per transaction")
+        convert.add_argument("--pause", type=float, default=0.05,
+                             help="Seconds to sleep between batches")
+
+        ensure = subcommands.add_parser("ensure", help="Create upcoming monthly partitions (run from cron)")
+        ensure.add_argument("--months-ahead", type=int, default=settings.EMAIL_PARTITION_MONTHS_AHEAD)
+
+        archive = subcommands.add_parser(
+            "archive", help="Export and drop partitions past the retention period (run from cron)"
+        )
+        archive.add_argument("--retention-months", type=int, default=settings.EMAIL_RETENTION_MONTHS)
+        archive.add_argument("--archive-dir", default=settings.EMAIL_ARCHIVE_DIR)
+
+        subcommands.add_parser("drop-old", help="Drop the unpartitioned table kept after convert")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            self.stderr.write(f"Email partitioning needs Postgres, not {connection.vendor}; nothing to do")
+            return
+
+        action = options["action"]
+        if action == "convert":
+            partitions.convert_to_partitioned(
+                batch_size=options["batch_size"], pause=options["pause"], log=self.stdout.write
+            )
+        elif action == "ensure":
+            created = partitions.ensure_partitions(months_ahead=options["months_ahead"])
+            self.stdout.write(f"Created {len(created)} partitions: {', '.join(created) or '-'}")
+        elif action == "archive":
+            archived = partitions.archive_partitions(
+                retention_months=options["retention_months"],
+                archive_dir=options["archive_dir"],
+                log=self.stdout.write,
+            )
+            self.stdout.write(f"Archived {len(archived)} partitions")
+        elif action == "drop-old":
+            partitions.drop_unpartitioned()
+            self.stdout.write(f"Dropped {partitions.UNPARTITIONED}")
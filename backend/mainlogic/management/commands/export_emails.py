@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from mainlogic import export
+from mainlogic.models import StoryMailUser
+
+
+class Command(BaseCommand):
+    help = "Stream one user's mailbox to a file as NDJSON, CSV or mbox, in constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", required=True, help="Auth0 id or email address of the user")
+        parser.add_argument("--format", choices=sorted(export.FORMATS), default="ndjson")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output on the fly")
+        parser.add_argument("--output", default="-", help="File to write; '-' (default) for stdout")
+
+    def handle(self, *args, **options):
+        user = StoryMailUser.objects.filter(Q(auth0_id=options["user"]) | Q(email=options["user"])).first()
+        if user is None:
+            raise CommandError(f"No user {options['user']!r}")
+
+        chunks = export.export_chunks(export.export_queryset(user), options["format"], gzip=options["gzip"])
+        out = sys.stdout.buffer if options["output"] == "-" else open(options["output"], "wb")
+        written = 0
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        self.stderr.write(f"Exported {user.email or user.auth0_id}: {written} bytes")
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from mainlogic import duplicates
+from mainlogic.models import Email, StoryMailUser
+
+
+class Command(BaseCommand):
+    help = ("Sign stored emails that have no MinHash signature yet and add them to the near-duplicate index, "
+            "oldest first per user (safe to interrupt and rerun). Their own labels are kept.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only this user's emails (auth0 id)")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        users = StoryMailUser.objects.order_by("id")
+        if options["user"]:
+            users = users.filter(auth0_id=options["user"])
+        total = clustered = 0
+        for user in list(users):
+            last = None
+            while True:
+                batch = Email.objects.filter(user=user, minhash__isnull=True)
+                if last:
+                    batch = batch.filter(Q(date__gt=last[0]) | Q(date=last[0], id__gt=last[1]))
+                emails = list(batch.order_by("date", "id").only(
+                    "id", "user_id", "date", "subject", "text_body", "html_body", "category", "summary",
+                    "category_source"
+                )[:options["batch_size"]])
+                if not emails:
+                    break
+                for email in emails:
+                    signature = duplicates.signature(email.subject, email.text_body, email.html_body)
+                    if signature is None:
+                        # An empty signature marks the email as done
+                        Email.objects.filter(pk=email.pk).update(minhash=b"")
+                        continue
+                    match, _ = duplicates.find_cluster(user, signature)
+                    with transaction.atomic():
+                        cluster = duplicates.join(user, signature, match, email.date, email.subject)
+                        Email.objects.filter(pk=email.pk).update(minhash=signature, duplicate_cluster_id=cluster.id)
+                    duplicates.record_labels(cluster.id, email)
+                    clustered += match is not None
+                last = (emails[-1].date, emails[-1].id)
+                total += len(emails)
+            self.stdout.write(f"User {user.id}: indexed up to {last[0] if last else 'nothing new'}")
+        self.stdout.write(f"Indexed {total} emails, {clustered} of them near-duplicates of an earlier one")
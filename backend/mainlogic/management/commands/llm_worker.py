@@ -0,0 +1,58 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mainlogic import metrics
+from mainlogic.llm_queue import Worker
+
+
+def serve_metrics(port):
+    """Expose this process's metrics, since the worker isn't behind the web /metrics endpoint"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status = metrics.scrape_status(self.headers.get("Authorization"))
+            if status != 200:
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+class Command(BaseCommand):
+    help = "Categorize pending emails with Gemini, sharing capacity fairly across users (run with PROCESS_ROLE=worker)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=settings.LLM_WORKER_CONCURRENCY,
+                            help="Concurrent Gemini calls")
+        parser.add_argument("--poll-interval", type=float, default=settings.LLM_WORKER_POLL_INTERVAL,
+                            help="Seconds between checks for newly pending emails")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit once no pending email is left to start (instead of polling forever)")
+        parser.add_argument("--metrics-port", type=int,
+                            help="Serve Prometheus metrics for this worker on this port")
+
+    def handle(self, *args, **options):
+        if options["metrics_port"]:
+            serve_metrics(options["metrics_port"])
+        worker = Worker(concurrency=options["concurrency"], poll_interval=options["poll_interval"])
+        try:
+            processed = asyncio.run(worker.run(once=options["once"]))
+        except KeyboardInterrupt:
+            processed = worker.processed
+        self.stdout.write(f"Categorized {processed} emails")
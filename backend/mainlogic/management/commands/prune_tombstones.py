@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mainlogic import sync
+
+
+class Command(BaseCommand):
+    help = "Delete email sync tombstones older than SYNC_TOMBSTONE_DAYS (run from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.SYNC_TOMBSTONE_DAYS,
+                            help="Keep tombstones this many days; clients with older cursors resync")
+
+    def handle(self, *args, **options):
+        deleted = sync.prune_tombstones(days=options["days"])
+        self.stdout.write(f"Deleted {deleted} tombstones older than {options['days']} days")
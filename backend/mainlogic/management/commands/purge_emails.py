@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from mainlogic import purge
+from mainlogic.models import StoryMailUser
+
+
+class Command(BaseCommand):
+    help = ("Delete a user's account, or every user's emails past retention, in throttled and "
+            "resumable batches (rerun after an interruption to resume)")
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument("--user", help="Delete this user (auth0 id or email) with all emails and digests")
+        target.add_argument("--retention", action="store_true",
+                            help="Delete emails older than --days (default EMAIL_RETENTION_DAYS), for every user")
+        parser.add_argument("--days", type=int, default=settings.EMAIL_RETENTION_DAYS)
+        parser.add_argument("--batch-size", type=int, default=settings.PURGE_BATCH_SIZE)
+        parser.add_argument("--max-rows-per-second", type=int, default=settings.PURGE_MAX_ROWS_PER_SECOND,
+                            help="Pace deletes to this rate (0: unthrottled)")
+
+    def handle(self, *args, **options):
+        kwargs = {
+            "batch_size": options["batch_size"],
+            "max_rows_per_second": options["max_rows_per_second"],
+            "log": self.stdout.write,
+        }
+        try:
+            if options["user"]:
+                user = StoryMailUser.objects.filter(Q(auth0_id=options["user"]) | Q(email=options["user"])).first()
+                if user is None:
+                    raise CommandError(f"No user {options['user']!r}")
+                checkpoint = purge.delete_account(user, **kwargs)
+                self.stdout.write(
+                    f"Deleted user {options['user']}: {checkpoint.deleted_emails} emails, "
+                    f"{checkpoint.deleted_digests} digests"
+                )
+            else:
+                if options["days"] is None:
+                    raise CommandError("Set --days or EMAIL_RETENTION_DAYS")
+                checkpoint = purge.retention(options["days"], **kwargs)
+                self.stdout.write(f"Retention done: {checkpoint.deleted_emails} emails deleted")
+        except purge.CheckpointMismatch as exc:
+            raise CommandError(str(exc))
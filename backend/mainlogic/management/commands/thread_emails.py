@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from mainlogic import threads
+from mainlogic.models import Email, StoryMailUser
+
+
+class Command(BaseCommand):
+    help = ("Group stored emails that have no thread yet into conversations, oldest first per user "
+            "(safe to interrupt and rerun)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only this user's emails (auth0 id)")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        users = StoryMailUser.objects.order_by("id")
+        if options["user"]:
+            users = users.filter(auth0_id=options["user"])
+        total = 0
+        for user in list(users):
+            last = None
+            while True:
+                # Oldest first, so a reply finds the thread its parent started
+                batch = Email.objects.filter(user=user, thread__isnull=True)
+                if last:
+                    batch = batch.filter(Q(date__gt=last[0]) | Q(date=last[0], id__gt=last[1]))
+                emails = list(batch.order_by("date", "id").only("id", "user_id", "date", "subject", "from_email",
+                                                                  "raw_json")[:options["batch_size"]])
+                if not emails:
+                    break
+                for email in emails:
+                    payload = email.raw_json if isinstance(email.raw_json, dict) else {"Subject": email.subject}
+                    email.thread_id, email.message_id = threads.find_thread(user, payload, email.date)
+                    Email.objects.filter(pk=email.pk).update(thread_id=email.thread_id, message_id=email.message_id)
+                    threads.add_message(email)
+                last = (emails[-1].date, emails[-1].id)
+                total += len(emails)
+            self.stdout.write(f"User {user.id}: threaded up to {last[0] if last else 'nothing new'}")
+        self.stdout.write(f"Threaded {total} emails")
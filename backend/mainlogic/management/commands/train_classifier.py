@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mainlogic.classifier import HashedNgramModel
+from mainlogic.models import Email
+
+
+class Command(BaseCommand):
+    help = "Train the local fast-path classifier on emails already labeled by the LLM"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=settings.CLASSIFIER_MODEL_PATH,
+                            help="Where to write the model (default: CLASSIFIER_MODEL_PATH)")
+        parser.add_argument("--limit", type=int, default=200000,
+                            help="Train on at most this many of the most recent labeled emails")
+        parser.add_argument("--holdout", type=float, default=0.2,
+                            help="Fraction of the newest emails held out for evaluation")
+        parser.add_argument("--epochs", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows = list(
+            Email.objects.filter(category_source="llm")
+            .exclude(category__isnull=True)
+            .order_by("-created_at")
+            .values_list("subject", "text_body", "from_email", "category", "created_at")[:options["limit"]]
+        )
+        rows.reverse()
+        if not rows:
+            self.stderr.write("No LLM-labeled emails to train on")
+            return
+
+        trained_until = rows[-1][-1]
+        rows = [row[:-1] for row in rows]
+        split = int(len(rows) * (1 - options["holdout"]))
+        train, holdout = rows[:split], rows[split:]
+        self.stdout.write(f"Training on {len(train)} emails, holding out {len(holdout)}")
+
+        model = HashedNgramModel().fit(train, epochs=options["epochs"])
+
+        if holdout:
+            covered = agreed = 0
+            for subject, body, from_email, category in holdout:
+                predicted, confidence = model.predict(subject, body, from_email)
+                if confidence >= settings.CLASSIFIER_MIN_CONFIDENCE:
+                    covered += 1
+                    agreed += predicted == category
+            self.stdout.write(
+                f"Holdout at confidence >= {settings.CLASSIFIER_MIN_CONFIDENCE}: "
+                f"coverage {covered / len(holdout):.1%}, "
+                f"agreement {agreed / covered if covered else 0:.1%}"
+            )
+
+        # Refit on everything so the shipped model has seen the newest senders
+        if holdout:
+            model = HashedNgramModel().fit(rows, epochs=options["epochs"])
+        # classifier_report only replays emails after this through the model
+        model.trained_until = trained_until
+        model.save(options["output"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved model with {len(model.weights)} active buckets to {options['output']}"
+        ))
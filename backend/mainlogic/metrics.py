@@ -0,0 +1,362 @@
+"""
+In-process metrics with a Prometheus text exposition endpoint (``/metrics``).
+
+Histograms cover each stage a request can spend time in: Auth0 JWKS fetch and
+JWT decode, database queries per request, Gemini latency and token counts, PDF
+rendering and Postmark sends, plus overall request latency per view. Outbound
+HTTP counters from ``http_client.host_stats()`` are exported alongside.
+
+Metrics live in process memory, so each worker process reports its own;
+scrape every worker (or run one per container) and aggregate in Prometheus.
+
+Usage::
+
+    with metrics.PDF_RENDER_SECONDS.time():
+        render()
+    metrics.LLM_SECONDS.labels(operation="chat").observe(elapsed)
+"""
+import contextlib
+import contextvars
+import hmac
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+
+# Seconds; roughly log-spaced from a fast cache hit to an LLM call timing out
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+QUEUE_DELAY_BUCKETS = (1, 2, 5, 10, 30, 60, 300, 900, 3600, 4 * 3600, 24 * 3600)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+_registry = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} needs labels {self.labelnames}")
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def render(self, name, labelnames, key):
+        return [f"{name}_total{_format_labels(labelnames, key)} {self.value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Report function() at scrape time instead of a stored value"""
+        self.function = function
+
+    def render(self, name, labelnames, key):
+        value = self.function() if self.function is not None else self.value
+        return [f"{name}{_format_labels(labelnames, key)} {value}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    @contextlib.contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self, name, labelnames, key):
+        with self.lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {total}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+REQUEST_SECONDS = Histogram(
+    "storymail_request_seconds", "Request latency by view", ["view", "method", "status"]
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "storymail_db_queries_per_request", "Database queries run while serving a request", ["view"],
+    buckets=COUNT_BUCKETS,
+)
+DB_QUERY_SECONDS_PER_REQUEST = Histogram(
+    "storymail_db_query_seconds_per_request", "Total database time while serving a request", ["view"]
+)
+JWKS_FETCH_SECONDS = Histogram("storymail_jwks_fetch_seconds", "Auth0 JWKS fetch latency")
+JWT_DECODE_SECONDS = Histogram("storymail_jwt_decode_seconds", "Access token validation time")
+LLM_SECONDS = Histogram("storymail_llm_seconds", "Gemini call latency", ["operation"])
+LLM_TOKENS = Histogram(
+    "storymail_llm_tokens", "Gemini tokens per call", ["operation", "kind"], buckets=TOKEN_BUCKETS
+)
+LLM_QUEUE_DELAY_SECONDS = Histogram(
+    "storymail_llm_queue_delay_seconds", "Time pending emails waited for background categorization",
+    ["user_class"], buckets=QUEUE_DELAY_BUCKETS,
+)
+LLM_ERRORS = Counter("storymail_llm_errors", "Failed Gemini calls", ["operation"])
+PDF_RENDER_SECONDS = Histogram("storymail_pdf_render_seconds", "Digest PDF render time")
+POSTMARK_SEND_SECONDS = Histogram(
+    "storymail_postmark_send_seconds", "Postmark send latency", ["outcome"]
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "storymail_admission_in_flight", "Requests holding an admission slot", ["gate"]
+)
+ADMISSION_QUEUED = Gauge("storymail_admission_queued", "Requests waiting for an admission slot", ["gate"])
+ADMISSION_WAIT_SECONDS = Histogram(
+    "storymail_admission_wait_seconds", "Time queued requests waited for an admission slot", ["gate"]
+)
+ADMISSION_REJECTED = Counter(
+    "storymail_admission_rejected", "Requests shed by admission control", ["gate", "reason"]
+)
+EVENT_STREAMS = Gauge("storymail_event_streams", "Open server-sent event streams")
+EVENTS_PUBLISHED = Counter("storymail_events_published", "Email events published", ["type"])
+EVENTS_DROPPED = Counter("storymail_events_dropped", "Events dropped for streams too far behind")
+
+
+def observe_llm(operation, seconds, response=None):
+    """Record a Gemini call's latency and, when the response reports them, its token counts"""
+    LLM_SECONDS.labels(operation=operation).observe(seconds)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, field in (("prompt", "prompt_token_count"), ("completion", "candidates_token_count")):
+        count = getattr(usage, field, None)
+        if count:
+            LLM_TOKENS.labels(operation=operation, kind=kind).observe(count)
+
+
+# Per-request query accounting. The dict is shared with sync_to_async threads
+# because they run in a copy of the request's context.
+_request_queries = contextvars.ContextVar("request_queries", default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _request_queries.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats["count"] += 1
+        stats["seconds"] += time.perf_counter() - start
+
+
+@receiver(connection_created, dispatch_uid="metrics_count_queries")
+def install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.url_name or match.view_name if match else "unmatched"
+
+
+def _finish(request, response, start, stats):
+    view = _view_name(request)
+    REQUEST_SECONDS.labels(view=view, method=request.method, status=response.status_code).observe(
+        time.perf_counter() - start
+    )
+    DB_QUERIES_PER_REQUEST.labels(view=view).observe(stats["count"])
+    DB_QUERY_SECONDS_PER_REQUEST.labels(view=view).observe(stats["seconds"])
+
+
+class MetricsMiddleware:
+    """Records request latency and per-request query counts for every view"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = {"count": 0, "seconds": 0.0}
+        token = _request_queries.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        _finish(request, response, start, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = {"count": 0, "seconds": 0.0}
+        token = _request_queries.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        _finish(request, response, start, stats)
+        return response
+
+
+def _outbound_lines():
+    from .http_client import host_stats
+
+    stats = host_stats()
+    lines = []
+    for field, kind, doc in (
+        ("requests", "counter", "Outbound HTTP requests"),
+        ("errors", "counter", "Outbound HTTP requests that failed or returned 5xx"),
+        ("retries", "counter", "Outbound HTTP retries"),
+        ("rejected", "counter", "Outbound HTTP calls rejected by an open circuit breaker"),
+    ):
+        name = f"storymail_outbound_{field}"
+        lines += [f"# HELP {name} {doc}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}_total{{host="{host}"}} {host_stat[field]}' for host, host_stat in sorted(stats.items())]
+    name = "storymail_outbound_circuit_open"
+    lines += [f"# HELP {name} 1 while the host's circuit breaker is open", f"# TYPE {name} gauge"]
+    lines += [
+        f'{name}{{host="{host}"}} {int(host_stat["circuit"] == "open")}' for host, host_stat in sorted(stats.items())
+    ]
+    return lines
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    lines.extend(_outbound_lines())
+    return "\n".join(lines) + "\n"
+
+
+def scrape_status(authorization):
+    """
+    Status for a scrape with this Authorization header: 200 for
+    `Bearer <METRICS_TOKEN>`, 403 otherwise, and 404 while no token is
+    configured (unless DEBUG is on), so metrics are never public by default
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        return 200 if settings.DEBUG else 404
+    return 200 if hmac.compare_digest(authorization or "", f"Bearer {token}") else 403
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; see scrape_status"""
+    status = scrape_status(request.headers.get("Authorization"))
+    if status == 404:
+        raise Http404
+    if status != 200:
+        return HttpResponse(status=status)
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
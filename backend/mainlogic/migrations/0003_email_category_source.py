@@ -0,0 +1,34 @@
+# Generated by Django 5.2.2 on 2026-10-19 13:29
+
+from django.db import migrations, models
+
+
+def mark_existing_as_llm(apps, schema_editor):
+    # Every email categorized before the fast path existed was labeled by Gemini
+    Email = apps.get_model('mainlogic', 'Email')
+    Email.objects.exclude(category__isnull=True).update(category_source='llm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainlogic', '0002_alter_email_date_alter_email_from_email_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='category_confidence',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='category_source',
+            field=models.CharField(blank=True, choices=[('llm', 'LLM'), ('rules', 'Header rules'), ('history', 'Sender history'), ('model', 'Local model')], max_length=16, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['user', 'from_email'], name='email_user_sender_idx'),
+        ),
+        migrations.RunPython(mark_existing_as_llm, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.2 on 2026-10-19 13:39
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_missing_dates(apps, schema_editor):
+    # Email.date becomes the partition key, so it can't stay NULL
+    Email = apps.get_model('mainlogic', 'Email')
+    Email.objects.filter(date__isnull=True).update(date=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    # Keep the UPDATE and the ALTER TABLE in separate transactions
+    atomic = False
+
+    dependencies = [
+        ('mainlogic', '0003_email_category_source'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_missing_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='email',
+            name='date',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['user', 'date'], name='email_user_date_idx'),
+        ),
+    ]
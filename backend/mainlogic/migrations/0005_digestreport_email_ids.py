@@ -0,0 +1,56 @@
+from django.db import migrations, models
+
+
+def copy_email_ids(apps, schema_editor):
+    DigestReport = apps.get_model('mainlogic', 'DigestReport')
+    Through = DigestReport.emails.through
+
+    email_ids = {}
+    for digest_id, email_id in Through.objects.order_by('digestreport_id', 'email_id').values_list(
+        'digestreport_id', 'email_id'
+    ).iterator(chunk_size=5000):
+        email_ids.setdefault(digest_id, []).append(email_id)
+
+    digests = list(DigestReport.objects.filter(id__in=email_ids))
+    for digest in digests:
+        digest.email_ids = email_ids[digest.id]
+        digest.email_count = len(digest.email_ids)
+    DigestReport.objects.bulk_update(digests, ['email_ids', 'email_count'], batch_size=500)
+
+
+def restore_through_rows(apps, schema_editor):
+    DigestReport = apps.get_model('mainlogic', 'DigestReport')
+    Email = apps.get_model('mainlogic', 'Email')
+    Through = DigestReport.emails.through
+
+    for digest in DigestReport.objects.exclude(email_ids=[]).iterator(chunk_size=500):
+        existing = Email.objects.filter(id__in=digest.email_ids).values_list('id', flat=True)
+        Through.objects.bulk_create(
+            [Through(digestreport_id=digest.id, email_id=email_id) for email_id in existing],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainlogic', '0004_email_date_not_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='digestreport',
+            name='email_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='digestreport',
+            name='email_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(copy_email_ids, restore_through_rows),
+        migrations.RemoveField(
+            model_name='digestreport',
+            name='emails',
+        ),
+    ]
@@ -0,0 +1,73 @@
+import json
+
+from django.db import migrations, models
+
+
+def split_summary(apps, schema_editor):
+    # summary used to hold the whole digest as a JSON string
+    DigestReport = apps.get_model('mainlogic', 'DigestReport')
+    batch = []
+    for digest in DigestReport.objects.only('id', 'summary').iterator(chunk_size=500):
+        try:
+            data = json.loads(digest.summary)
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(data, dict):
+            continue
+        digest.digest_data = data
+        digest.summary = data.get('narrative_summary') or ''
+        batch.append(digest)
+        if len(batch) >= 500:
+            DigestReport.objects.bulk_update(batch, ['digest_data', 'summary'])
+            batch = []
+    if batch:
+        DigestReport.objects.bulk_update(batch, ['digest_data', 'summary'])
+
+
+def join_summary(apps, schema_editor):
+    DigestReport = apps.get_model('mainlogic', 'DigestReport')
+    batch = []
+    for digest in DigestReport.objects.exclude(digest_data={}).only('id', 'digest_data').iterator(chunk_size=500):
+        digest.summary = json.dumps(digest.digest_data)
+        batch.append(digest)
+    DigestReport.objects.bulk_update(batch, ['summary'], batch_size=500)
+
+
+def add_gin_index(apps, schema_editor):
+    # Containment queries on digest_data (e.g. highlights, clusters); jsonb only
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS digest_data_gin ON mainlogic_digestreport '
+            'USING gin (digest_data jsonb_path_ops)'
+        )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS digest_data_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainlogic', '0005_digestreport_email_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='digestreport',
+            name='digest_data',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='digestreport',
+            name='pdf_sha256',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='digestreport',
+            index=models.Index(fields=['user', '-id'], name='digest_user_recent_idx'),
+        ),
+        migrations.RunPython(split_summary, join_summary),
+        migrations.RunPython(add_gin_index, drop_gin_index),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.2 on 2026-10-19 14:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainlogic', '0006_digestreport_digest_data'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='email',
+            name='category_source',
+            field=models.CharField(blank=True, choices=[('llm', 'LLM'), ('rules', 'Header rules'), ('history', 'Sender history'), ('model', 'Local model'), ('pending', 'Awaiting LLM')], max_length=16, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(condition=models.Q(('category_source', 'pending')), fields=['user', 'id'], name='email_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,124 @@
+# Generated by Django 5.2.2 on 2026-10-19 14:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# Hands out the next change_seq for a user. The upsert locks the user's
+# counter row until the writing transaction commits, so a user's changes
+# become visible in change_seq order and a cursor never skips one.
+NEXT_SEQ_FUNCTION = """
+CREATE OR REPLACE FUNCTION mainlogic_email_sync_next(owner bigint) RETURNS bigint AS $$
+    INSERT INTO mainlogic_emailsyncstate AS state (user_id, seq, floor_seq, epoch) VALUES (owner, 1, 0, 0)
+    ON CONFLICT (user_id) DO UPDATE SET seq = state.seq + 1
+    RETURNING state.seq
+$$ LANGUAGE sql
+"""
+
+# Stamps inserted and really changed rows, and leaves a tombstone for
+# deleted rows (and rows moved to another user)
+SYNC_FUNCTION = """
+CREATE OR REPLACE FUNCTION mainlogic_email_sync() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        NEW.change_seq := OLD.change_seq;
+        NEW.updated_at := OLD.updated_at;
+        IF NEW IS NOT DISTINCT FROM OLD THEN
+            RETURN NEW;
+        END IF;
+    END IF;
+    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND NEW.user_id IS DISTINCT FROM OLD.user_id) THEN
+        INSERT INTO mainlogic_emailtombstone (user_id, email_id, change_seq, deleted_at)
+        VALUES (OLD.user_id, OLD.id, mainlogic_email_sync_next(OLD.user_id), now());
+        IF TG_OP = 'DELETE' THEN
+            RETURN OLD;
+        END IF;
+    END IF;
+    NEW.change_seq := mainlogic_email_sync_next(NEW.user_id);
+    NEW.updated_at := now();
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def install_sync_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Number the existing rows per user in id order before the trigger takes over
+    schema_editor.execute(
+        'UPDATE mainlogic_email e SET change_seq = n.seq, updated_at = e.created_at '
+        'FROM (SELECT id, row_number() OVER (PARTITION BY user_id ORDER BY id) AS seq FROM mainlogic_email) n '
+        'WHERE e.id = n.id'
+    )
+    schema_editor.execute(
+        'INSERT INTO mainlogic_emailsyncstate (user_id, seq, floor_seq, epoch) '
+        'SELECT user_id, max(change_seq), 0, 0 FROM mainlogic_email GROUP BY user_id'
+    )
+    schema_editor.execute(NEXT_SEQ_FUNCTION)
+    schema_editor.execute(SYNC_FUNCTION)
+    schema_editor.execute(
+        'CREATE TRIGGER mainlogic_email_sync BEFORE INSERT OR UPDATE OR DELETE ON mainlogic_email '
+        'FOR EACH ROW EXECUTE FUNCTION mainlogic_email_sync()'
+    )
+
+
+def drop_sync_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP TRIGGER IF EXISTS mainlogic_email_sync ON mainlogic_email')
+    schema_editor.execute('DROP FUNCTION IF EXISTS mainlogic_email_sync()')
+    schema_editor.execute('DROP FUNCTION IF EXISTS mainlogic_email_sync_next(bigint)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainlogic', '0008_backfillcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSyncState',
+            fields=[
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='mainlogic.storymailuser')),
+                ('seq', models.BigIntegerField(default=0)),
+                ('floor_seq', models.BigIntegerField(default=0)),
+                ('epoch', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EmailTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email_id', models.BigIntegerField()),
+                ('change_seq', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['user', 'change_seq'], name='email_user_change_idx'),
+        ),
+        migrations.AddField(
+            model_name='emailtombstone',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='mainlogic.storymailuser'),
+        ),
+        migrations.AddIndex(
+            model_name='emailtombstone',
+            index=models.Index(fields=['user', 'change_seq'], name='tombstone_user_change_idx'),
+        ),
+        migrations.RunPython(install_sync_trigger, drop_sync_trigger),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.2 on 2026-10-19 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainlogic', '0009_email_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurgeCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('options', models.JSONField(default=dict)),
+                ('last_user_id', models.BigIntegerField(default=0)),
+                ('last_date', models.DateTimeField(blank=True, null=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('deleted_emails', models.PositiveBigIntegerField(default=0)),
+                ('deleted_digests', models.PositiveBigIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
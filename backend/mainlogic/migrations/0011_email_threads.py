@@ -0,0 +1,57 @@
+# Generated by Django 5.2.2 on 2026-10-19 14:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainlogic', '0010_purgecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='message_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.CreateModel(
+            name='Thread',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('root_message_id', models.CharField(max_length=255)),
+                ('subject', models.CharField(blank=True, max_length=256, null=True)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('participants', models.JSONField(blank=True, default=list)),
+                ('first_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_email_id', models.BigIntegerField(blank=True, null=True)),
+                ('summary', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='threads', to='mainlogic.storymailuser')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='thread',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='emails', to='mainlogic.thread'),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['user', 'message_id'], name='email_user_message_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['thread', 'date'], name='email_thread_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['user', '-last_date'], name='thread_user_recent_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='thread',
+            constraint=models.UniqueConstraint(fields=('user', 'root_message_id'), name='thread_user_root_uniq'),
+        ),
+    ]
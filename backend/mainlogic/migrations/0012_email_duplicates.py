@@ -0,0 +1,56 @@
+# Generated by Django 5.2.2 on 2026-10-19 14:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainlogic', '0011_email_threads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='minhash',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='email',
+            name='category_source',
+            field=models.CharField(blank=True, choices=[('llm', 'LLM'), ('rules', 'Header rules'), ('history', 'Sender history'), ('model', 'Local model'), ('pending', 'Awaiting LLM'), ('duplicate', 'Near-duplicate')], max_length=16, null=True),
+        ),
+        migrations.CreateModel(
+            name='DuplicateCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.BinaryField()),
+                ('subject', models.CharField(blank=True, max_length=256, null=True)),
+                ('category', models.CharField(blank=True, max_length=64, null=True)),
+                ('summary', models.TextField(blank=True, null=True)),
+                ('size', models.PositiveIntegerField(default=1)),
+                ('last_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_clusters', to='mainlogic.storymailuser')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='duplicate_cluster',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='emails', to='mainlogic.duplicatecluster'),
+        ),
+        migrations.CreateModel(
+            name='DuplicateBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mainlogic.storymailuser')),
+                ('cluster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='mainlogic.duplicatecluster')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'key'], name='dup_bucket_user_key_idx')],
+            },
+        ),
+    ]
@@ -2,6 +2,20 @@ from django.db import models
 
 # Create your models here.
 from django.db import models
+from django.utils import timezone
+
+# Categories the LLM (and the local fast-path classifier) may assign to an email
+EMAIL_CATEGORIES = ["productivity", "scam", "newsletters", "work", "other"]
+
+# Where an email's category came from
+CATEGORY_SOURCES = [
+    ("llm", "LLM"),
+    ("rules", "Header rules"),
+    ("history", "Sender history"),
+    ("model", "Local model"),
+    ("pending", "Awaiting LLM"),  # queued for the llm_worker command (mainlogic/llm_queue.py)
+    ("duplicate", "Near-duplicate"),  # copied from its duplicate cluster (mainlogic/duplicates.py)
+]
 
 class StoryMailUser(models.Model):
     # Auth0 user id (sub) is unique
@@ -14,19 +28,126 @@ class StoryMailUser(models.Model):
     def __str__(self):
         return self.name or self.email or self.auth0_id
 
+class Thread(models.Model):
+    """
+    A conversation, grouped at ingest from the Message-ID, In-Reply-To and
+    References headers (mainlogic/threads.py). The aggregates are updated as
+    messages arrive, so listing threads never scans their emails.
+    """
+    user = models.ForeignKey(StoryMailUser, on_delete=models.CASCADE, related_name='threads')
+    # Message-ID of the conversation's first message, as the replies reference it
+    root_message_id = models.CharField(max_length=255)
+    # Without "Re:"/"Fwd:" prefixes
+    subject = models.CharField(max_length=256, blank=True, null=True)
+    message_count = models.PositiveIntegerField(default=0)
+    # Sender addresses, in order of first appearance (at most threads.MAX_PARTICIPANTS)
+    participants = models.JSONField(default=list, blank=True)
+    first_date = models.DateTimeField(default=timezone.now)
+    last_date = models.DateTimeField(default=timezone.now)
+    last_email_id = models.BigIntegerField(blank=True, null=True)
+    # The latest few messages' summaries, one "Sender: summary" line each
+    summary = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "root_message_id"], name="thread_user_root_uniq"),
+        ]
+        indexes = [
+            # Thread list, most recently active first
+            models.Index(fields=["user", "-last_date"], name="thread_user_recent_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} ({self.message_count} messages)"
+
+class DuplicateCluster(models.Model):
+    """
+    Near-identical emails of one user, found through the LSH index
+    (mainlogic/duplicates.py). New members copy the cluster's labels instead
+    of being categorized again.
+    """
+    user = models.ForeignKey(StoryMailUser, on_delete=models.CASCADE, related_name='duplicate_clusters')
+    # MinHash signature of the first member, which later ones are compared with
+    signature = models.BinaryField()
+    subject = models.CharField(max_length=256, blank=True, null=True)
+    # Labels of the first member that got any; empty while it awaits the LLM
+    category = models.CharField(max_length=64, blank=True, null=True)
+    summary = models.TextField(blank=True, null=True)
+    size = models.PositiveIntegerField(default=1)
+    last_date = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.subject} ({self.size} emails)"
+
+class DuplicateBucket(models.Model):
+    """One LSH band of a cluster's signature; clusters sharing a key with an email are its candidates"""
+    user = models.ForeignKey(StoryMailUser, on_delete=models.CASCADE, related_name='+')
+    key = models.BigIntegerField()
+    cluster = models.ForeignKey(DuplicateCluster, on_delete=models.CASCADE, related_name='buckets')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "key"], name="dup_bucket_user_key_idx"),
+        ]
+
 class Email(models.Model):
     user = models.ForeignKey(StoryMailUser, on_delete=models.CASCADE, related_name='emails')
+    # No database constraints: the partitioned email table (mainlogic/partitions.py)
+    # only recreates the user foreign key
+    thread = models.ForeignKey(
+        Thread, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False, db_index=False,
+        related_name='emails'
+    )
+    # Clusters are only deleted in bulk with their emails (mainlogic/purge.py),
+    # so nothing is updated on delete
+    duplicate_cluster = models.ForeignKey(
+        DuplicateCluster, on_delete=models.DO_NOTHING, null=True, blank=True, db_constraint=False, db_index=False,
+        related_name='emails'
+    )
+    # MinHash signature of the subject and body (mainlogic/duplicates.py);
+    # empty if the text is too short to compare, null if not computed yet
+    minhash = models.BinaryField(blank=True, null=True)
+    # The Message-ID header, for threading replies that arrive later
+    message_id = models.CharField(max_length=255, blank=True, null=True)
     from_email = models.EmailField(null=True, blank=True)   
     from_name = models.CharField(max_length=128, blank=True, null=True)
     to_email = models.EmailField(null=True, blank=True)
     subject = models.CharField(max_length=256,null=True, blank=True)
-    date = models.DateTimeField(null=True, blank=True)
+    # Partition key of the (optionally) month-partitioned email table, so never null
+    date = models.DateTimeField(default=timezone.now, blank=True)
     text_body = models.TextField(blank=True, null=True)
     html_body = models.TextField(blank=True, null=True)
     raw_json = models.JSONField(null=True, blank=True)  # Store full Postmark payload
     category = models.CharField(max_length=64, blank=True, null=True)
+    category_source = models.CharField(max_length=16, choices=CATEGORY_SOURCES, blank=True, null=True)
+    category_confidence = models.FloatField(blank=True, null=True)
     summary = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Both set by a database trigger on every real change, including bulk and
+    # raw updates; change_seq is the row's position in the owner's change
+    # stream for delta sync (mainlogic/sync.py)
+    updated_at = models.DateTimeField(auto_now=True)
+    change_seq = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Delta sync: a user's changes after a cursor
+            models.Index(fields=["user", "change_seq"], name="email_user_change_idx"),
+            # Sender history lookups for the fast-path classifier
+            models.Index(fields=["user", "from_email"], name="email_user_sender_idx"),
+            # Date-range queries (digests, dashboard), pruned to a few partitions
+            models.Index(fields=["user", "date"], name="email_user_date_idx"),
+            # Threading: replies look up their parent by Message-ID
+            models.Index(fields=["user", "message_id"], name="email_user_message_id_idx"),
+            # A thread's messages in order
+            models.Index(fields=["thread", "date"], name="email_thread_date_idx"),
+            # The background categorization queue (mainlogic/llm_queue.py)
+            models.Index(
+                fields=["user", "id"], name="email_pending_idx", condition=models.Q(category_source="pending")
+            ),
+        ]
 
     def __str__(self):
         return f"{self.subject} ({self.date})"
@@ -35,9 +156,103 @@ class DigestReport(models.Model):
     user = models.ForeignKey(StoryMailUser, on_delete=models.CASCADE, related_name='reports')
     start_date = models.DateField()
     end_date = models.DateField()
+    # Narrative summary; the full structured digest is in digest_data
     summary = models.TextField()
-    emails = models.ManyToManyField(Email, blank=True)
+    digest_data = models.JSONField(default=dict, blank=True)
+    # Key of the rendered PDF in the blob store (mainlogic/blobstore.py)
+    pdf_sha256 = models.CharField(max_length=64, blank=True, null=True)
+    # Ids of the emails the digest covers, stored inline instead of one
+    # through-table row per email
+    email_ids = models.JSONField(default=list, blank=True)
+    email_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Digest history, newest first
+            models.Index(fields=["user", "-id"], name="digest_user_recent_idx"),
+        ]
+
+    def __str__(self):
+        return f"Digest for {self.user} ({self.start_date} - {self.end_date})"
+
+    @property
+    def emails(self):
+        """The emails covered by this digest (those not deleted since)"""
+        return Email.objects.filter(user_id=self.user_id, id__in=self.email_ids)
+
+class BackfillCheckpoint(models.Model):
+    """Progress of a resumable backfill (manage.py backfill_emails), saved after every chunk"""
+    name = models.CharField(max_length=64, unique=True)
+    # The filters and fields the run was started with; a resume must match them
+    options = models.JSONField(default=dict)
+    last_id = models.BigIntegerField(default=0)
+    processed = models.PositiveBigIntegerField(default=0)
+    changed = models.PositiveBigIntegerField(default=0)
+    failed = models.PositiveBigIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
     def __str__(self):
-        return f"Digest for {self.user} ({self.start_date} - {self.end_date})"
\ No newline at end of file
+        return f"{self.name} (last id {self.last_id})"
+
+class PurgeCheckpoint(models.Model):
+    """Progress of a resumable account or retention purge (manage.py purge_emails), saved with every batch"""
+    # "account:<user id>" or "retention"
+    name = models.CharField(max_length=64, unique=True)
+    options = models.JSONField(default=dict)
+    # Keyset position: the user being purged and the last deleted email's (date, id)
+    last_user_id = models.BigIntegerField(default=0)
+    last_date = models.DateTimeField(blank=True, null=True)
+    last_id = models.BigIntegerField(default=0)
+    deleted_emails = models.PositiveBigIntegerField(default=0)
+    deleted_digests = models.PositiveBigIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.deleted_emails} emails deleted)"
+
+class EmailSyncState(models.Model):
+    """
+    Per-user change counter for delta sync (mainlogic/sync.py), maintained by
+    the email trigger. Neither table has a foreign key constraint: the
+    trigger writes to them while a user's emails are being cascade-deleted.
+    """
+    user = models.OneToOneField(
+        StoryMailUser, primary_key=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    # Last change_seq handed out for this user's emails and tombstones
+    seq = models.BigIntegerField(default=0)
+    # A cursor from before `epoch` that is below floor_seq may have missed
+    # changes that can't be replayed (tombstones pruned, partitions
+    # archived); its client must resync
+    floor_seq = models.BigIntegerField(default=0)
+    epoch = models.IntegerField(default=0)
+
+class EmailTombstone(models.Model):
+    """A deleted email, kept for SYNC_TOMBSTONE_DAYS so syncing clients learn about it"""
+    user = models.ForeignKey(
+        StoryMailUser, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    email_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "change_seq"], name="tombstone_user_change_idx"),
+        ]
+
+def owner_auth0_id(instance):
+    """auth0_id of the user who owns a StoryMailUser, Email or DigestReport row"""
+    if isinstance(instance, StoryMailUser):
+        return instance.auth0_id
+    user = instance._meta.get_field("user").get_cached_value(instance, None)
+    if user is not None:
+        return user.auth0_id
+    if instance.user_id is None:
+        return None
+    return StoryMailUser.objects.filter(pk=instance.user_id).values_list("auth0_id", flat=True).first()
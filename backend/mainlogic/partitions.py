@@ -0,0 +1,390 @@
+"""
+Monthly range partitioning of the email table by ``date`` (Postgres only).
+
+Partitions are named ``mainlogic_email_yYYYYmMM``; rows outside every monthly
+range (back-dated spam, far-future dates) land in ``mainlogic_email_default``.
+Date-range queries such as the digest and dashboard windows are pruned to
+the partitions they touch, and old months can be dropped whole instead of
+deleted row by row.
+
+The existing table is converted online by ``convert_to_partitioned``:
+
+1. create a partitioned shadow table with the same columns and indexes, and a
+   trigger that mirrors every insert/update/delete on the live table into it
+2. copy existing rows over in id-ordered batches, each in its own short
+   transaction, checkpointing progress so the copy can be resumed
+3. swap the tables under a brief exclusive lock; the old table is kept as
+   ``mainlogic_email_unpartitioned`` until ``drop_unpartitioned`` is run
+
+The shadow table's primary key is (id, date) because Postgres requires the
+partition key in every unique constraint, so foreign keys pointing at email
+rows are dropped at the swap (Django still treats ``id`` as the primary key).
+
+``ensure_partitions`` creates upcoming months ahead of time and
+``archive_partitions`` detaches months past the retention window, exports
+them to gzipped CSV and drops them. Both are meant to run from cron via
+``manage.py email_partitions``.
+"""
+import gzip
+import logging
+import os
+import re
+import time
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import sync, timeseries
+
+logger = logging.getLogger(__name__)
+
+TABLE = "mainlogic_email"
+SHADOW = "mainlogic_email_partitioned"
+UNPARTITIONED = "mainlogic_email_unpartitioned"
+DEFAULT_PARTITION = "mainlogic_email_default"
+PROGRESS = "mainlogic_email_partition_progress"
+SEQUENCE = "mainlogic_email_part_id_seq"
+MIRROR_FUNCTION = "mainlogic_email_mirror_to_partitioned"
+MIRROR_TRIGGER = "mainlogic_email_mirror"
+
+PARTITION_RE = re.compile(rf"^{TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+
+def add_months(month, n):
+    years, month_index = divmod(month.month - 1 + n, 12)
+    return date(month.year + years, month_index + 1, 1)
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_y{month.year}m{month.month:02d}"
+
+
+def _bound(month):
+    # Partition bounds are UTC midnights, matching how dates are stored
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def _table_exists(cursor, name):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+    return cursor.fetchone()[0]
+
+
+def is_partitioned(cursor, name=TABLE):
+    cursor.execute(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [name]
+    )
+    row = cursor.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def attached_partitions(cursor, parent=TABLE):
+    cursor.execute(
+        """
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(%s)
+        """,
+        [parent],
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _columns(cursor, table):
+    cursor.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+        """,
+        [table],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def create_month_partition(cursor, month, parent=TABLE):
+    """
+    Create the partition for one month. Rows that already landed in the
+    default partition for that month are moved into it first, since Postgres
+    refuses to attach a range the default partition still holds rows for.
+    """
+    name = partition_name(month)
+    if _table_exists(cursor, name):
+        return False
+    lo, hi = _bound(month), _bound(add_months(month, 1))
+
+    with transaction.atomic():
+        # Hold off inserts routed to the default partition so none can land
+        # in this month's range between the check and the create
+        cursor.execute(f'LOCK TABLE "{DEFAULT_PARTITION}" IN SHARE ROW EXCLUSIVE MODE')
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM "{DEFAULT_PARTITION}" WHERE "date" >= {lo} AND "date" < {hi})'
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{parent}" FOR VALUES FROM ({lo}) TO ({hi})')
+            return True
+
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{parent}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        # The delete leaves sync tombstones for rows that stay live; sync.py skips those
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM "{DEFAULT_PARTITION}" WHERE "date" >= {lo} AND "date" < {hi} RETURNING *
+            )
+            INSERT INTO "{name}" SELECT * FROM moved
+            """
+        )
+        cursor.execute(f'ALTER TABLE "{parent}" ATTACH PARTITION "{name}" FOR VALUES FROM ({lo}) TO ({hi})')
+    return True
+
+
+def _ensure_partitions(cursor, parent, first_month, months_ahead):
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS "{DEFAULT_PARTITION}" PARTITION OF "{parent}" DEFAULT')
+    created = []
+    month = first_month
+    last = add_months(month_start(timezone.now().date()), months_ahead)
+    while month <= last:
+        if create_month_partition(cursor, month, parent):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def ensure_partitions(months_ahead=None):
+    """
+    Make sure the default partition and one partition per month from this
+    month through `months_ahead` months from now exist. Returns the names of
+    the partitions created.
+    """
+    if months_ahead is None:
+        months_ahead = settings.EMAIL_PARTITION_MONTHS_AHEAD
+    with connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return []
+        return _ensure_partitions(cursor, TABLE, month_start(timezone.now().date()), months_ahead)
+
+
+def _create_shadow(cursor, columns, first_month):
+    """Partitioned copy of the email table plus the trigger that keeps it in sync"""
+    cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS "{SEQUENCE}"')
+    cursor.execute(f'CREATE TABLE "{SHADOW}" (LIKE "{TABLE}" INCLUDING DEFAULTS) PARTITION BY RANGE ("date")')
+    cursor.execute(f'ALTER TABLE "{SHADOW}" ALTER COLUMN "id" SET DEFAULT nextval(\'"{SEQUENCE}"\')')
+    cursor.execute(f'ALTER SEQUENCE "{SEQUENCE}" OWNED BY "{SHADOW}"."id"')
+    cursor.execute(f'ALTER TABLE "{SHADOW}" ADD CONSTRAINT "{TABLE}_part_pkey" PRIMARY KEY ("id", "date")')
+    cursor.execute(
+        f'ALTER TABLE "{SHADOW}" ADD CONSTRAINT "{TABLE}_part_user_id_fk" '
+        f'FOREIGN KEY ("user_id") REFERENCES "mainlogic_storymailuser" ("id") DEFERRABLE INITIALLY DEFERRED'
+    )
+
+    # Same secondary indexes as the live table, suffixed until the swap
+    cursor.execute(
+        """
+        SELECT i.indexname, i.indexdef FROM pg_indexes i
+        JOIN pg_class c ON c.relname = i.indexname
+        JOIN pg_index x ON x.indexrelid = c.oid
+        WHERE i.schemaname = current_schema() AND i.tablename = %s AND NOT x.indisunique
+        """,
+        [TABLE],
+    )
+    for name, definition in cursor.fetchall():
+        definition = definition.replace(f"INDEX {name} ON", f'INDEX "{name}_p" ON', 1)
+        definition = re.sub(rf" ON (\S+\.)?{TABLE} ", f' ON "{SHADOW}" ', definition, count=1)
+        cursor.execute(definition)
+
+    _ensure_partitions(cursor, SHADOW, first_month, settings.EMAIL_PARTITION_MONTHS_AHEAD)
+
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS "{PROGRESS}" (copied_through bigint NOT NULL)')
+    cursor.execute(f'INSERT INTO "{PROGRESS}" VALUES (0)')
+
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    new_values = ", ".join(
+        'COALESCE(NEW."date", NEW."created_at")' if c == "date" else f'NEW."{c}"' for c in columns
+    )
+    cursor.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION "{MIRROR_FUNCTION}"() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM "{SHADOW}" WHERE "id" = OLD."id";
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO "{SHADOW}" ({column_list}) VALUES ({new_values});
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    cursor.execute(
+        f'CREATE TRIGGER "{MIRROR_TRIGGER}" AFTER INSERT OR UPDATE OR DELETE ON "{TABLE}" '
+        f'FOR EACH ROW EXECUTE FUNCTION "{MIRROR_FUNCTION}"()'
+    )
+
+
+def _copy_missing_sql(columns, id_filter):
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    select_list = ", ".join(
+        'COALESCE(o."date", o."created_at") AS "date"' if c == "date" else f'o."{c}"' for c in columns
+    )
+    # FOR UPDATE makes concurrent writers to these rows wait until the batch
+    # commits, so the mirror trigger always applies their change afterwards
+    return f"""
+        WITH src AS (
+            SELECT {select_list} FROM "{TABLE}" o WHERE {id_filter} FOR UPDATE
+        )
+        INSERT INTO "{SHADOW}" ({column_list})
+        SELECT * FROM src WHERE NOT EXISTS (SELECT 1 FROM "{SHADOW}" n WHERE n."id" = src."id")
+    """
+
+
+def convert_to_partitioned(batch_size=5000, pause=0.05, log=print):
+    """Online conversion of the email table to a month-partitioned one (resumable)"""
+    with connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            log(f"{TABLE} is already partitioned")
+            return
+        columns = _columns(cursor, TABLE)
+
+        # Email dates go back before signup (imported mail), so start from the
+        # oldest date within a year of the first arrival; anything older is rare
+        # enough for the default partition
+        cursor.execute(
+            f'SELECT min("date") FROM "{TABLE}" '
+            f'WHERE "date" >= (SELECT min("created_at") FROM "{TABLE}") - interval \'1 year\''
+        )
+        first_date = cursor.fetchone()[0]
+        first_month = month_start(first_date.date() if first_date else timezone.now().date())
+
+        if not _table_exists(cursor, SHADOW):
+            with transaction.atomic():
+                _create_shadow(cursor, columns, first_month)
+            log(f"Created {SHADOW} and mirror trigger")
+
+        cursor.execute(f'SELECT max("id") FROM "{TABLE}"')
+        max_id = cursor.fetchone()[0]
+
+    # Batches: rows written from here on are mirrored by the trigger, so only
+    # ids up to the current maximum need copying
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT copied_through FROM "{PROGRESS}"')
+        copied_through = cursor.fetchone()[0]
+        copy_batch = _copy_missing_sql(columns, 'o."id" > %s AND o."id" <= %s')
+        while max_id and copied_through < max_id:
+            upper = copied_through + batch_size
+            with transaction.atomic():
+                cursor.execute(copy_batch, [copied_through, upper])
+                cursor.execute(f'UPDATE "{PROGRESS}" SET copied_through = %s', [upper])
+            copied_through = upper
+            log(f"Copied through id {min(copied_through, max_id)} of {max_id}")
+            time.sleep(pause)
+
+    # Swap under a short exclusive lock
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE "{TABLE}" IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(_copy_missing_sql(columns, "TRUE"))
+        cursor.execute(f'SELECT (SELECT count(*) FROM "{TABLE}"), (SELECT count(*) FROM "{SHADOW}")')
+        live_count, shadow_count = cursor.fetchone()
+        if live_count != shadow_count:
+            raise RuntimeError(f"Row count mismatch: {TABLE} has {live_count}, {SHADOW} has {shadow_count}")
+
+        cursor.execute(f'SELECT setval(\'"{SEQUENCE}"\', COALESCE((SELECT max("id") FROM "{TABLE}"), 0) + 1, false)')
+        cursor.execute(f'DROP TRIGGER "{MIRROR_TRIGGER}" ON "{TABLE}"')
+        cursor.execute(f'DROP FUNCTION "{MIRROR_FUNCTION}"()')
+
+        # Partitioned tables can't be the target of a foreign key on id alone
+        cursor.execute(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE confrelid = to_regclass(%s) AND contype = 'f'",
+            [TABLE],
+        )
+        for table, constraint in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{constraint}"')
+
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s",
+            [SHADOW],
+        )
+        shadow_indexes = [row[0] for row in cursor.fetchall() if row[0].endswith("_p")]
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{UNPARTITIONED}"')
+        for index in shadow_indexes:
+            original = index[:-2]
+            cursor.execute(f'ALTER INDEX "{original}" RENAME TO "{original[:55]}_unpart"')
+            cursor.execute(f'ALTER INDEX "{index}" RENAME TO "{original}"')
+        cursor.execute(f'ALTER TABLE "{SHADOW}" RENAME TO "{TABLE}"')
+        # Delta sync numbering moves to the new table (and its partitions)
+        cursor.execute(f'DROP TRIGGER IF EXISTS "{sync.TRIGGER}" ON "{UNPARTITIONED}"')
+        sync.install_trigger(cursor, TABLE)
+        cursor.execute(f'DROP TABLE "{PROGRESS}"')
+    log(f"{TABLE} is now partitioned; the old table is kept as {UNPARTITIONED}")
+
+
+def drop_unpartitioned():
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS "{UNPARTITIONED}"')
+
+
+def _export(cursor, table, archive_dir):
+    """Stream a table to <archive_dir>/<table>.csv.gz, writing to a temp file first"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{table}.csv.gz")
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wb") as out:
+        with cursor.cursor.copy(f'COPY "{table}" TO STDOUT WITH (FORMAT csv, HEADER)') as copy:
+            for block in copy:
+                out.write(block)
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def archive_partitions(retention_months=None, archive_dir=None, log=print):
+    """
+    Detach every monthly partition that ends before the retention window,
+    export it to gzipped CSV and drop it. Tables left detached by an
+    interrupted run are picked up again.
+    """
+    retention_months = retention_months or settings.EMAIL_RETENTION_MONTHS
+    archive_dir = archive_dir or settings.EMAIL_ARCHIVE_DIR
+    if not retention_months:
+        log("No retention period configured; nothing to archive")
+        return []
+    cutoff = add_months(month_start(timezone.now().date()), -retention_months)
+
+    def expired(name):
+        match = PARTITION_RE.match(name)
+        if not match:
+            return False
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        return add_months(month, 1) <= cutoff
+
+    archived = []
+    with connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            log(f"{TABLE} is not partitioned; run 'email_partitions convert' first")
+            return archived
+        for name in sorted(filter(expired, attached_partitions(cursor))):
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+            log(f"Detached {name}")
+
+        cursor.execute(
+            "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition "
+            "AND relnamespace = current_schema()::regnamespace AND relname LIKE %s",
+            [f"{TABLE}_y%"],
+        )
+        for name in sorted(filter(expired, (row[0] for row in cursor.fetchall()))):
+            path = _export(cursor, name, archive_dir)
+            # Dropped rows leave no tombstones, so these users' clients must resync
+            cursor.execute(f'SELECT DISTINCT "user_id" FROM "{name}"')
+            user_ids = [row[0] for row in cursor.fetchall()]
+            sync.raise_floor(user_ids)
+            cursor.execute(f'DROP TABLE "{name}"')
+            timeseries.bump_history(user_ids)
+            archived.append(path)
+            log(f"Archived {name} to {path}")
+    return archived
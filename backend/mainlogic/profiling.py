@@ -0,0 +1,196 @@
+"""
+Opt-in request profiling with a slow-request capture mode.
+
+With PROFILING_ENABLED set, ``ProfilingMiddleware`` records for each request
+the SQL it ran (with timings and repeated-statement counts, to spot N+1
+queries), the outbound HTTP calls it made through ``http_client`` (JWKS,
+Postmark, ...), and, for a PROFILING_SAMPLE_RATE sample of requests, a
+cProfile call profile. A capture is kept when the request was sampled or took
+longer than PROFILING_SLOW_MS, in an in-process ring buffer of the last
+PROFILING_BUFFER_SIZE captures. Staff users browse them at /admin/profiling/.
+
+When PROFILING_ENABLED is off the middleware removes itself at startup
+(MiddlewareNotUsed), so it costs nothing.
+
+cProfile only sees the thread it runs on. For async views that is the event
+loop thread, so the profile also contains other requests served at the same
+time, and ORM work done in sync_to_async threads only shows up as waiting.
+"""
+import collections
+import contextvars
+import cProfile
+import io
+import itertools
+import pstats
+import random
+import re
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404
+from django.shortcuts import render
+from django.utils import timezone
+
+from . import http_client
+
+MAX_QUERIES_KEPT = 500
+PROFILE_LINES = 60
+
+_captures = collections.deque(maxlen=settings.PROFILING_BUFFER_SIZE)
+_captures_lock = threading.Lock()
+_ids = itertools.count(1)
+
+_request_queries = contextvars.ContextVar("profiling_queries", default=None)
+_profile_lock = threading.Lock()
+
+# Literals replaced so statements that only differ in parameters group together
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def _record_query(execute, sql, params, many, context):
+    queries = _request_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.append((sql, time.perf_counter() - start))
+
+
+def _install_query_recorder(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _summarize_queries(queries):
+    repeated = collections.Counter(_LITERALS.sub("?", sql) for sql, _ in queries)
+    return {
+        "query_count": len(queries),
+        "query_ms": round(sum(seconds for _, seconds in queries) * 1000, 2),
+        "queries": [
+            {"sql": sql, "ms": round(seconds * 1000, 2)} for sql, seconds in queries[:MAX_QUERIES_KEPT]
+        ],
+        "repeated_queries": [
+            {"sql": sql, "count": count} for sql, count in repeated.most_common(10) if count > 1
+        ],
+    }
+
+
+def _profile_text(profiler):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return out.getvalue()
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        connection_created.connect(_install_query_recorder, dispatch_uid="profiling_record_queries")
+        # Connections opened before this middleware was loaded
+        for connection in connections.all(initialized_only=True):
+            _install_query_recorder(None, connection)
+
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _start(self):
+        queries, calls = [], []
+        tokens = (_request_queries.set(queries), http_client.call_log.set(calls))
+        profiler = None
+        # cProfile can only run one profiler per process at a time
+        if random.random() < settings.PROFILING_SAMPLE_RATE and _profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return queries, calls, tokens, profiler, time.perf_counter()
+
+    def _finish(self, request, response, state):
+        queries, calls, tokens, profiler, start = state
+        duration = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+        _request_queries.reset(tokens[0])
+        http_client.call_log.reset(tokens[1])
+
+        slow = duration * 1000 >= settings.PROFILING_SLOW_MS
+        if profiler is None and not slow:
+            return
+
+        match = getattr(request, "resolver_match", None)
+        capture = {
+            "id": next(_ids),
+            "timestamp": timezone.now(),
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": match.view_name if match else None,
+            "status": getattr(response, "status_code", None),
+            "duration_ms": round(duration * 1000, 2),
+            "reason": "sampled" if profiler is not None else "slow",
+            "http_calls": calls,
+            "http_ms": round(sum(call["ms"] for call in calls), 2),
+            "profile": _profile_text(profiler) if profiler is not None else None,
+            **_summarize_queries(queries),
+        }
+        with _captures_lock:
+            _captures.append(capture)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = self._start()
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            self._finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = self._start()
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            self._finish(request, response, state)
+
+
+def captures():
+    """Captured requests, newest first"""
+    with _captures_lock:
+        return list(reversed(_captures))
+
+
+@staff_member_required
+def capture_list_view(request):
+    return render(request, "mainlogic/profiling/list.html", {
+        "title": "Request profiles",
+        "captures": captures(),
+        "enabled": settings.PROFILING_ENABLED,
+        "slow_ms": settings.PROFILING_SLOW_MS,
+        "sample_rate": settings.PROFILING_SAMPLE_RATE,
+    })
+
+
+@staff_member_required
+def capture_detail_view(request, capture_id):
+    capture = next((c for c in captures() if c["id"] == capture_id), None)
+    if capture is None:
+        raise Http404("Capture no longer in the buffer")
+    return render(request, "mainlogic/profiling/detail.html", {
+        "title": f"{capture['method']} {capture['path']}",
+        "capture": capture,
+    })
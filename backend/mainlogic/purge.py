@@ -0,0 +1,200 @@
+"""
+Batched deletion of accounts and of emails past their retention
+(``manage.py purge_emails``).
+
+``StoryMailUser.delete()`` cascades through Django's collector: it loads
+every email and digest of the user, sends a signal per row and deletes them
+all in one transaction. For a large mailbox that holds locks and memory for
+minutes. A purge instead:
+
+- deletes one user's emails at a time in keyset order over the (user, date)
+  index, PURGE_BATCH_SIZE rows per short transaction, with a raw DELETE (no
+  objects loaded, no per-row signals). One user per transaction also means
+  the sync trigger locks a single counter row (mainlogic/sync.py).
+- saves its position in a PurgeCheckpoint with every batch, so an
+  interrupted purge resumes where it stopped;
+- sleeps between batches to stay under PURGE_MAX_ROWS_PER_SECOND;
+- invalidates what the skipped signals would have: the response cache, the
+  volume history (mainlogic/timeseries.py) and open dashboards (a resync
+  event).
+
+An account purge then deletes the digests, threads and duplicate clusters
+the same way and finally the user row, whose cascade has little left to
+collect. Retention deletes emails dated before a cutoff for every user,
+recounts their threads and drops duplicate clusters with no newer member;
+the trigger leaves tombstones, so syncing clients learn about the
+deletions. Blobs (attachments, digest PDFs) are shared between emails by
+content hash and are not deleted.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import duplicates, events, response_cache, threads, timeseries
+from .logs import log_event
+from .models import (
+    DigestReport, DuplicateBucket, DuplicateCluster, Email, EmailTombstone, PurgeCheckpoint, StoryMailUser, Thread
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointMismatch(Exception):
+    pass
+
+
+def load_checkpoint(name, options):
+    checkpoint, _ = PurgeCheckpoint.objects.get_or_create(name=name, defaults={"options": options})
+    if checkpoint.finished_at:
+        # Finished purges are records; a new run starts over
+        checkpoint.delete()
+        checkpoint = PurgeCheckpoint.objects.create(name=name, options=options)
+    elif checkpoint.options.get("kind") != options.get("kind"):
+        raise CheckpointMismatch(f"Purge {name!r} was started with {checkpoint.options}")
+    return checkpoint
+
+
+class Purge:
+    def __init__(self, checkpoint, batch_size=None, max_rows_per_second=None, log=print):
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size or settings.PURGE_BATCH_SIZE
+        self.max_rows_per_second = (
+            settings.PURGE_MAX_ROWS_PER_SECOND if max_rows_per_second is None else max_rows_per_second
+        )
+        self.log = log
+
+    def _throttle(self, rows, started):
+        if self.max_rows_per_second:
+            time.sleep(max(0.0, rows / self.max_rows_per_second - (time.monotonic() - started)))
+
+    def _invalidate(self, user):
+        response_cache.bump_generation(user.auth0_id)
+        timeseries.bump_history([user.id])
+
+    def purge_emails(self, user, before=None, drop_tombstones=False):
+        """Delete the user's emails (dated before `before`, if given) batch by batch; returns how many"""
+        checkpoint = self.checkpoint
+        if checkpoint.last_user_id != user.id:
+            checkpoint.last_user_id, checkpoint.last_date, checkpoint.last_id = user.id, None, 0
+        emails = Email.objects.filter(user=user)
+        if before is not None:
+            emails = emails.filter(date__lt=before)
+        deleted = 0
+        while True:
+            started = time.monotonic()
+            batch = emails
+            if checkpoint.last_date is not None:
+                batch = batch.filter(
+                    Q(date__gt=checkpoint.last_date) | Q(date=checkpoint.last_date, id__gt=checkpoint.last_id)
+                )
+            rows = list(batch.order_by("date", "id").values_list("date", "id")[:self.batch_size])
+            if not rows:
+                break
+            ids = [email_id for _, email_id in rows]
+            with transaction.atomic():
+                # The date bounds let Postgres skip partitions outside the batch
+                count = Email.objects.filter(
+                    user=user, date__gte=rows[0][0], date__lte=rows[-1][0], id__in=ids
+                )._raw_delete(Email.objects.db)
+                if drop_tombstones:
+                    # Written by the sync trigger, but nobody is left to sync
+                    EmailTombstone.objects.filter(user_id=user.id, email_id__in=ids)._raw_delete(Email.objects.db)
+                checkpoint.last_date, checkpoint.last_id = rows[-1]
+                checkpoint.deleted_emails += count
+                checkpoint.save()
+            deleted += count
+            self._invalidate(user)
+            self._throttle(len(rows), started)
+        return deleted
+
+    def purge_digests(self, user):
+        deleted = 0
+        while True:
+            started = time.monotonic()
+            ids = list(DigestReport.objects.filter(user=user).order_by("id").values_list("id", flat=True)[:self.batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                count = DigestReport.objects.filter(id__in=ids)._raw_delete(DigestReport.objects.db)
+                self.checkpoint.deleted_digests += count
+                self.checkpoint.save()
+            deleted += count
+            self._throttle(len(ids), started)
+        return deleted
+
+    def purge_threads(self, user):
+        while True:
+            started = time.monotonic()
+            ids = list(Thread.objects.filter(user=user).order_by("id").values_list("id", flat=True)[:self.batch_size])
+            if not ids:
+                break
+            Thread.objects.filter(id__in=ids)._raw_delete(Thread.objects.db)
+            self._throttle(len(ids), started)
+
+    def purge_duplicates(self, user):
+        while True:
+            started = time.monotonic()
+            ids = list(
+                DuplicateCluster.objects.filter(user=user).order_by("id").values_list("id", flat=True)[:self.batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                DuplicateBucket.objects.filter(cluster_id__in=ids)._raw_delete(DuplicateBucket.objects.db)
+                DuplicateCluster.objects.filter(id__in=ids)._raw_delete(DuplicateCluster.objects.db)
+            self._throttle(len(ids), started)
+
+    def _finish(self):
+        self.checkpoint.finished_at = timezone.now()
+        self.checkpoint.save(update_fields=["finished_at", "updated_at"])
+
+    def delete_account(self, user):
+        """Delete the user's emails and digests in batches, then the user"""
+        user_id = user.id
+        self.purge_emails(user, drop_tombstones=True)
+        self.purge_digests(user)
+        self.purge_threads(user)
+        self.purge_duplicates(user)
+        self._invalidate(user)
+        # Cascades to whatever arrived during the purge; also removes the sync rows
+        user.delete()
+        self._finish()
+        log_event(logger, "purge_account", user_id=user_id, emails=self.checkpoint.deleted_emails,
+                  digests=self.checkpoint.deleted_digests)
+        return self.checkpoint
+
+    def retention(self, before):
+        """Delete every user's emails dated before `before`, one user at a time"""
+        checkpoint = self.checkpoint
+        # The user an interrupted run stopped in comes first again
+        users = list(StoryMailUser.objects.filter(id__gte=checkpoint.last_user_id).order_by("id").only("id", "auth0_id"))
+        for user in users:
+            deleted = self.purge_emails(user, before=before)
+            if deleted:
+                threads.recount(user.id)
+                duplicates.prune(user.id, before)
+                # Dashboards sync the deletions from the tombstones
+                events.publish(user.id, events.RESYNC)
+                self.log(f"User {user.id}: {deleted} emails dated before {before:%Y-%m-%d} deleted")
+        self._finish()
+        log_event(logger, "purge_retention", before=before.isoformat(), emails=checkpoint.deleted_emails)
+        return checkpoint
+
+
+def delete_account(user, **kwargs):
+    checkpoint = load_checkpoint(f"account:{user.id}", {"kind": "account", "user_id": user.id})
+    return Purge(checkpoint, **kwargs).delete_account(user)
+
+
+def retention(days=None, **kwargs):
+    """Delete emails older than `days` (EMAIL_RETENTION_DAYS); a resumed run keeps its original cutoff"""
+    days = settings.EMAIL_RETENTION_DAYS if days is None else days
+    before = timezone.now() - timedelta(days=days)
+    checkpoint = load_checkpoint("retention", {"kind": "retention", "days": days, "before": before.isoformat()})
+    return Purge(checkpoint, **kwargs).retention(parse_datetime(checkpoint.options["before"]))
@@ -0,0 +1,45 @@
+"""
+orjson-based JSON rendering for the API.
+
+``ORJSONRenderer`` is DRF's default renderer (REST_FRAMEWORK settings) and
+``FastJsonResponse`` replaces ``JsonResponse`` in the async views, so every
+API response is serialized by orjson, several times faster than the stdlib
+encoder on the email list and digest payloads (benchmarks/serialization.py).
+
+Types orjson doesn't know (Decimal, lazy translation strings, querysets, ...)
+fall back to DRF's encoder. Datetimes are written by orjson: ISO 8601 with
+microseconds and ``Z`` for UTC.
+"""
+import orjson
+from django.http import HttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+_fallback = JSONEncoder().default
+
+
+def dumps(data):
+    return orjson.dumps(data, default=_fallback, option=OPTIONS)
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+    format = "json"
+    charset = None  # orjson always writes UTF-8; JSON has no charset parameter
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return dumps(data)
+
+
+class FastJsonResponse(HttpResponse):
+    """Drop-in for django.http.JsonResponse serialized with orjson"""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError("In order to allow non-dict objects to be serialized set the safe parameter to False.")
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
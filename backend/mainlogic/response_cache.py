@@ -0,0 +1,147 @@
+"""
+Per-user response cache for read endpoints.
+
+Cached responses are keyed by the user's Auth0 id plus a per-user generation
+counter. Any write to one of the user's emails or digests bumps the counter,
+so stale entries are never read again and simply expire. A repeat request
+therefore costs two cache lookups and no database queries.
+
+Every cached response carries an ETag (a hash of its body); a request with a
+matching If-None-Match gets an empty 304 instead.
+
+Writes happen in every process (web workers, llm_worker, backfill_emails,
+purge_emails), so the counters only work in a cache they all share. Without
+one (CACHE_SHARED is false) responses aren't cached at all.
+"""
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.response import Response
+
+
+def _generation_key(auth0_id):
+    return f"resp-gen:{auth0_id}"
+
+
+def get_generation(auth0_id):
+    key = _generation_key(auth0_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the clock rather than 0 so a counter that was evicted
+        # can never come back to a value that old entries were cached under
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(auth0_id):
+    """Invalidate every cached response for this user"""
+    if not auth0_id:
+        return
+    key = _generation_key(auth0_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def _etag(data):
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def _etag_matches(if_none_match, etag):
+    """Weak comparison, as If-None-Match requires; compressed responses carry W/ ETags"""
+    if not if_none_match:
+        return False
+    return any(
+        candidate.strip().removeprefix("W/") == etag or candidate.strip() == "*"
+        for candidate in if_none_match.split(",")
+    )
+
+
+def _with_etag(response, etag):
+    response["ETag"] = etag
+    # Let browsers keep the body but revalidate with If-None-Match every time
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def cached_per_user(timeout=None):
+    """
+    Cache a DRF view handler's 200 responses per user and per request path.
+
+    timeout bounds how stale a time-relative response (e.g. "emails in the
+    last 24 hours") can get, since those change without any write.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            auth0_id = request.user.get("sub")
+            if not auth0_id or not settings.CACHE_SHARED:
+                return view_method(self, request, *args, **kwargs)
+
+            path_hash = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+            key = f"resp:{auth0_id}:{get_generation(auth0_id)}:{path_hash}"
+            if_none_match = request.headers.get("If-None-Match")
+
+            cached = cache.get(key)
+            if cached is not None:
+                etag, data = cached
+                if _etag_matches(if_none_match, etag):
+                    return _with_etag(Response(status=304), etag)
+                return _with_etag(Response(data), etag)
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+            etag = _etag(response.data)
+            cache.set(key, (etag, response.data), timeout or settings.RESPONSE_CACHE_TIMEOUT)
+            if _etag_matches(if_none_match, etag):
+                return _with_etag(Response(status=304), etag)
+            return _with_etag(response, etag)
+        return wrapper
+    return decorator
+
+
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    messages = []
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if settings.CACHE_SHARED and backend in PROCESS_LOCAL_CACHES:
+        messages.append(checks.Warning(
+            "CACHE_SHARED is set but the default cache is process-local",
+            hint="Only a single-process server sees every invalidation; set REDIS_URL for more processes.",
+            id="mainlogic.W001",
+        ))
+    if settings.DB_REPLICA_HOSTS and not settings.CACHE_SHARED:
+        messages.append(checks.Warning(
+            "DB_REPLICA_HOSTS is set but replicas are not read from without a shared cache",
+            hint="Set REDIS_URL so read-your-writes pins reach every process.",
+            id="mainlogic.W002",
+        ))
+    return messages
+
+
+@receiver(post_save, dispatch_uid="response_cache_bump_on_save")
+@receiver(post_delete, dispatch_uid="response_cache_bump_on_delete")
+def bump_owner_generation(sender, instance, **kwargs):
+    from .models import DigestReport, Email, owner_auth0_id
+
+    if sender in (Email, DigestReport):
+        bump_generation(owner_auth0_id(instance))
@@ -0,0 +1,183 @@
+"""
+Delta sync of a user's emails (Postgres only).
+
+Every insert, real update and delete of an email takes the next number from
+the owner's counter (EmailSyncState.seq) in a database trigger, so bulk
+updates, ``.update()`` calls and raw SQL are covered as well as ``save()``.
+Inserted and updated rows store it in ``change_seq``; deleted rows leave an
+EmailTombstone carrying it. The counter row stays locked until the writing
+transaction commits, so a user's changes become visible strictly in
+``change_seq`` order and a client that has seen everything up to N never
+misses a later commit with a lower number.
+
+A client keeps the opaque cursor from its last response and asks for what
+changed after it (GET /api/sync/?cursor=...). Tombstones are pruned after
+SYNC_TOMBSTONE_DAYS (``manage.py prune_tombstones``) and archived partitions
+drop rows without tombstones (mainlogic/partitions.py); both raise the
+user's floor_seq and epoch, and a cursor from an older epoch below the floor
+is answered with 410 so the client starts over without a cursor.
+"""
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import F, Max
+from django.db.models.functions import Greatest, Substr
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Email, EmailSyncState, EmailTombstone, StoryMailUser
+
+TRIGGER = "mainlogic_email_sync"
+TRIGGER_FUNCTION = "mainlogic_email_sync"
+
+# Characters of text_body sent as the list preview; bodies come from the detail endpoint
+PREVIEW_CHARS = 300
+
+_CURSOR_RE = re.compile(r"^(\d+)\.(\d+)$")
+
+
+class StaleCursor(Exception):
+    """The client's cursor predates changes that can no longer be replayed"""
+
+
+def encode_cursor(seq, epoch):
+    return f"{seq}.{epoch}"
+
+
+def decode_cursor(value):
+    """(seq, epoch) from a cursor string; (0, 0) for no cursor. Raises ValueError if malformed"""
+    if not value:
+        return 0, 0
+    match = _CURSOR_RE.match(value)
+    if not match:
+        raise ValueError(f"Invalid sync cursor {value!r}")
+    return int(match.group(1)), int(match.group(2))
+
+
+def _state(db, user):
+    state = EmailSyncState.objects.using(db).filter(user_id=user.pk).first()
+    return state or EmailSyncState(user_id=user.pk)
+
+
+def _email_entry(email):
+    return {
+        "id": email.id,
+        "from_email": email.from_email,
+        "from_name": email.from_name,
+        "to_email": email.to_email,
+        "subject": email.subject,
+        "date": email.date,
+        "preview": email.preview,
+        "summary": email.summary,
+        "category": email.category,
+        "thread_id": email.thread_id,
+        "updated_at": email.updated_at,
+    }
+
+
+def changes_since(user, cursor, limit):
+    """
+    Emails changed and deleted after `cursor`, oldest change first, at most
+    `limit` entries. Raises ValueError for a malformed cursor and StaleCursor
+    when the client has to resync from scratch.
+    """
+    seq, epoch = decode_cursor(cursor)
+    # Every query goes to the same database so they agree on what's committed
+    db = router.db_for_read(Email) or "default"
+
+    # Everything up to the counter's current value is committed, so the page
+    # is bounded by it: changes committing while we read are left for the
+    # next request instead of being skipped by a cursor that moved past them
+    upper = _state(db, user).seq
+    emails = list(
+        Email.objects.using(db)
+        .filter(user=user, change_seq__gt=seq, change_seq__lte=upper)
+        .only("id", "from_email", "from_name", "to_email", "subject", "date",
+              "summary", "category", "thread_id", "updated_at", "change_seq")
+        .annotate(preview=Substr("text_body", 1, PREVIEW_CHARS))
+        .order_by("change_seq")[:limit + 1]
+    )
+    tombstones = list(
+        EmailTombstone.objects.using(db)
+        .filter(user=user, change_seq__gt=seq, change_seq__lte=upper)
+        .order_by("change_seq")
+        .values_list("change_seq", "email_id")[:limit + 1]
+    )
+
+    # Checked after reading, so tombstones pruned meanwhile can't go unnoticed
+    state = _state(db, user)
+    if cursor and epoch < state.epoch and seq < state.floor_seq:
+        raise StaleCursor(cursor)
+
+    merged = sorted(
+        [(email.change_seq, email) for email in emails] + [(change_seq, None) for change_seq, _ in tombstones],
+        key=lambda entry: entry[0],
+    )
+    has_more = len(merged) > limit
+    page = merged[:limit]
+    last_seq = page[-1][0] if page else seq
+    page_seqs = {change_seq for change_seq, _ in page}
+
+    deleted = [email_id for change_seq, email_id in tombstones if change_seq in page_seqs]
+    if deleted:
+        # An update that moves a row to another date partition is a delete
+        # plus an insert for Postgres, which leaves a tombstone for a live row
+        live = set(Email.objects.using(db).filter(user=user, id__in=deleted).values_list("id", flat=True))
+        deleted = [email_id for email_id in deleted if email_id not in live]
+
+    return {
+        "emails": [_email_entry(email) for _, email in page if email is not None],
+        "deleted": deleted,
+        "cursor": encode_cursor(last_seq, state.epoch),
+        "has_more": has_more,
+    }
+
+
+def raise_floor(user_ids, using="default"):
+    """Make every outstanding cursor of these users resync (their data changed without tombstones)"""
+    # Above the last change handed out, so even fully synced cursors are stale
+    EmailSyncState.objects.using(using).filter(user_id__in=user_ids).update(
+        floor_seq=F("seq") + 1, epoch=F("epoch") + 1
+    )
+
+
+def prune_tombstones(days=None):
+    """Delete tombstones older than `days` (SYNC_TOMBSTONE_DAYS); returns how many were deleted"""
+    days = settings.SYNC_TOMBSTONE_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    pruned = (
+        EmailTombstone.objects.filter(deleted_at__lt=cutoff)
+        .values("user_id")
+        .annotate(max_seq=Max("change_seq"))
+        .order_by("user_id")
+    )
+    deleted = 0
+    # One short transaction per user, so no write waits on more than one counter lock
+    for row in pruned:
+        with transaction.atomic():
+            EmailSyncState.objects.filter(user_id=row["user_id"]).update(
+                floor_seq=Greatest(F("floor_seq"), row["max_seq"]), epoch=F("epoch") + 1
+            )
+            count, _ = EmailTombstone.objects.filter(
+                user_id=row["user_id"], change_seq__lte=row["max_seq"]
+            ).delete()
+            deleted += count
+    return deleted
+
+
+def install_trigger(cursor, table):
+    """Attach the sync trigger (created by migration 0009) to `table`, e.g. after the partition swap"""
+    cursor.execute(
+        f'CREATE TRIGGER "{TRIGGER}" BEFORE INSERT OR UPDATE OR DELETE ON "{table}" '
+        f'FOR EACH ROW EXECUTE FUNCTION "{TRIGGER_FUNCTION}"()'
+    )
+
+
+@receiver(post_delete, sender=StoryMailUser, dispatch_uid="sync_cleanup_on_user_delete")
+def delete_sync_rows(sender, instance, **kwargs):
+    # Written by the trigger while the user's emails were being deleted
+    EmailTombstone.objects.filter(user_id=instance.pk).delete()
+    EmailSyncState.objects.filter(user_id=instance.pk).delete()
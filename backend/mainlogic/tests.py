@@ -1,3 +1,526 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from datetime import timedelta
+
+from django.core.handlers.asgi import ASGIHandler
+from django.db import transaction
+from django.utils import timezone
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import blobstore, duplicates, inbound, llm_queue, sync
+from .models import DuplicateBucket, DuplicateCluster, Email, EmailTombstone, StoryMailUser
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Slow-to-import SDKs that must only be loaded on first use
+LAZY_MODULES = ("google.generativeai", "reportlab", "authlib")
+
+# What a web or worker process imports before it can serve: settings, apps,
+# every view module (via the URLconf) and the background job modules
+STARTUP_CODE = (
+    "import django; django.setup(); "
+    "import backend.urls, backend.asgi, mainlogic.llm_queue, mainlogic.backfill"
+)
+
+# Cumulative import time of the URLconf; about 80ms today, over 500ms while
+# google.generativeai was imported eagerly
+URLCONF_IMPORT_BUDGET_US = 300_000
+
+
+def import_times(code):
+    """Run `code` in a fresh interpreter with -X importtime; returns {module: cumulative microseconds}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, env=os.environ.copy(), capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class StartupImportTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.times = import_times(STARTUP_CODE)
+
+    def test_heavy_sdks_are_imported_lazily(self):
+        loaded = sorted(
+            name for name in self.times
+            if any(name == module or name.startswith(module + ".") for module in LAZY_MODULES)
+        )
+        self.assertEqual(loaded, [], "imported at startup; import them where they are first used")
+
+    def test_urlconf_import_time_budget(self):
+        self.assertLess(
+            self.times["backend.urls"], URLCONF_IMPORT_BUDGET_US,
+            "importing the views got slower; check `python -X importtime` for the new heavy import",
+        )
+
+
+def job(user_id, cost=100):
+    return llm_queue.Job(None, user_id, None, cost, "small")
+
+
+class DeficitRoundRobinTests(SimpleTestCase):
+    def test_light_user_is_not_stuck_behind_heavy_backlog(self):
+        scheduler = llm_queue.DeficitRoundRobin(quantum=100)
+        for _ in range(50):
+            scheduler.push("heavy", job("heavy"))
+        scheduler.push("light", job("light"))
+        order = [scheduler.pop().user_id for _ in range(4)]
+        self.assertEqual(order, ["heavy", "light", "heavy", "heavy"])
+        self.assertEqual(len(scheduler), 47)
+
+    def test_cost_limits_share_per_round(self):
+        scheduler = llm_queue.DeficitRoundRobin(quantum=100)
+        for _ in range(4):
+            scheduler.push("long", job("long", cost=200))
+            scheduler.push("short", job("short", cost=50))
+        order = [scheduler.pop().user_id for _ in range(6)]
+        # Two short emails per round for every long one every other round
+        self.assertEqual(order, ["short", "short", "long", "short", "short", "long"])
+
+    def test_empty(self):
+        self.assertIsNone(llm_queue.DeficitRoundRobin(quantum=100).pop())
+
+
+class UserQuotaTests(SimpleTestCase):
+    def test_exhausted_then_refilled(self):
+        quota = llm_queue.UserQuota(per_hour=3600)
+        self.assertEqual(quota.available(1), 3600)
+        quota.take(1, 3600)
+        self.assertEqual(quota.available(1), 0)
+        self.assertEqual(quota.available(2), 3600)
+        now = time.monotonic()
+        with mock.patch.object(llm_queue.time, "monotonic", return_value=now + 10):
+            self.assertEqual(quota.available(1), 10)
+        with mock.patch.object(llm_queue.time, "monotonic", return_value=now + 7200):
+            self.assertEqual(quota.available(1), 3600)
+
+    def test_unlimited(self):
+        quota = llm_queue.UserQuota(per_hour=0)
+        quota.take(1, 10 ** 6)
+        self.assertEqual(quota.available(1), float("inf"))
+
+
+class FinishedTask:
+    def __init__(self, exception=None):
+        self._exception = exception
+
+    def cancelled(self):
+        return False
+
+    def exception(self):
+        return self._exception
+
+
+@override_settings(LLM_USER_QUOTA_PER_HOUR=0, LLM_WORKER_RETRY_DELAY=30, LLM_WORKER_RETRY_MAX_DELAY=3600)
+class WorkerRetryTests(TestCase):
+    def setUp(self):
+        self.user = StoryMailUser.objects.create(auth0_id="worker-test", email="worker@example.com")
+        self.emails = [
+            Email.objects.create(user=self.user, subject=f"Email {i}", text_body="body", category_source="pending")
+            for i in range(4)
+        ]
+        self.worker = llm_queue.Worker(prefetch=2)
+
+    def run_job(self, error=None):
+        job = self.worker.scheduler.pop()
+        self.worker.in_flight[job.user_id] += 1
+        if error is None:
+            self.worker._done(FinishedTask(), job, mock.Mock())
+        else:
+            with self.assertLogs("mainlogic.llm_queue", "ERROR"):
+                self.worker._done(FinishedTask(error), job, mock.Mock())
+        return job.email_id
+
+    def queued_ids(self):
+        return [job.email_id for job in self.worker.scheduler.queues.get(self.user.id, [])]
+
+    def test_failed_email_retried_after_backoff_while_backlog_continues(self):
+        self.assertEqual(self.worker.refill(), 2)
+        failed = self.run_job(TimeoutError("gemini down"))
+        self.assertEqual(self.worker.failures[failed][1], 1)
+
+        # The user still has a backlog, so the cursor stays ahead of the failed email
+        self.worker.refill()
+        self.assertEqual(self.queued_ids(), [self.emails[1].id, self.emails[2].id])
+
+        later = time.monotonic() + 31
+        with mock.patch.object(llm_queue.time, "monotonic", return_value=later):
+            self.run_job()
+            self.worker.refill()
+            self.assertEqual(self.queued_ids(), [self.emails[2].id, failed])
+            # Queued once, not again on every refill
+            self.worker.refill()
+            self.assertEqual(self.queued_ids().count(failed), 1)
+
+    def test_backoff_doubles_up_to_the_maximum(self):
+        self.worker.refill()
+        email_id = self.worker.scheduler.queues[self.user.id][0].email_id
+        delays = []
+        for _ in range(9):
+            self.worker.scheduler.queues[self.user.id].appendleft(llm_queue.Job(email_id, self.user.id, None, 1, "small"))
+            before = time.monotonic()
+            self.run_job(TimeoutError())
+            delays.append(round(self.worker.failures[email_id][2] - before, -1))
+        self.assertEqual(delays, [30, 60, 120, 240, 480, 960, 1920, 3600, 3600])
+
+
+class TrickleStream:
+    """A request body that hands out at most `step` bytes per read"""
+
+    def __init__(self, data, step):
+        self.data = io.BytesIO(data)
+        self.step = step
+
+    def read(self, size=-1):
+        return self.data.read(self.step)
+
+
+def keep_base64(chunks):
+    """Attachment handler that keeps the raw base64 text instead of storing it"""
+    return {"Content": "".join(chunks)}
+
+
+class InboundParserTests(SimpleTestCase):
+    def assertParsesLikeJson(self, text, steps=(1, 2, 3, 5, 7, 64 * 1024)):
+        data = text.encode()
+        for step in steps:
+            with self.subTest(step=step):
+                self.assertEqual(inbound.parse_payload(TrickleStream(data, step), keep_base64), json.loads(text))
+
+    def test_escapes_and_surrogate_pairs(self):
+        text = (
+            r'{"Subject": "Caf\u00e9 \"quoted\" \\ \/ \b\f\n\r\t", '
+            r'"TextBody": "emoji \ud83d\ude00 lone \ud83d end", "Raw": "caf\u00e9 é 😀"}'
+        )
+        self.assertParsesLikeJson(text)
+        payload = inbound.parse_payload(io.BytesIO(text.encode()), keep_base64)
+        self.assertEqual(payload["Subject"], 'Café "quoted" \\ / \b\f\n\r\t')
+        self.assertEqual(payload["TextBody"], "emoji \U0001f600 lone \ud83d end")
+
+    def test_nested_values(self):
+        self.assertParsesLikeJson(json.dumps({
+            "ToFull": [{"Email": "a@example.com", "Name": "A", "MailboxHash": ""}, {"Email": "b@example.com"}],
+            "Headers": [{"Name": "X-Spam", "Value": "No"}],
+            "Nested": {"list": [1, -2.5, 3e2, True, False, None, [], {}, [[["deep"]]]], "empty": ""},
+            "Count": 0,
+        }, indent=2))
+
+    def test_malformed_bodies_raise_value_error(self):
+        bodies = [
+            b"", b"{", b'{"Subject": "unterminated', b'{"Subject": "x"', b'{"Subject" "x"}', b'{"Subject": tru}',
+            b'{"Subject": "x",}', b'{"Subject": "\q"}', b'{"Subject": "\u12"}', b'{"a": 1} {"b": 2}',
+            b"[" * (inbound.MAX_DEPTH + 2),
+        ]
+        for body in bodies:
+            for step in (1, 4096):
+                with self.subTest(body=body[:30], step=step), self.assertRaises(ValueError):
+                    inbound.parse_payload(TrickleStream(body, step), keep_base64)
+
+    def test_max_bytes(self):
+        body = json.dumps({"TextBody": "x" * 1000}).encode()
+        self.assertEqual(inbound.parse_payload(io.BytesIO(body), keep_base64, max_bytes=len(body))["TextBody"],
+                         "x" * 1000)
+        with self.assertRaises(inbound.PayloadTooLarge):
+            inbound.parse_payload(TrickleStream(body, 100), keep_base64, max_bytes=len(body) - 1)
+
+
+class InboundAttachmentTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(BLOB_STORE_DIR=directory.name))
+
+    def test_attachment_streamed_to_blob_store(self):
+        content = bytes(range(256)) * 40 + b"tail"
+        encoded = base64.encodebytes(content).decode()  # MIME style, a line break every 76 characters
+        text = json.dumps({
+            "Subject": "Invoice",
+            "Attachments": [
+                {"Name": "invoice.pdf", "Content": encoded, "ContentType": "application/pdf"},
+                {"Name": "empty.txt", "Content": ""},
+            ],
+        })
+        for step in (1, 3, 5, 77, 4096):
+            with self.subTest(step=step):
+                payload = inbound.parse_payload(TrickleStream(text.encode(), step))
+                attachment, empty = payload["Attachments"]
+                self.assertNotIn("Content", attachment)
+                self.assertEqual(attachment["Name"], "invoice.pdf")
+                self.assertEqual(attachment["ContentSHA256"], hashlib.sha256(content).hexdigest())
+                self.assertEqual(attachment["ContentSize"], len(content))
+                with blobstore.open_blob(attachment["ContentSHA256"]) as f:
+                    self.assertEqual(f.read(), content)
+                self.assertEqual(empty["ContentSize"], 0)
+
+    def test_invalid_base64(self):
+        for content in ("abc", "ab!d"):
+            with self.subTest(content=content), self.assertRaises(ValueError):
+                inbound.parse_payload(io.BytesIO(json.dumps({"Attachments": [{"Content": content}]}).encode()))
+
+
+async def post_asgi(path, chunks, headers=()):
+    """POST `chunks` as a body without Content-Length; returns (status, body)"""
+    chunks = list(chunks)
+    sent = []
+
+    async def receive():
+        if not chunks:
+            await asyncio.Event().wait()  # the client stays connected
+        return {"type": "http.request", "body": chunks.pop(0), "more_body": bool(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": "POST", "path": path, "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json"), *headers], "client": ("127.0.0.1", 1),
+        "server": ("testserver", 80), "scheme": "http", "http_version": "1.1",
+    }
+    await ASGIHandler()(scope, receive, send)
+    return sent[0]["status"], b"".join(message.get("body", b"") for message in sent[1:])
+
+
+class PostmarkInboundLimitsTests(SimpleTestCase):
+    url = "/api/postmark/inbound/"
+
+    async def test_malformed_body_is_400(self):
+        for body in (b'{"Subject": "cut off', b"not json", b"{}}"):
+            with self.subTest(body=body):
+                with self.assertLogs("django.request", "WARNING"):
+                    response = await self.async_client.post(self.url, body, content_type="application/json")
+                self.assertEqual(response.status_code, 400)
+
+    @override_settings(INBOUND_MAX_BODY_BYTES=1000)
+    async def test_declared_length_over_cap_is_413(self):
+        body = json.dumps({"TextBody": "x" * 2000})
+        with self.assertLogs("django.request", "WARNING"):
+            response = await self.async_client.post(self.url, body, content_type="application/json")
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(INBOUND_MAX_BODY_BYTES=1000)
+    async def test_chunked_body_over_cap_is_413(self):
+        body = json.dumps({"TextBody": "x" * 5000}).encode()
+        with self.assertLogs("django.request", "WARNING"):
+            status, content = await post_asgi(
+                self.url, [body[i:i + 700] for i in range(0, len(body), 700)],
+                headers=[(b"transfer-encoding", b"chunked")],
+            )
+        self.assertEqual(status, 413)
+        self.assertEqual(json.loads(content), {"detail": "Payload too large"})
+
+
+RECEIPT = """
+Hi {name}, thanks for your order #{order} placed at {time}. We are getting your items ready
+and will let you know as soon as they ship. Your order total was ${total} including taxes and
+shipping. You can track the status of your order at any time from your account page, where
+you can also change the delivery address or cancel items that have not shipped yet. If you
+have any questions about your order, reply to this email and our support team will help you.
+"""
+
+NEWSLETTER = """
+This week in gardening: how to prepare your beds for winter, which bulbs to plant before the
+first frost, and a reader question about composting kitchen scraps without attracting pests.
+Plus our favourite tools of the season and an interview with a community orchard volunteer.
+"""
+
+
+def receipt(name="Ana", order="10452", time="09:14", total="42.10"):
+    return RECEIPT.format(name=name, order=order, time=time, total=total)
+
+
+class SignatureTests(SimpleTestCase):
+    def test_near_duplicates_are_similar(self):
+        a = duplicates.signature("Your order confirmation", receipt())
+        b = duplicates.signature("Your order confirmation", receipt(name="Bartholomew"))
+        self.assertGreaterEqual(duplicates.similarity(a, b), 0.7)
+        self.assertGreater(len(set(duplicates.band_keys(a)) & set(duplicates.band_keys(b))), 0)
+
+    def test_different_emails_are_not(self):
+        a = duplicates.signature("Your order confirmation", receipt())
+        b = duplicates.signature("Garden notes", NEWSLETTER)
+        self.assertLess(duplicates.similarity(a, b), 0.3)
+        self.assertEqual(set(duplicates.band_keys(a)) & set(duplicates.band_keys(b)), set())
+
+    def test_digits_are_folded(self):
+        self.assertEqual(
+            duplicates.signature("Order 10452", receipt()),
+            duplicates.signature("Order 99", receipt(order="77731", time="23:59", total="1.00")),
+        )
+
+    def test_html_only_body(self):
+        html = f"<html><style>p {{ color: red }}</style><body><p>{receipt()}</p></body></html>"
+        self.assertEqual(duplicates.signature("Receipt", None, html), duplicates.signature("Receipt", receipt()))
+
+    def test_short_text_has_no_signature(self):
+        self.assertIsNone(duplicates.signature("Thanks!", "See you soon"))
+
+
+class DuplicateClusterTests(TestCase):
+    def setUp(self):
+        self.user = StoryMailUser.objects.create(auth0_id="duplicates-test", email="dup@example.com")
+        self.now = timezone.now()
+
+    def add(self, sig, subject="Your order confirmation", **fields):
+        cluster, _ = duplicates.find_cluster(self.user, sig)
+        cluster = duplicates.join(self.user, sig, cluster, self.now, subject)
+        email = Email.objects.create(user=self.user, subject=subject, minhash=sig, duplicate_cluster=cluster, **fields)
+        return cluster, email
+
+    def test_near_duplicate_joins_cluster(self):
+        first = duplicates.signature("Your order confirmation", receipt())
+        self.assertEqual(duplicates.find_cluster(self.user, first), (None, None))
+        cluster, _ = self.add(first)
+        self.assertEqual(DuplicateBucket.objects.filter(cluster=cluster).count(), len(set(duplicates.band_keys(first))))
+
+        second = duplicates.signature("Your order confirmation", receipt(name="Bartholomew", order="2"))
+        found, similarity = duplicates.find_cluster(self.user, second)
+        self.assertEqual(found, cluster)
+        self.assertGreaterEqual(similarity, 0.7)
+        self.add(second)
+        cluster.refresh_from_db()
+        self.assertEqual(cluster.size, 2)
+
+    def test_dissimilar_email_starts_its_own_cluster(self):
+        receipt_cluster, _ = self.add(duplicates.signature("Your order confirmation", receipt()))
+        newsletter_cluster, _ = self.add(duplicates.signature("Garden notes", NEWSLETTER), subject="Garden notes")
+        self.assertNotEqual(receipt_cluster, newsletter_cluster)
+        self.assertEqual(DuplicateCluster.objects.filter(user=self.user).count(), 2)
+
+    def test_other_users_clusters_are_not_matched(self):
+        sig = duplicates.signature("Your order confirmation", receipt())
+        self.add(sig)
+        other = StoryMailUser.objects.create(auth0_id="duplicates-other", email="other@example.com")
+        self.assertEqual(duplicates.find_cluster(other, sig), (None, None))
+
+    def test_label_pending_labels_queued_members(self):
+        sig = duplicates.signature("Your order confirmation", receipt())
+        cluster, first = self.add(sig, category_source="pending")
+        _, queued = self.add(sig, category_source="pending")
+        _, labeled = self.add(sig, category="work", category_source="history", summary="Earlier order")
+
+        first.category, first.summary, first.category_source = "productivity", "Order confirmed", "llm"
+        first.save()
+        self.assertEqual(duplicates.label_pending(first), 1)
+
+        cluster.refresh_from_db()
+        self.assertEqual((cluster.category, cluster.summary), ("productivity", "Order confirmed"))
+        queued.refresh_from_db()
+        self.assertEqual((queued.category, queued.summary, queued.category_source),
+                         ("productivity", "Order confirmed", "duplicate"))
+        labeled.refresh_from_db()
+        self.assertEqual(labeled.category, "work")
+
+    def test_error_summary_is_not_copied(self):
+        sig = duplicates.signature("Your order confirmation", receipt())
+        cluster, first = self.add(sig, category="other", category_source="llm", summary=duplicates.ERROR_SUMMARY)
+        self.add(sig, category_source="pending")
+        self.assertEqual(duplicates.label_pending(first), 0)
+        cluster.refresh_from_db()
+        self.assertIsNone(cluster.category)
+
+
+class EmailSyncTests(TestCase):
+    def setUp(self):
+        self.user = StoryMailUser.objects.create(auth0_id="sync-test", email="sync@example.com")
+        self.emails = [Email.objects.create(user=self.user, subject=f"Email {i}") for i in range(5)]
+        self.ids = [email.id for email in self.emails]
+
+    def sync(self, cursor=None, limit=100, user=None):
+        """Follow has_more to the end; returns (email ids in order, deleted ids, final cursor, pages)"""
+        ids, deleted, pages = [], [], 0
+        while True:
+            result = sync.changes_since(user or self.user, cursor, limit)
+            ids += [entry["id"] for entry in result["emails"]]
+            deleted += result["deleted"]
+            cursor = result["cursor"]
+            pages += 1
+            if not result["has_more"]:
+                return ids, deleted, cursor, pages
+
+    def test_cursor_paging(self):
+        ids, deleted, cursor, pages = self.sync(limit=2)
+        self.assertEqual((ids, deleted, pages), (self.ids, [], 3))
+        self.assertEqual(self.sync(cursor), ([], [], cursor, 1))
+
+        # Only real changes move an email past the cursor, in change order
+        self.emails[3].subject = "Edited"
+        self.emails[3].save()
+        Email.objects.filter(pk=self.emails[1].pk).update(category="work")
+        Email.objects.filter(pk=self.emails[0].pk).update(subject="Email 0")
+        new = Email.objects.create(user=self.user, subject="New")
+        ids, _, cursor, _ = self.sync(cursor, limit=1)
+        self.assertEqual(ids, [self.ids[3], self.ids[1], new.id])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            sync.changes_since(self.user, "not-a-cursor", 10)
+
+    def test_delete_tombstones(self):
+        _, _, cursor, _ = self.sync()
+        self.emails[2].delete()
+        Email.objects.filter(pk=self.ids[4]).delete()
+        ids, deleted, _, _ = self.sync(cursor, limit=1)
+        self.assertEqual((ids, deleted), ([], [self.ids[2], self.ids[4]]))
+
+    def test_moved_emails(self):
+        _, _, cursor, _ = self.sync()
+        other = StoryMailUser.objects.create(auth0_id="sync-other", email="other@example.com")
+        Email.objects.filter(pk=self.emails[0].pk).update(user=other)
+        # A move to another date partition is a delete and an insert of the same row
+        moved = self.emails[1]
+        with transaction.atomic():
+            Email.objects.filter(pk=moved.pk).delete()
+            Email.objects.create(id=moved.id, user=self.user, subject="Repartitioned")
+
+        ids, deleted, _, _ = self.sync(cursor)
+        self.assertEqual((ids, deleted), ([moved.id], [self.emails[0].id]))
+        self.assertEqual(self.sync(user=other)[0], [self.emails[0].id])
+
+    def test_cursor_from_before_prune_must_resync(self):
+        _, _, old_cursor, _ = self.sync()
+        self.emails[0].delete()
+        EmailTombstone.objects.filter(user=self.user).update(deleted_at=timezone.now() - timedelta(days=31))
+        self.emails[1].delete()  # a recent tombstone survives the prune
+
+        self.assertEqual(sync.prune_tombstones(days=30), 1)
+        with self.assertRaises(sync.StaleCursor):
+            sync.changes_since(self.user, old_cursor, 10)
+
+        # Starting over works, and the new cursor sees later changes
+        ids, _, cursor, _ = self.sync()
+        self.assertEqual(ids, self.ids[2:])
+        self.emails[2].delete()
+        self.assertEqual(self.sync(cursor)[:2], ([], [self.ids[2]]))
+
+    def test_cursor_after_pruned_tombstones_still_works(self):
+        self.emails[0].delete()
+        EmailTombstone.objects.filter(user=self.user).update(deleted_at=timezone.now() - timedelta(days=31))
+        _, _, cursor, _ = self.sync()
+        sync.prune_tombstones(days=30)
+        self.emails[1].delete()
+        self.assertEqual(self.sync(cursor)[:2], ([], [self.ids[1]]))
+
+    def test_raise_floor_invalidates_every_cursor(self):
+        _, _, cursor, _ = self.sync()
+        sync.raise_floor([self.user.id])
+        with self.assertRaises(sync.StaleCursor):
+            sync.changes_since(self.user, cursor, 10)
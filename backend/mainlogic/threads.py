@@ -0,0 +1,162 @@
+"""
+Conversation threading at ingest.
+
+A reply's References header lists the Message-IDs of the conversation so
+far, oldest first, and In-Reply-To names its direct parent. An email joins:
+
+1. the thread whose root is its first reference (or In-Reply-To), so a
+   reply that arrives before the message it answers still ends up in the
+   same thread as that message once it comes in;
+2. otherwise the thread of any referenced email we stored, for clients that
+   trim References;
+3. otherwise, for a "Re:"/"Fwd:" subject without usable headers, the most
+   recent thread with the same subject within SUBJECT_WINDOW;
+4. otherwise a new thread rooted at its own Message-ID.
+
+``add_message`` then updates the thread's aggregates under a row lock:
+message count, first and last date, participants and a rolling summary of
+the latest SUMMARY_MESSAGES messages. Chat and digest prompts use
+``collapse`` to send one entry per thread instead of every message.
+"""
+import re
+import uuid
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Email, Thread
+
+MAX_PARTICIPANTS = 20
+SUMMARY_MESSAGES = 3
+SUBJECT_WINDOW = timedelta(days=30)
+
+_MESSAGE_ID_RE = re.compile(r"<[^<>\s]+>")
+_REPLY_PREFIX_RE = re.compile(r"^\s*((re|fwd?|aw|sv|wg)\s*(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+
+
+def _header(data, name):
+    for header in data.get("Headers") or []:
+        if isinstance(header, dict) and (header.get("Name") or "").lower() == name:
+            return header.get("Value") or ""
+    return ""
+
+
+def message_ids(value):
+    """The <...> Message-IDs in a header value, in order"""
+    return _MESSAGE_ID_RE.findall(value or "")
+
+
+def parse_headers(data):
+    """(Message-ID, referenced Message-IDs oldest first) of a Postmark payload"""
+    own = message_ids(_header(data, "message-id"))
+    references = message_ids(_header(data, "references"))
+    for parent in message_ids(_header(data, "in-reply-to"))[:1]:
+        if parent not in references:
+            references.append(parent)
+    return (own[0][:255] if own else None), [reference[:255] for reference in references]
+
+
+def normalize_subject(subject):
+    return _REPLY_PREFIX_RE.sub("", subject or "").strip()[:256]
+
+
+def find_thread(user, data, date):
+    """(thread id, Message-ID) for an incoming email, creating the thread if needed"""
+    message_id, references = parse_headers(data)
+    root = references[0] if references else message_id
+    if root:
+        thread_id = Thread.objects.filter(user=user, root_message_id=root).values_list("id", flat=True).first()
+        if thread_id:
+            return thread_id, message_id
+    if references:
+        thread_id = (
+            Email.objects.filter(user=user, message_id__in=references, thread__isnull=False)
+            .order_by("-date").values_list("thread_id", flat=True).first()
+        )
+        if thread_id:
+            return thread_id, message_id
+
+    subject = normalize_subject(data.get("Subject"))
+    if subject and subject != (data.get("Subject") or "").strip():
+        thread_id = (
+            Thread.objects.filter(user=user, subject__iexact=subject, last_date__gte=date - SUBJECT_WINDOW)
+            .order_by("-last_date").values_list("id", flat=True).first()
+        )
+        if thread_id:
+            return thread_id, message_id
+
+    root = root or f"<storymail-{uuid.uuid4()}>"
+    try:
+        with transaction.atomic():
+            thread = Thread.objects.create(user=user, root_message_id=root, subject=subject, first_date=date,
+                                           last_date=date)
+    except IntegrityError:
+        # Another message of the same conversation got there first
+        thread = Thread.objects.get(user=user, root_message_id=root)
+    return thread.id, message_id
+
+
+def _rolling_summary(thread_id):
+    latest = (
+        Email.objects.filter(thread_id=thread_id).exclude(summary__isnull=True).exclude(summary="")
+        .order_by("-date").values_list("from_name", "from_email", "summary")[:SUMMARY_MESSAGES]
+    )
+    return "\n".join(f"{name or address or 'Unknown'}: {summary}" for name, address, summary in reversed(latest))
+
+
+def add_message(email):
+    """Count a newly stored email in its thread's aggregates"""
+    with transaction.atomic():
+        thread = Thread.objects.select_for_update().get(pk=email.thread_id)
+        if thread.message_count == 0 or email.date < thread.first_date:
+            thread.first_date = email.date
+        if thread.message_count == 0 or email.date >= thread.last_date:
+            thread.last_date = email.date
+            thread.last_email_id = email.id
+        thread.message_count += 1
+        if email.from_email and email.from_email not in thread.participants and len(thread.participants) < MAX_PARTICIPANTS:
+            thread.participants.append(email.from_email)
+        thread.summary = _rolling_summary(thread.id)
+        thread.save()
+
+
+def refresh_summary(thread_id):
+    """Rebuild the rolling summary after a message's summary changed"""
+    if thread_id:
+        Thread.objects.filter(pk=thread_id).update(summary=_rolling_summary(thread_id))
+
+
+def recount(user_id):
+    """Recompute a user's thread counts and dates from their emails (after a purge); drop empty threads"""
+    emails = Email.objects.filter(thread_id=OuterRef("pk")).order_by().values("thread_id")
+    Thread.objects.filter(user_id=user_id).update(
+        message_count=Coalesce(Subquery(emails.annotate(n=Count("id")).values("n")), 0),
+        first_date=Coalesce(Subquery(emails.annotate(d=Min("date")).values("d")), "first_date"),
+        last_date=Coalesce(Subquery(emails.annotate(d=Max("date")).values("d")), "last_date"),
+    )
+    Thread.objects.filter(user_id=user_id, message_count=0)._raw_delete(Thread.objects.db)
+
+
+def collapse(emails):
+    """
+    `emails` (newest first) with the messages of each thread that occurs more
+    than once replaced by one (thread, messages) pair at its newest message
+    """
+    counts = {}
+    for email in emails:
+        if email.thread_id:
+            counts[email.thread_id] = counts.get(email.thread_id, 0) + 1
+    threads = Thread.objects.in_bulk([thread_id for thread_id, count in counts.items() if count > 1])
+    collapsed, seen = [], {}
+    for email in emails:
+        thread = threads.get(email.thread_id)
+        if thread is None:
+            collapsed.append(email)
+        elif email.thread_id in seen:
+            seen[email.thread_id].append(email)
+        else:
+            seen[email.thread_id] = [email]
+            collapsed.append((thread, seen[email.thread_id]))
+    return collapsed
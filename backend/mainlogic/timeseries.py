@@ -0,0 +1,160 @@
+"""
+Email volume per day or week and category (GET /api/stats/timeseries/).
+
+Counts come from one grouped query (``TruncDay``/``TruncWeek`` on
+``Email.date`` in the caller's time zone, using the (user, date) index) over
+only the buckets that aren't cached yet.
+
+Buckets that ended more than SETTLED_AFTER ago are cached one by one under a
+per-user history generation, so a year-long chart costs one ``get_many`` and
+a query for the last bucket or two. New mail is dated "now" and never touches
+a settled bucket. Writes that can (an email dated in the past, a date change,
+a delete, a bulk recategorization, an archived partition) call
+``bump_history`` and the settled buckets are counted again on the next
+request. Without a cache shared by every process (CACHE_SHARED) those bumps
+can't reach the web workers, so every bucket is counted on each request.
+"""
+import time
+import zoneinfo
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncWeek
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Email
+
+GRANULARITIES = {"day": TruncDay, "week": TruncWeek}
+
+# Later than any time zone's bucket end, and than most delayed deliveries
+SETTLED_AFTER = timedelta(days=2)
+
+# Emails without a category yet (pending LLM categorization)
+UNCATEGORIZED = "uncategorized"
+
+
+def _history_key(user_id):
+    return f"ts-gen:{user_id}"
+
+
+def history_generation(user_id):
+    key = _history_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # From the clock, like response_cache, so an evicted counter never reuses old keys
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_history(user_ids):
+    """Recount the settled buckets of these users"""
+    for user_id in user_ids:
+        try:
+            cache.incr(_history_key(user_id))
+        except ValueError:
+            cache.add(_history_key(user_id), time.time_ns(), None)
+
+
+def parse_range(granularity, start=None, end=None, tz=None):
+    """
+    Validated (granularity, first day, last day, time zone) from query
+    parameters; the range defaults to the last 30 days or 26 weeks. Raises
+    ValueError for anything invalid.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    try:
+        tzinfo = zoneinfo.ZoneInfo(tz or "UTC")
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone {tz!r}")
+    last = date.fromisoformat(end) if end else timezone.now().astimezone(tzinfo).date()
+    if start:
+        first = date.fromisoformat(start)
+    else:
+        first = last - (timedelta(days=29) if granularity == "day" else timedelta(weeks=25))
+    if granularity == "week":
+        # Postgres weeks start on Monday
+        first -= timedelta(days=first.weekday())
+    if first > last:
+        raise ValueError("start must not be after end")
+    step = 1 if granularity == "day" else 7
+    if (last - first).days // step + 1 > settings.TIMESERIES_MAX_BUCKETS:
+        raise ValueError(f"At most {settings.TIMESERIES_MAX_BUCKETS} buckets per request")
+    return granularity, first, last, tzinfo
+
+
+def _bucket_days(granularity, first, last):
+    step = timedelta(days=1 if granularity == "day" else 7)
+    days = []
+    while first <= last:
+        days.append(first)
+        first += step
+    return days
+
+
+def _count(user, granularity, tzinfo, first, until):
+    """{bucket day: {category: count}} for buckets from `first` up to (not including) `until`"""
+    counts = {}
+    rows = (
+        Email.objects.filter(
+            user=user,
+            date__gte=datetime.combine(first, datetime.min.time(), tzinfo),
+            date__lt=datetime.combine(until, datetime.min.time(), tzinfo),
+        )
+        .annotate(bucket=GRANULARITIES[granularity]("date", tzinfo=tzinfo))
+        .values("bucket", "category")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    for row in rows:
+        bucket = counts.setdefault(row["bucket"].astimezone(tzinfo).date(), {})
+        category = row["category"] or UNCATEGORIZED
+        bucket[category] = bucket.get(category, 0) + row["count"]
+    return counts
+
+
+def volume(user, granularity, first, last, tzinfo):
+    """Email counts per bucket and category, oldest bucket first"""
+    days = _bucket_days(granularity, first, last)
+    step = timedelta(days=1 if granularity == "day" else 7)
+    settled_before = (timezone.now() - SETTLED_AFTER).astimezone(tzinfo).date()
+    settled = [day for day in days if day + step <= settled_before] if settings.CACHE_SHARED else []
+
+    prefix = f"ts:{user.id}:{history_generation(user.id)}:{granularity}:{tzinfo.key}:"
+    cached = cache.get_many([prefix + day.isoformat() for day in settled])
+    counts = {day: cached[prefix + day.isoformat()] for day in settled if prefix + day.isoformat() in cached}
+
+    missing = [day for day in days if day not in counts]
+    if missing:
+        # One query over the span of missing buckets; usually just the latest few
+        fresh = _count(user, granularity, tzinfo, missing[0], missing[-1] + step)
+        for day in missing:
+            counts[day] = fresh.get(day, {})
+        cache.set_many(
+            {prefix + day.isoformat(): counts[day] for day in missing if day in settled},
+            settings.TIMESERIES_CACHE_TIMEOUT,
+        )
+
+    return [
+        {"start": day.isoformat(), "total": sum(counts[day].values()), "counts": counts[day]}
+        for day in days
+    ]
+
+
+@receiver(post_save, sender=Email, dispatch_uid="timeseries_bump_on_save")
+@receiver(post_delete, sender=Email, dispatch_uid="timeseries_bump_on_delete")
+def bump_on_email_write(sender, instance, created=False, update_fields=None, **kwargs):
+    if instance.user_id is None:
+        return
+    backdated = instance.date is not None and instance.date < timezone.now() - SETTLED_AFTER
+    # An update may have moved the email out of a settled bucket
+    date_changed = kwargs.get("signal") is post_save and not created and (
+        update_fields is None or "date" in update_fields
+    )
+    if backdated or date_changed:
+        bump_history([instance.user_id])
@@ -3,26 +3,38 @@ from django.views.generic import RedirectView
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.http import JsonResponse
+from django.http import Http404, StreamingHttpResponse
 import json
+import orjson
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from custom_auth.authentication import Auth0JWTAuthentication
-from .models import StoryMailUser, Email, DigestReport
+from asgiref.sync import sync_to_async
+from .async_views import AsyncAPIView
+from .db_router import replica_reads
+from .renderers import FastJsonResponse
+from .response_cache import cached_per_user
+from .models import StoryMailUser, Email, DigestReport, Thread, EMAIL_CATEGORIES
+from .classifier import classify_fast, local_summary
+from .digest_pdf import render_digest_pdf
+from . import admission, blobstore, duplicates, events, export, http_client, inbound, metrics, sync, threads, timeseries
+from .logs import log_event
 from django.utils.dateparse import parse_datetime
+import logging
 import os
-import requests
+import time
 from datetime import datetime, timedelta
-import google.generativeai as genai
 import io
 import base64
 from django.template.loader import render_to_string
+from django.db import transaction
 from django.db.models import Count, Avg, F, ExpressionWrapper, fields, Q, FloatField
-from django.db.models.functions import TruncWeek, TruncDay
 
-def get_or_create_user_from_email(email, name=None, picture=None):
-    user, created = StoryMailUser.objects.get_or_create(
+logger = logging.getLogger(__name__)
+
+async def aget_or_create_user_from_email(email, name=None, picture=None):
+    user, created = await StoryMailUser.objects.aget_or_create(
         email=email,
         defaults={
             'name': name or '',
@@ -57,21 +69,32 @@ class UserInfoView(APIView):
 
 # Helper to call Gemini API for summary/category
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-def get_gemini_summary_category(subject, body):
+GEMINI_REQUEST_OPTIONS = {"timeout": settings.GEMINI_TIMEOUT}
+_gemini_configured = False
+# google.generativeai, imported on first use: it takes ~0.5s to import and
+# most processes (management commands, requests that never reach Gemini)
+# don't need it
+genai = None
+
+def get_gemini_model():
     """
-    Uses Google's Gemini AI to categorize and summarize an email
+    Return a Gemini model handle. The SDK is configured once per process:
+    calling genai.configure() again drops its cached clients, so every call
+    would otherwise open a fresh gRPC channel.
     """
-    try:
-        # Configure the Gemini API
+    global _gemini_configured, genai
+    if genai is None:
+        import google.generativeai
+        genai = google.generativeai
+    if not _gemini_configured:
         genai.configure(api_key=GEMINI_API_KEY)
-        
-        # Create the model instance
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
-        # Create the prompt
-        prompt = f"""
+        _gemini_configured = True
+    return genai.GenerativeModel('gemini-2.0-flash')
+
+def build_category_prompt(subject, body):
+    return f"""
         Categorize this email and summarize it in 1-2 sentences. 
-        Categories must be exactly one of these: productivity, scam, newsletters, work, other.
+        Categories must be exactly one of these: {", ".join(EMAIL_CATEGORIES)}.
         
         Subject: {subject}
         Body: {body}
@@ -81,39 +104,74 @@ def get_gemini_summary_category(subject, body):
           "summary": <summary>
         }}
         """
+
+def parse_category_response(response_text, strict=False):
+    """
+    Parse Gemini's JSON answer into a (category, summary) pair. Unparseable
+    answers give a placeholder pair, or raise ValueError if `strict`.
+    """
+    try:
+        # Try to locate JSON in the response if there's surrounding text
+        if '{' in response_text and '}' in response_text:
+            json_start = response_text.find('{')
+            json_end = response_text.rfind('}') + 1
+            json_str = response_text[json_start:json_end]
+            result = json.loads(json_str)
+        else:
+            result = json.loads(response_text)
+            
+        # Ensure category is one of our valid categories
+        category = result.get("category", "other").lower()
+        if category not in EMAIL_CATEGORIES:
+            category = "other"
+        if strict and not isinstance(result.get("summary"), str):
+            raise ValueError("no summary in the response")
+            
+        return category, result.get("summary")
+    except Exception as json_err:
+        logger.warning(f"[Gemini] JSON parsing error: {json_err}")
+        if strict:
+            raise ValueError(f"Unparseable category response: {response_text[:100]!r}") from json_err
+        # Fallback if response isn't proper JSON
+        return "other", f"Summary unavailable. Content: {response_text[:100]}..." if response_text else "No summary available"
+
+def get_gemini_summary_category(subject, body):
+    """
+    Uses Google's Gemini AI to categorize and summarize an email
+    """
+    try:
+        model = get_gemini_model()
         
         # Generate the content
-        response = model.generate_content(prompt)
-        
-        try:
-            # Parse the JSON response
-            import json as pyjson
-            # Extract the text content from the response object
-            response_text = response.text.strip()
-            # Try to locate JSON in the response if there's surrounding text
-            print(f"[Gemini] Raw response text: {response_text}...")  # Debugging output
-            if '{' in response_text and '}' in response_text:
-                json_start = response_text.find('{')
-                json_end = response_text.rfind('}') + 1
-                json_str = response_text[json_start:json_end]
-                result = pyjson.loads(json_str)
-            else:
-                result = pyjson.loads(response_text)
-                
-            # Ensure category is one of our valid categories
-            valid_categories = ["productivity", "scam", "newsletters", "work", "other"]
-            category = result.get("category", "other").lower()
-            if category not in valid_categories:
-                category = "other"
-                
-            return category, result.get("summary")
-        except Exception as json_err:
-            print("[Gemini] JSON parsing error:", json_err)
-            # Fallback if response isn't proper JSON
-            return "other", f"Summary unavailable. Content: {response_text[:100]}..." if response_text else "No summary available"
-            
+        start = time.perf_counter()
+        response = model.generate_content(build_category_prompt(subject, body), request_options=GEMINI_REQUEST_OPTIONS)
+        metrics.observe_llm("category", time.perf_counter() - start, response)
+        return parse_category_response(response.text.strip())
     except Exception as e:
-        print("[Gemini] Error:", e)
+        metrics.LLM_ERRORS.labels(operation="category").inc()
+        logger.error(f"[Gemini] Error: {e}")
+        return "other", "Error generating summary"
+
+async def acall_gemini_category(subject, body, strict=False):
+    """
+    Categorize and summarize an email with Gemini; raises if the call fails,
+    or if `strict` and the answer can't be parsed
+    """
+    model = get_gemini_model()
+    start = time.perf_counter()
+    response = await model.generate_content_async(build_category_prompt(subject, body), request_options=GEMINI_REQUEST_OPTIONS)
+    metrics.observe_llm("category", time.perf_counter() - start, response)
+    return parse_category_response(response.text.strip(), strict=strict)
+
+async def aget_gemini_summary_category(subject, body):
+    """
+    Async version of get_gemini_summary_category for async views
+    """
+    try:
+        return await acall_gemini_category(subject, body)
+    except Exception as e:
+        metrics.LLM_ERRORS.labels(operation="category").inc()
+        logger.error(f"[Gemini] Error: {e}")
         return "other", "Error generating summary"
 
 class DashboardRedirectView(RedirectView):
@@ -121,45 +179,115 @@ class DashboardRedirectView(RedirectView):
         return settings.FRONTEND_URL + '/dashboard/'
     permanent = False
 
-@method_decorator(csrf_exempt, name='dispatch')
-class PostmarkInboundView(APIView):
-    permission_classes = [AllowAny]
-    authentication_classes = []
+class PostmarkInboundView(AsyncAPIView):
+    authenticated = False
 
-    def post(self, request):
+    def parse_body(self, request):
+        # Parsed incrementally in post(), once the request holds an ingest slot
+        return {}
+
+    async def post(self, request):
+        # Bounded in-flight ingestion; excess mail is shed with 429/503 and
+        # Postmark redelivers it later
+        try:
+            async with admission.INGEST.slot():
+                # Attachments are streamed to the blob store instead of being
+                # decoded in memory (mainlogic/inbound.py). Reading the stream
+                # skips DATA_UPLOAD_MAX_MEMORY_SIZE, so cap the size here: up
+                # front when declared, while reading for chunked bodies.
+                if int(request.META.get("CONTENT_LENGTH") or 0) > settings.INBOUND_MAX_BODY_BYTES:
+                    return FastJsonResponse({"detail": "Payload too large"}, status=413)
+                try:
+                    data = await sync_to_async(inbound.parse_payload, thread_sensitive=False)(
+                        request, max_bytes=settings.INBOUND_MAX_BODY_BYTES
+                    )
+                except inbound.PayloadTooLarge:
+                    return FastJsonResponse({"detail": "Payload too large"}, status=413)
+                except ValueError:
+                    return FastJsonResponse({"detail": "JSON parse error"}, status=400)
+                return await self.ingest(data)
+        except admission.Rejected as rejected:
+            log_event(logger, "postmark_shed", reason=rejected.reason,
+                      in_flight=admission.INGEST.in_flight, queued=admission.INGEST.queued,
+                      retry_after=rejected.retry_after)
+            return rejected.response()
+
+    @staticmethod
+    def save_email(signature, cluster, **columns):
+        """Insert the email and join or start its duplicate cluster in one transaction"""
+        with transaction.atomic():
+            if signature:
+                cluster = duplicates.join(columns["user"], signature, cluster, columns["date"], columns["subject"])
+            return Email.objects.create(duplicate_cluster=cluster, minhash=signature, **columns)
+
+    async def ingest(self, data):
         try:
-            data = json.loads(request.body)
-            print('[PostmarkInboundView] Received Postmark inbound email:', data)
             # Find user by To email (first recipient)
             to_email = data.get('ToFull', [{}])[0].get('Email')
             user = None
             if to_email:
-                user = StoryMailUser.objects.filter(email=to_email).first()
+                user = await StoryMailUser.objects.filter(email=to_email).afirst()
                 if not user:
-                    user = get_or_create_user_from_email(to_email)
-                    print(f'[PostmarkInboundView] Created new user for email: {to_email}')
-                else:
-                    print(f'[PostmarkInboundView] Found existing user: {user.email}')
+                    user = await aget_or_create_user_from_email(to_email)
+                    log_event(logger, "postmark_user_created", sample_rate=1, user_id=user.id)
             else:
-                print('[PostmarkInboundView] Warning: No recipient email found in the inbound email')
-            
-            # Call Gemini API for summary/category
-            print('[PostmarkInboundView] Calling Gemini API with subject:', data.get('Subject', ''))
-            category, summary = get_gemini_summary_category(data.get('Subject', ''), data.get('TextBody', ''))
-            print(f'[PostmarkInboundView] Gemini API returned category: {category}, summary: {summary[:50]}...')
+                log_event(logger, "postmark_no_recipient", level=logging.WARNING,
+                          message_id=data.get('MessageID'))
             
             # Parse the date with a fallback to current time if None
             parsed_date = parse_datetime(data.get('Date'))
             if parsed_date is None:
                 from django.utils import timezone
                 parsed_date = timezone.now()
-                print(f'[PostmarkInboundView] Date parsing failed, using current time: {parsed_date}')
+
+            # Near-duplicates of an earlier email reuse its labels (mainlogic/duplicates.py)
+            signature, cluster, similarity = None, None, None
+            if user and settings.DUPLICATES_ENABLED:
+                # Empty (not null) for text too short to compare, so index_duplicates skips it
+                signature = await sync_to_async(duplicates.signature, thread_sensitive=False)(
+                    data.get('Subject'), data.get('TextBody'), data.get('HtmlBody')
+                ) or b''
+                if signature:
+                    # Only a lookup here; the cluster is joined when the email is saved
+                    cluster, similarity = await sync_to_async(duplicates.find_cluster)(user, signature)
+
+            # Label duplicates and obvious emails locally; only uncertain ones go to Gemini
+            duplicate = cluster is not None and bool(cluster.category)
+            fast_result = None if duplicate else await sync_to_async(classify_fast)(user, data)
+            if duplicate:
+                category = cluster.category
+                category_source = 'duplicate'
+                category_confidence = similarity
+                summary = cluster.summary
+            elif fast_result:
+                category = fast_result.category
+                category_source = fast_result.source
+                category_confidence = fast_result.confidence
+                summary = local_summary(data.get('Subject'), data.get('TextBody'))
+            elif settings.LLM_QUEUE_ENABLED:
+                # Labeled by the llm_worker command, fairly across users
+                category = None
+                category_source = 'pending'
+                category_confidence = None
+                summary = local_summary(data.get('Subject'), data.get('TextBody'))
             else:
-                print(f'[PostmarkInboundView] Parsed date: {parsed_date}')
-            
+                async with admission.llm_slot(interactive=False):
+                    category, summary = await aget_gemini_summary_category(data.get('Subject', ''), data.get('TextBody', ''))
+                category_source = 'llm'
+                category_confidence = None
+
+            # Group replies with the conversation they belong to
+            thread_id, message_id = None, None
+            if user:
+                thread_id, message_id = await sync_to_async(threads.find_thread)(user, data, parsed_date)
+
             # Save email
-            email = Email.objects.create(
+            email = await sync_to_async(self.save_email)(
+                signature,
+                cluster,
                 user=user,
+                thread_id=thread_id,
+                message_id=message_id,
                 from_email=data.get('From'),
                 from_name=data.get('FromName'),
                 to_email=to_email,
@@ -169,30 +297,40 @@ class PostmarkInboundView(APIView):
                 html_body=data.get('HtmlBody'),
                 raw_json=data,
                 category=category,
+                category_source=category_source,
+                category_confidence=category_confidence,
                 summary=summary
             )
-            print(f'[PostmarkInboundView] Email saved successfully with ID: {email.id}, category: {category}')
-            return JsonResponse({'status': 'ok'})
+            if thread_id:
+                await sync_to_async(threads.add_message)(email)
+            if email.duplicate_cluster_id and not duplicate:
+                # The first labeled member labels the cluster
+                await sync_to_async(duplicates.record_labels)(email.duplicate_cluster_id, email)
+            log_event(logger, "postmark_email_saved", email_id=email.id, user_id=user.id if user else None,
+                      category=category, category_source=category_source, body_chars=len(data.get('TextBody') or ''))
+            if user:
+                await events.apublish(user.id, events.email_added(email))
+            return FastJsonResponse({'status': 'ok'})
+        except admission.Rejected:
+            raise
         except Exception as e:
-            print('[PostmarkInboundView] Error:', str(e))
-            # Print stack trace for better debugging
-            import traceback
-            print('[PostmarkInboundView] Stack trace:', traceback.format_exc())
-            return JsonResponse({'error': str(e)}, status=400)
+            logger.exception(f'[PostmarkInboundView] Error: {e}')
+            return FastJsonResponse({'error': str(e)}, status=400)
 
 class CategoryStatsView(APIView):
     authentication_classes = [Auth0JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @cached_per_user()
+    @replica_reads
     def get(self, request):
         user_data = request.user
         from mainlogic.models import StoryMailUser, Email
         user = StoryMailUser.objects.filter(auth0_id=user_data.get("sub")).first()
-        categories = ["productivity", "work", "scam", "newsletters", "other"]
-        stats = {cat: 0 for cat in categories}
+        stats = {cat: 0 for cat in EMAIL_CATEGORIES}
         if user:
             qs = Email.objects.filter(user=user)
-            for cat in categories:
+            for cat in EMAIL_CATEGORIES:
                 stats[cat] = qs.filter(category=cat).count()
         return Response(stats)
 
@@ -200,6 +338,7 @@ class EmailListView(APIView):
     authentication_classes = [Auth0JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @replica_reads
     def get(self, request):
         user_data = request.user
         user = StoryMailUser.objects.filter(auth0_id=user_data.get("sub")).first()
@@ -207,16 +346,8 @@ class EmailListView(APIView):
         if category:
             category = category.rstrip("/")  # Remove trailing slash if present
         
-        print(f"[EmailListView] Getting emails for user ID: {user_data.get('sub')} - User found: {user is not None}")
-        print(f"[EmailListView] Category: '{category}'")
-        
         emails = []
         if user and category:
-            # Debug: Count emails for this user and for this specific category
-            total_emails = Email.objects.filter(user=user).count()
-            category_emails = Email.objects.filter(user=user, category=category).count()
-            print(f"[EmailListView] Total emails for user: {total_emails}, emails in category '{category}': {category_emails}")
-            
             qs = Email.objects.filter(user=user, category=category)
             emails = [
                 {
@@ -228,17 +359,95 @@ class EmailListView(APIView):
                     "date": email.date.isoformat(),
                     "text_body": email.text_body,
                     "summary": email.summary,
+                    "thread_id": email.thread_id,
                 }
                 for email in qs.order_by("-date")
             ]
         
-        print(f"[EmailListView] Returning {len(emails)} emails")
+        log_event(logger, "email_list", user_id=user.id if user else None, category=category, count=len(emails))
         return Response(emails)
 
+class ThreadListView(APIView):
+    """
+    The user's conversations, most recently active first, with their
+    aggregates. Paginated by activity: pass the returned next_before as
+    ?before= to get the next page.
+    """
+    authentication_classes = [Auth0JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    max_page_size = 100
+
+    @cached_per_user()
+    @replica_reads
+    def get(self, request):
+        user = StoryMailUser.objects.filter(auth0_id=request.user.get("sub")).first()
+        if not user:
+            return Response({"error": "User not found"}, status=404)
+        try:
+            limit = min(int(request.GET.get("limit", 20)), self.max_page_size)
+            if limit < 1:
+                raise ValueError(limit)
+        except ValueError:
+            return Response({"error": "limit must be a positive integer"}, status=400)
+        before = request.GET.get("before")
+
+        qs = Thread.objects.filter(user=user)
+        if before:
+            before_date, _, before_id = before.partition(",")
+            parsed = parse_datetime(before_date)
+            if parsed is None or not before_id.isdigit():
+                return Response({"error": "before must be a next_before value"}, status=400)
+            qs = qs.filter(Q(last_date__lt=parsed) | Q(last_date=parsed, id__lt=int(before_id)))
+        page = list(qs.order_by("-last_date", "-id")[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        return Response({
+            "threads": [
+                {
+                    "id": thread.id,
+                    "subject": thread.subject,
+                    "message_count": thread.message_count,
+                    "participants": thread.participants,
+                    "first_date": thread.first_date.isoformat(),
+                    "last_date": thread.last_date.isoformat(),
+                    "last_email_id": thread.last_email_id,
+                    "summary": thread.summary,
+                }
+                for thread in page
+            ],
+            "next_before": f"{page[-1].last_date.isoformat()},{page[-1].id}" if has_more else None,
+        })
+
+class ThreadDetailView(APIView):
+    authentication_classes = [Auth0JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @cached_per_user()
+    @replica_reads
+    def get(self, request, thread_id):
+        user = StoryMailUser.objects.filter(auth0_id=request.user.get("sub")).first()
+        thread = Thread.objects.filter(id=thread_id, user=user).first() if user else None
+        if not thread:
+            return Response({"error": "Thread not found"}, status=404)
+        messages = (
+            Email.objects.filter(thread=thread, user=user)
+            .order_by("date")
+            .values("id", "from_email", "from_name", "subject", "date", "summary", "category")
+        )
+        return Response({
+            "id": thread.id,
+            "subject": thread.subject,
+            "message_count": thread.message_count,
+            "participants": thread.participants,
+            "summary": thread.summary,
+            "messages": list(messages),
+        })
+
 class EmailDetailView(APIView):
     authentication_classes = [Auth0JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @cached_per_user()
     def get(self, request, email_id):
         user_data = request.user
         user = StoryMailUser.objects.filter(auth0_id=user_data.get("sub")).first()
@@ -266,41 +475,156 @@ class EmailDetailView(APIView):
         except Email.DoesNotExist:
             return Response({"error": "Email not found or you don't have permission to view it"}, status=404)
 
-class ChatAPIView(APIView):
+class EmailSyncView(APIView):
+    """
+    Emails created, updated or deleted since the client's cursor, so the
+    dashboard can keep a local copy instead of refetching every list
+    (mainlogic/sync.py). Call without a cursor for everything, then pass the
+    returned cursor back; repeat at once while has_more is true. A 410 means
+    the cursor is too old: drop the local copy and start again without one.
+    """
     authentication_classes = [Auth0JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
-    def post(self, request):
+    @replica_reads
+    def get(self, request):
+        try:
+            limit = min(int(request.GET.get("limit", settings.SYNC_PAGE_SIZE)), settings.SYNC_MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError(limit)
+            cursor = request.GET.get("cursor")
+            sync.decode_cursor(cursor)
+        except ValueError:
+            return Response({"error": "limit must be a positive integer and cursor one returned by this endpoint"}, status=400)
+
+        user = StoryMailUser.objects.filter(auth0_id=request.user.get("sub")).first()
+        if not user:
+            return Response({"emails": [], "deleted": [], "cursor": sync.encode_cursor(0, 0), "has_more": False})
+
+        try:
+            result = sync.changes_since(user, cursor, limit)
+        except sync.StaleCursor:
+            return Response({"error": "Sync cursor expired; sync again without a cursor", "reset": True}, status=410)
+        log_event(
+            logger, "email_sync", user_id=user.id, full=not cursor,
+            changed=len(result["emails"]), deleted=len(result["deleted"]),
+        )
+        return Response(result)
+
+class EmailEventsView(AsyncAPIView):
+    """
+    Server-sent events announcing the user's new and newly categorized emails
+    (mainlogic/events.py), so the dashboard can sync when something changes
+    instead of polling. Runs on the ASGI event loop; an idle stream costs no
+    thread or database connection.
+    """
+    async def get(self, request):
+        user = await StoryMailUser.objects.filter(auth0_id=request.user.get("sub")).afirst()
+        if not user:
+            return FastJsonResponse({"error": "User not found"}, status=404)
+
+        response = StreamingHttpResponse(self.stream(user.id), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+        return response
+
+    async def stream(self, user_id):
+        deadline = time.monotonic() + settings.EVENTS_STREAM_MAX_SECONDS
+        async with events.subscribe(user_id) as subscription:
+            log_event(logger, "events_stream_opened", user_id=user_id)
+            yield "retry: 5000\n\n"
+            while (remaining := deadline - time.monotonic()) > 0:
+                event = await subscription.get(min(settings.EVENTS_KEEPALIVE_SECONDS, remaining))
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"event: {event['type']}\ndata: {orjson.dumps(event).decode()}\n\n"
+
+class EmailExportView(AsyncAPIView):
+    """
+    The user's whole mailbox as a download (?format=ndjson|csv|mbox,
+    ?compress=gzip), streamed from a server-side cursor in constant memory
+    """
+    async def get(self, request):
+        fmt = request.GET.get("format", "ndjson")
+        compress = request.GET.get("compress")
+        if fmt not in export.FORMATS or compress not in (None, "", "gzip"):
+            return FastJsonResponse(
+                {"error": f"format must be one of {', '.join(export.FORMATS)} and compress empty or gzip"}, status=400
+            )
+        gzip = compress == "gzip"
+
+        user = await StoryMailUser.objects.filter(auth0_id=request.user.get("sub")).afirst()
+        if not user:
+            return FastJsonResponse({"error": "User not found"}, status=404)
+
+        log_event(logger, "email_export", user_id=user.id, format=fmt, gzip=gzip)
+        chunks = export.export_chunks(export.export_queryset(user), fmt, gzip=gzip)
+        response = StreamingHttpResponse(
+            export.aiter_chunks(chunks), content_type="application/gzip" if gzip else export.FORMATS[fmt][0]
+        )
+        response["Content-Disposition"] = f'attachment; filename="{export.filename(fmt, gzip)}"'
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+def collapse_emails(emails):
+    """Emails (newest first) with conversations and near-duplicates grouped into (thread or cluster, emails) pairs"""
+    return duplicates.collapse(threads.collapse(emails))
+
+def chat_context_entry(entry):
+    if isinstance(entry, Email):
+        return (
+            f"Email: \"{entry.subject}\" (ID: {entry.id})\n"
+            f"From: {entry.from_name} <{entry.from_email}>\n"
+            f"Date: {entry.date}\n"
+            f"Category: {entry.category}\n"
+            f"Summary: {entry.summary}\n"
+        )
+    group, emails = entry
+    if isinstance(group, Thread):
+        return (
+            f"Conversation: \"{group.subject}\" (ID: {emails[0].id}, {group.message_count} messages)\n"
+            f"Participants: {', '.join(group.participants)}\n"
+            f"Latest: {emails[0].date}\n"
+            f"Category: {emails[0].category}\n"
+            f"Summary:\n{group.summary}\n"
+        )
+    return (
+        f"Similar emails: \"{emails[0].subject}\" (IDs: {', '.join(str(email.id) for email in emails)})\n"
+        f"From: {emails[0].from_name} <{emails[0].from_email}>\n"
+        f"Dates: {emails[-1].date} to {emails[0].date}\n"
+        f"Category: {emails[0].category}\n"
+        f"Summary: {emails[0].summary}\n"
+    )
+
+class ChatAPIView(AsyncAPIView):
+    @replica_reads
+    async def post(self, request):
         user_data = request.user
-        user = StoryMailUser.objects.filter(auth0_id=user_data.get("sub")).first()
+        user = await StoryMailUser.objects.filter(auth0_id=user_data.get("sub")).afirst()
         
         if not user:
-            return Response({"error": "User not found"}, status=404)
+            return FastJsonResponse({"error": "User not found"}, status=404)
             
         # Get the query from the request
-        query = request.data.get('query', '')
+        query = self.data.get('query', '')
         if not query:
-            return Response({"error": "No query provided"}, status=400)
+            return FastJsonResponse({"error": "No query provided"}, status=400)
             
         try:
-            # Configure the Gemini API
-            genai.configure(api_key=GEMINI_API_KEY)
-            
             # Fetch user's emails to provide context to Gemini
-            emails = Email.objects.filter(user=user).order_by('-date')[:50]  # Limit to recent 50 emails
+            emails = [
+                email async for email in Email.objects.filter(user=user).order_by('-date')[:50]  # Limit to recent 50 emails
+            ]
             
-            # Create a more user-friendly context with subjects emphasized
+            # Create a more user-friendly context with subjects emphasized;
+            # a conversation or a set of near-duplicates is one entry
             email_context = "\n\n".join([
-                f"Email: \"{email.subject}\" (ID: {email.id})\n"
-                f"From: {email.from_name} <{email.from_email}>\n"
-                f"Date: {email.date}\n"
-                f"Category: {email.category}\n"
-                f"Summary: {email.summary}\n"
-                for email in emails
+                chat_context_entry(entry) for entry in await sync_to_async(collapse_emails)(emails)
             ])
             
             # Create the model instance - using a more capable model for chat
-            model = genai.GenerativeModel('gemini-2.0-flash')
+            model = get_gemini_model()
             
             # Create the prompt with user's emails as context
             system_prompt = f"""
@@ -319,50 +643,79 @@ class ChatAPIView(APIView):
             
             # Generate the content using chat format
             chat = model.start_chat(history=[])
-            response = chat.send_message(
-                system_prompt + f"\n\nUser query: {query}",
-                generation_config={"temperature": 0.2}  # Lower temperature for more factual responses
-            )
+            async with admission.llm_slot(interactive=True):
+                start = time.perf_counter()
+                response = await chat.send_message_async(
+                    system_prompt + f"\n\nUser query: {query}",
+                    generation_config={"temperature": 0.2},  # Lower temperature for more factual responses
+                    request_options=GEMINI_REQUEST_OPTIONS
+                )
+                metrics.observe_llm("chat", time.perf_counter() - start, response)
             
-            return Response({
+            return FastJsonResponse({
                 "response": response.text,
                 "query": query,
                 "emails_processed": len(emails)
             })
             
+        except admission.Rejected as rejected:
+            return rejected.response()
         except Exception as e:
-            print("[ChatAPIView] Error:", str(e))
-            import traceback
-            print("[ChatAPIView] Stack trace:", traceback.format_exc())
-            return Response({"error": f"Error processing query: {str(e)}"}, status=500)
+            metrics.LLM_ERRORS.labels(operation="chat").inc()
+            logger.exception(f"[ChatAPIView] Error: {e}")
+            return FastJsonResponse({"error": f"Error processing query: {str(e)}"}, status=500)
 
-class DigestAPIView(APIView):
-    authentication_classes = [Auth0JWTAuthentication]
-    permission_classes = [IsAuthenticated]
+def digest_pdf_url(digest):
+    return f"/api/digests/{digest.id}/pdf/" if digest.pdf_sha256 else None
 
-    def get_gemini_digest(self, emails):
+class DigestAPIView(AsyncAPIView):
+    async def get_gemini_digest(self, emails):
         """
         Use Gemini API to generate a structured digest of emails
         """
         try:
-            # Configure the Gemini API
-            genai.configure(api_key=GEMINI_API_KEY)
-            
-            # Create the model instance
-            model = genai.GenerativeModel('gemini-2.0-flash')
+            model = get_gemini_model()
             
-            # Format emails for the prompt
+            # Format emails for the prompt; the messages of a conversation
+            # are sent as one entry with the thread's rolling summary, and
+            # near-duplicates as one entry with their count
             email_data = []
-            for email in emails:
+            for entry in await sync_to_async(collapse_emails)(emails):
+                if isinstance(entry, Email):
+                    email = entry
+                    email_data.append({
+                        "subject": email.subject,
+                        "text_body": email.text_body[:200] + "..." if email.text_body and len(email.text_body) > 200 else email.text_body,
+                        "from_email": email.from_email,
+                        "from_name": email.from_name,
+                        "category": email.category,
+                        "date": email.date.isoformat() if email.date else "",
+                    })
+                    continue
+                group, messages = entry
+                if not isinstance(group, Thread):
+                    email_data.append({
+                        "subject": messages[0].subject,
+                        "similar_emails": len(messages),
+                        "text_body": messages[0].text_body[:200] + "..." if messages[0].text_body and len(messages[0].text_body) > 200 else messages[0].text_body,
+                        "from_email": messages[0].from_email,
+                        "from_name": messages[0].from_name,
+                        "category": messages[0].category,
+                        "date": messages[0].date.isoformat(),
+                    })
+                    continue
+                thread = group
                 email_data.append({
-                    "subject": email.subject,
-                    "text_body": email.text_body[:200] + "..." if email.text_body and len(email.text_body) > 200 else email.text_body,
-                    "from_email": email.from_email,
-                    "from_name": email.from_name,
-                    "category": email.category,
-                    "date": email.date.isoformat() if email.date else "",
+                    "subject": thread.subject,
+                    "messages": len(messages),
+                    "participants": thread.participants,
+                    "summary": thread.summary,
+                    "category": messages[0].category,
+                    "date": messages[0].date.isoformat(),
                 })
             
+            category_count_example = ",\n                ".join(f'"{category}": <count>' for category in EMAIL_CATEGORIES)
+
             # Create the prompt with structured task
             prompt = f"""
             Using the last 7 days of email data for a user:
@@ -384,11 +737,7 @@ class DigestAPIView(APIView):
             {{
               "narrative_summary": "...",
               "category_counts": {{
-                "productivity": x,
-                "scam": y,
-                "newsletters": z,
-                "work": w,
-                "other": v
+                {category_count_example}
               }},
               "highlights": [
                 "First highlight",
@@ -401,12 +750,17 @@ class DigestAPIView(APIView):
               }}
             }}
 
+            An entry with a "messages" field is a conversation of that many emails, and one with a
+            "similar_emails" field stands for that many near-identical emails; count each of them.
+
             Here are the emails:
             {json.dumps(email_data, indent=2)}
             """
             
             # Generate the content
-            response = model.generate_content(prompt)
+            start = time.perf_counter()
+            response = await model.generate_content_async(prompt, request_options=GEMINI_REQUEST_OPTIONS)
+            metrics.observe_llm("digest", time.perf_counter() - start, response)
             
             # Parse the JSON response
             response_text = response.text.strip()
@@ -422,9 +776,8 @@ class DigestAPIView(APIView):
                 
             return result
         except Exception as e:
-            print(f"[DigestAPIView] Error generating digest: {e}")
-            import traceback
-            print(traceback.format_exc())
+            metrics.LLM_ERRORS.labels(operation="digest").inc()
+            logger.exception(f"[DigestAPIView] Error generating digest: {e}")
             return {
                 "narrative_summary": f"Error generating digest: {str(e)}",
                 "category_counts": {"error": 1},
@@ -432,126 +785,17 @@ class DigestAPIView(APIView):
                 "clusters": {}
             }
             
-    def generate_pdf(self, digest, digest_data):
-        """Generate a PDF report for the digest"""
-        try:
-            from reportlab.lib.pagesizes import letter
-            from reportlab.lib import colors
-            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            from reportlab.graphics.shapes import Drawing
-            from reportlab.graphics.charts.piecharts import Pie
-            
-            buffer = io.BytesIO()
-            
-            # Create the PDF object
-            doc = SimpleDocTemplate(buffer, pagesize=letter)
-            elements = []
-            
-            # Get styles
-            styles = getSampleStyleSheet()
-            title_style = styles['Heading1']
-            heading2_style = styles['Heading2']
-            normal_style = styles['Normal']
-            
-            # Add title
-            elements.append(Paragraph(f"Email Digest: {digest.start_date} to {digest.end_date}", title_style))
-            elements.append(Spacer(1, 12))
-            
-            # Add narrative summary
-            elements.append(Paragraph("Weekly Summary", heading2_style))
-            elements.append(Paragraph(digest_data.get("narrative_summary", "No summary available"), normal_style))
-            elements.append(Spacer(1, 12))
-            
-            # Create a pie chart for category distribution
-            if "category_counts" in digest_data and digest_data["category_counts"]:
-                elements.append(Paragraph("Email Categories", heading2_style))
-                
-                # Create drawing for pie chart
-                drawing = Drawing(400, 200)
-                category_data = digest_data["category_counts"]
-                
-                # Filter out categories with zero counts
-                category_data = {k: v for k, v in category_data.items() if v > 0}
-                
-                if category_data:
-                    # Create the pie chart
-                    pie = Pie()
-                    pie.x = 150
-                    pie.y = 50
-                    pie.width = 150
-                    pie.height = 150
-                    pie.data = list(category_data.values())
-                    pie.labels = list(category_data.keys())
-                    pie.slices.strokeWidth = 0.5
-                    
-                    # Add some colors
-                    colors_list = [colors.blue, colors.green, colors.red, colors.orange, colors.purple]
-                    for i in range(len(category_data)):
-                        pie.slices[i].fillColor = colors_list[i % len(colors_list)]
-                    
-                    drawing.add(pie)
-                    elements.append(drawing)
-                    elements.append(Spacer(1, 12))
-                    
-                    # Add a table with the category counts
-                    data = [["Category", "Count"]]
-                    for category, count in category_data.items():
-                        data.append([category.capitalize(), str(count)])
-                    
-                    table = Table(data, colWidths=[300, 100])
-                    table.setStyle(TableStyle([
-                        ('BACKGROUND', (0, 0), (1, 0), colors.grey),
-                        ('TEXTCOLOR', (0, 0), (1, 0), colors.whitesmoke),
-                        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ]))
-                    
-                    elements.append(table)
-                    elements.append(Spacer(1, 24))
-            
-            # Add highlights
-            if "highlights" in digest_data and digest_data["highlights"]:
-                elements.append(Paragraph("Email Highlights", heading2_style))
-                for highlight in digest_data["highlights"]:
-                    elements.append(Paragraph(f"• {highlight}", normal_style))
-                elements.append(Spacer(1, 12))
-            
-            # Add clusters
-            if "clusters" in digest_data and digest_data["clusters"]:
-                elements.append(Paragraph("Email Clusters", heading2_style))
-                for cluster_name, items in digest_data["clusters"].items():
-                    elements.append(Paragraph(cluster_name, styles["Heading3"]))
-                    for item in items:
-                        elements.append(Paragraph(f"• {item}", normal_style))
-                    elements.append(Spacer(1, 6))
-            
-            # Build the PDF
-            doc.build(elements)
-            
-            # Get the PDF content
-            buffer.seek(0)
-            return buffer.getvalue()
-        
-        except Exception as e:
-            print(f"[DigestAPIView] Error generating PDF: {e}")
-            import traceback
-            print(traceback.format_exc())
-            return None
-            
-    def send_digest_email(self, user, digest, pdf_content):
+    async def send_digest_email(self, user, digest, pdf_content):
         """Send the digest to the user via email"""
         try:
             if not pdf_content:
-                print("[DigestAPIView] No PDF content to send")
+                logger.warning("[DigestAPIView] No PDF content to send")
                 return False
                 
             # Get the Postmark server token from settings
             postmark_token = getattr(settings, 'POSTMARK_SERVER_TOKEN', None)
             if not postmark_token:
-                print("[DigestAPIView] Postmark token not configured")
+                logger.warning("[DigestAPIView] Postmark token not configured")
                 return False
                 
             # Format dates for email subject
@@ -584,8 +828,9 @@ class DigestAPIView(APIView):
             }
             
             # Send the email via Postmark API
-            response = requests.post(
-                "https://api.postmarkapp.com/email",
+            start = time.perf_counter()
+            response = await http_client.apost(
+                f"{settings.POSTMARK_API_URL}/email",
                 headers={
                     "Accept": "application/json",
                     "Content-Type": "application/json",
@@ -594,26 +839,28 @@ class DigestAPIView(APIView):
                 json=email_data
             )
             
+            metrics.POSTMARK_SEND_SECONDS.labels(outcome="sent" if response.status_code == 200 else "failed").observe(
+                time.perf_counter() - start
+            )
+            
             if response.status_code == 200:
-                print(f"[DigestAPIView] Email sent successfully to {user.email}")
+                log_event(logger, "digest_email_sent", sample_rate=1, user_id=user.id, digest_id=digest.id)
                 return True
             else:
-                print(f"[DigestAPIView] Failed to send email: {response.status_code} - {response.text}")
+                logger.error(f"[DigestAPIView] Failed to send email: {response.status_code} - {response.text}")
                 return False
                 
         except Exception as e:
-            print(f"[DigestAPIView] Error sending email: {e}")
-            import traceback
-            print(traceback.format_exc())
+            logger.exception(f"[DigestAPIView] Error sending email: {e}")
             return False
 
-    def post(self, request):
+    async def post(self, request):
         """Generate a weekly digest for the user"""
         user_data = request.user
-        user = StoryMailUser.objects.filter(auth0_id=user_data.get("sub")).first()
+        user = await StoryMailUser.objects.filter(auth0_id=user_data.get("sub")).afirst()
         
         if not user:
-            return Response({"error": "User not found"}, status=404)
+            return FastJsonResponse({"error": "User not found"}, status=404)
         
         try:
             # Get the date range from request or use default (last 7 days)
@@ -621,64 +868,169 @@ class DigestAPIView(APIView):
             start_date = end_date - timedelta(days=7)
             
             # Override with request dates if provided
-            if request.data.get('start_date'):
-                start_date = datetime.fromisoformat(request.data.get('start_date').replace('Z', '+00:00'))
-            if request.data.get('end_date'):
-                end_date = datetime.fromisoformat(request.data.get('end_date').replace('Z', '+00:00'))
+            if self.data.get('start_date'):
+                start_date = datetime.fromisoformat(self.data.get('start_date').replace('Z', '+00:00'))
+            if self.data.get('end_date'):
+                end_date = datetime.fromisoformat(self.data.get('end_date').replace('Z', '+00:00'))
             
-            # Get emails from the specified date range
-            emails = Email.objects.filter(
-                user=user,
-                date__gte=start_date,
-                date__lte=end_date
-            ).order_by('-date')
+            # Get emails from the specified date range, evaluated once and
+            # reused for the prompt, the stored id list and the count
+            emails = [
+                email async for email in Email.objects.filter(
+                    user=user,
+                    date__gte=start_date,
+                    date__lte=end_date
+                ).only(
+                    'id', 'subject', 'text_body', 'from_email', 'from_name', 'category', 'date', 'thread_id',
+                    'duplicate_cluster_id'
+                ).order_by('-date')
+            ]
             
             if not emails:
-                return Response({"error": "No emails found in the specified date range"}, status=404)
+                return FastJsonResponse({"error": "No emails found in the specified date range"}, status=404)
             
             # Generate digest content using Gemini
-            digest_data = self.get_gemini_digest(emails)
+            async with admission.llm_slot(interactive=True):
+                digest_data = await self.get_gemini_digest(emails)
             
-            # Create a new digest report
-            digest = DigestReport.objects.create(
+            digest = DigestReport(
                 user=user,
                 start_date=start_date.date(),
                 end_date=end_date.date(),
-                summary=json.dumps(digest_data)
+                summary=digest_data.get("narrative_summary", ""),
+                digest_data=digest_data,
+                email_ids=[email.id for email in emails],
+                email_count=len(emails),
             )
             
-            # Associate the emails with the digest
-            digest.emails.set(emails)
+            # Generate PDF of the digest (CPU-bound, so keep it off the event loop)
+            # and keep it so past digests can be downloaded without rebuilding it
+            pdf_content = await sync_to_async(render_digest_pdf, thread_sensitive=False)(digest, digest_data)
+            if pdf_content:
+                digest.pdf_sha256 = await sync_to_async(blobstore.put, thread_sensitive=False)(pdf_content)
             
-            # Generate PDF of the digest
-            pdf_content = self.generate_pdf(digest, digest_data)
+            # Create the digest report with the ids it covers, in one insert
+            await digest.asave()
             
             # Send email with Postmark (if send_email is True in request)
             email_sent = False
-            if request.data.get('send_email', False) and pdf_content:
-                email_sent = self.send_digest_email(user, digest, pdf_content)
-            
-            # Convert PDF to base64 for response if requested
-            pdf_base64 = None
-            if request.data.get('include_pdf', False) and pdf_content:
-                pdf_base64 = base64.b64encode(pdf_content).decode('utf-8')
+            if self.data.get('send_email', False) and pdf_content:
+                email_sent = await self.send_digest_email(user, digest, pdf_content)
             
-            return Response({
+            # The PDF is downloaded separately from pdf_url rather than inlined as base64
+            return FastJsonResponse({
                 "id": digest.id,
                 "start_date": digest.start_date,
                 "end_date": digest.end_date,
                 "digest_data": digest_data,
-                "email_count": emails.count(),
-                "pdf_included": pdf_base64 is not None,
+                "email_count": digest.email_count,
                 "email_sent": email_sent,
-                "pdf_base64": pdf_base64
+                "pdf_url": digest_pdf_url(digest),
             })
         
+        except admission.Rejected as rejected:
+            return rejected.response()
         except Exception as e:
-            print(f"[DigestAPIView] Error: {e}")
-            import traceback
-            print(traceback.format_exc())
-            return Response({"error": f"Error generating digest: {str(e)}"}, status=500)
+            logger.exception(f"[DigestAPIView] Error: {e}")
+            return FastJsonResponse({"error": f"Error generating digest: {str(e)}"}, status=500)
+
+class DigestHistoryView(APIView):
+    """
+    Past digests, newest first. Paginated by id: pass the returned
+    next_before as ?before= to get the next page.
+    """
+    authentication_classes = [Auth0JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    max_page_size = 100
+
+    @cached_per_user()
+    @replica_reads
+    def get(self, request):
+        user = StoryMailUser.objects.filter(auth0_id=request.user.get("sub")).first()
+        if not user:
+            return Response({"error": "User not found"}, status=404)
+
+        try:
+            limit = min(int(request.GET.get("limit", 20)), self.max_page_size)
+            if limit < 1:
+                raise ValueError(limit)
+            before = request.GET.get("before")
+            digests = DigestReport.objects.filter(user=user).order_by("-id")
+            if before:
+                digests = digests.filter(id__lt=int(before))
+        except ValueError:
+            return Response({"error": "limit must be a positive integer and before an integer"}, status=400)
+
+        page = list(
+            digests.only(
+                "id", "start_date", "end_date", "summary", "email_count", "pdf_sha256", "created_at"
+            )[:limit + 1]
+        )
+        has_more = len(page) > limit
+        page = page[:limit]
+        return Response({
+            "results": [
+                {
+                    "id": digest.id,
+                    "start_date": digest.start_date,
+                    "end_date": digest.end_date,
+                    "summary": digest.summary,
+                    "email_count": digest.email_count,
+                    "created_at": digest.created_at,
+                    "pdf_url": digest_pdf_url(digest),
+                }
+                for digest in page
+            ],
+            "next_before": page[-1].id if has_more else None,
+        })
+
+class DigestDetailView(APIView):
+    authentication_classes = [Auth0JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @cached_per_user()
+    def get(self, request, digest_id):
+        digest = DigestReport.objects.filter(id=digest_id, user__auth0_id=request.user.get("sub")).first()
+        if not digest:
+            return Response({"error": "Digest not found"}, status=404)
+
+        return Response({
+            "id": digest.id,
+            "start_date": digest.start_date,
+            "end_date": digest.end_date,
+            "digest_data": digest.digest_data,
+            "email_count": digest.email_count,
+            "created_at": digest.created_at,
+            "pdf_url": digest_pdf_url(digest),
+        })
+
+class DigestPdfView(APIView):
+    """
+    The rendered PDF of a past digest, served from the blob store with
+    Range support. Digests from before PDFs were stored are rendered once
+    from their saved data (the LLM is never called again).
+    """
+    authentication_classes = [Auth0JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, digest_id):
+        digest = DigestReport.objects.filter(id=digest_id, user__auth0_id=request.user.get("sub")).first()
+        if not digest:
+            raise Http404("Digest not found")
+
+        if not blobstore.exists(digest.pdf_sha256):
+            pdf_content = render_digest_pdf(digest, digest.digest_data)
+            if not pdf_content:
+                return Response({"error": "Could not render PDF"}, status=500)
+            digest.pdf_sha256 = blobstore.put(pdf_content)
+            digest.save(update_fields=["pdf_sha256"])
+
+        return blobstore.blob_response(
+            request,
+            digest.pdf_sha256,
+            "application/pdf",
+            filename=f"Email_Digest_{digest.start_date}_to_{digest.end_date}.pdf",
+        )
 
 class DashboardStatsView(APIView):
     """
@@ -687,6 +1039,8 @@ class DashboardStatsView(APIView):
     authentication_classes = [Auth0JWTAuthentication]
     permission_classes = [IsAuthenticated]
     
+    @cached_per_user(timeout=60)  # counts are relative to "now", so keep them fresh
+    @replica_reads
     def get(self, request):
         user_data = request.user
         user = StoryMailUser.objects.filter(auth0_id=user_data.get("sub")).first()
@@ -815,7 +1169,37 @@ class DashboardStatsView(APIView):
             })
                 
         except Exception as e:
-            print(f"[DashboardStatsView] Error: {e}")
-            import traceback
-            print(traceback.format_exc())
-            return Response({"error": f"Error fetching dashboard stats: {str(e)}"}, status=500)
\ No newline at end of file
+            logger.exception(f"[DashboardStatsView] Error: {e}")
+            return Response({"error": f"Error fetching dashboard stats: {str(e)}"}, status=500)
+
+class VolumeTimeseriesView(APIView):
+    """
+    Email counts per day or week and category for charts
+    (?granularity=day|week&start=YYYY-MM-DD&end=YYYY-MM-DD&tz=Europe/Berlin).
+    Past buckets are cached individually, see mainlogic/timeseries.py.
+    """
+    authentication_classes = [Auth0JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @cached_per_user(timeout=60)  # the current bucket is still filling up
+    @replica_reads
+    def get(self, request):
+        try:
+            granularity, first, last, tzinfo = timeseries.parse_range(
+                request.GET.get("granularity", "day"), request.GET.get("start"),
+                request.GET.get("end"), request.GET.get("tz"),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        user = StoryMailUser.objects.filter(auth0_id=request.user.get("sub")).first()
+        if not user:
+            return Response({"error": "User not found"}, status=404)
+
+        return Response({
+            "granularity": granularity,
+            "timezone": tzinfo.key,
+            "start": first.isoformat(),
+            "end": last.isoformat(),
+            "buckets": timeseries.volume(user, granularity, first, last, tzinfo),
+        })
@@ -8,10 +8,11 @@ import { Input } from "@/components/ui/input"
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs"
 import { BarChart3, Search, Filter, Mail, AlertTriangle, Briefcase, BookOpen } from "lucide-react"
 import { EmailList } from "@/components/email-list"
-import { useEffect, useState } from "react"
+import { useCallback, useEffect, useState } from "react"
 import { useAuth } from "@/components/auth-provider"
+import { syncEmails } from "@/lib/email-sync"
+import { useEmailEvents } from "@/hooks/use-email-events"
 
-const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
 const baseCategories = [
 	{
 		id: "productivity",
@@ -54,28 +55,27 @@ export default function CategoriesPage() {
 	const [stats, setStats] = useState<Record<string, number>>({})
 	const { accessToken } = useAuth()
 
-	useEffect(() => {
-		// Get the ID token which is what the backend expects for authentication
-		const idToken = localStorage.getItem('storymail-id-token')
-		
-		fetch(`${API_URL}/api/categories/stats/`, { 
-			headers: {
-				'Authorization': `Bearer ${idToken}`
-			}
-		})
-			.then((res) => {
-				if (!res.ok) {
-					console.error('Failed to fetch categories:', res.status, res.statusText)
-					return {}
+	const refresh = useCallback(() => {
+		// Counted from the locally synced emails instead of a separate stats request
+		syncEmails()
+			.then((emails) => {
+				const counts: Record<string, number> = {}
+				for (const email of emails) {
+					if (email.category) counts[email.category] = (counts[email.category] ?? 0) + 1
 				}
-				return res.json()
+				setStats(counts)
 			})
-			.then((data) => setStats(data || {}))
 			.catch((error) => {
 				console.error('Error fetching categories:', error)
 				setStats({})
 			})
-	}, [accessToken])
+	}, [])
+
+	useEffect(() => {
+		refresh()
+	}, [refresh, accessToken])
+
+	useEmailEvents(refresh)
 
 	return (
 		<DashboardLayout>
@@ -1,6 +1,6 @@
 "use client"
 
-import { useState, useEffect } from "react"
+import { useState, useEffect, useCallback } from "react"
 import { useAuth } from "@/components/auth-provider"
 import { DashboardLayout } from "@/components/dashboard-layout"
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card"
@@ -12,6 +12,7 @@ import { RecentEmails } from "@/components/recent-emails"
 import { CategoryChart } from "@/components/category-chart"
 import { useToast } from "@/components/ui/use-toast"
 import { useRouter } from "next/navigation"
+import { useEmailEvents } from "@/hooks/use-email-events"
 import Link from "next/link"
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
@@ -49,42 +50,45 @@ export default function DashboardPage() {
   const router = useRouter()
 
   // Fetch dashboard stats from the API
-  useEffect(() => {
-    const fetchDashboardStats = async () => {
-      if (!user) return;
+  const fetchDashboardStats = useCallback(async () => {
+    if (!user) return;
+    
+    setIsLoadingStats(true);
+    try {
+      const idToken = localStorage.getItem('storymail-id-token');
       
-      setIsLoadingStats(true);
-      try {
-        const idToken = localStorage.getItem('storymail-id-token');
-        
-        const response = await fetch(`${API_URL}/api/dashboard/stats/`, {
-          headers: {
-            'Authorization': `Bearer ${idToken}`,
-            'Content-Type': 'application/json'
-          }
-        });
-        
-        if (!response.ok) {
-          throw new Error('Failed to fetch dashboard stats');
+      const response = await fetch(`${API_URL}/api/dashboard/stats/`, {
+        headers: {
+          'Authorization': `Bearer ${idToken}`,
+          'Content-Type': 'application/json'
         }
-        
-        const data = await response.json();
-        setStats(data);
-      } catch (error) {
-        console.error('Error fetching dashboard stats:', error);
-        toast({
-          title: "Error loading dashboard",
-          description: "Could not load your dashboard statistics. Please try again later.",
-          variant: "destructive"
-        });
-      } finally {
-        setIsLoadingStats(false);
+      });
+      
+      if (!response.ok) {
+        throw new Error('Failed to fetch dashboard stats');
       }
-    };
-    
-    fetchDashboardStats();
+      
+      const data = await response.json();
+      setStats(data);
+    } catch (error) {
+      console.error('Error fetching dashboard stats:', error);
+      toast({
+        title: "Error loading dashboard",
+        description: "Could not load your dashboard statistics. Please try again later.",
+        variant: "destructive"
+      });
+    } finally {
+      setIsLoadingStats(false);
+    }
   }, [user, toast]);
 
+  useEffect(() => {
+    fetchDashboardStats();
+  }, [fetchDashboardStats]);
+
+  // Counts are refreshed when the server reports new or recategorized emails
+  useEmailEvents(fetchDashboardStats);
+
   // Handle button actions
   const handleGenerateDigest = () => {
     router.push('/digest');
@@ -23,7 +23,7 @@ interface DigestData {
     clusters: { [key: string]: string[] }
   }
   email_count: number
-  pdf_base64?: string
+  pdf_url?: string | null
 }
 
 export default function DigestPage() {
@@ -63,8 +63,7 @@ export default function DigestPage() {
           'Authorization': `Bearer ${idToken}`
         },
         body: JSON.stringify({
-          send_email: sendEmail,
-          include_pdf: true
+          send_email: sendEmail
         })
       })
       
@@ -93,8 +92,8 @@ export default function DigestPage() {
   }
   
   // Download PDF
-  const handleDownloadPDF = () => {
-    if (!digestData || !digestData.pdf_base64) {
+  const handleDownloadPDF = async () => {
+    if (!digestData || !digestData.pdf_url) {
       toast({
         title: "PDF Not Available",
         description: "Please generate a digest first.",
@@ -103,14 +102,22 @@ export default function DigestPage() {
       return
     }
     
-    // Create a blob from base64 data
-    const byteCharacters = atob(digestData.pdf_base64)
-    const byteNumbers = new Array(byteCharacters.length)
-    for (let i = 0; i < byteCharacters.length; i++) {
-      byteNumbers[i] = byteCharacters.charCodeAt(i)
+    // The PDF is served separately as binary rather than inlined in the digest response
+    const idToken = localStorage.getItem('storymail-id-token')
+    const response = await fetch(`${API_URL}${digestData.pdf_url}`, {
+      headers: {
+        'Authorization': `Bearer ${idToken}`
+      }
+    })
+    if (!response.ok) {
+      toast({
+        title: "PDF Not Available",
+        description: `Error downloading PDF: ${response.statusText}`,
+        variant: "destructive"
+      })
+      return
     }
-    const byteArray = new Uint8Array(byteNumbers)
-    const blob = new Blob([byteArray], { type: 'application/pdf' })
+    const blob = await response.blob()
     
     // Create download link
     const link = document.createElement('a')
@@ -174,7 +181,7 @@ export default function DigestPage() {
                   <Mail className="mr-2 h-4 w-4" />
                   Email Digest
                 </Button>
-                <Button onClick={handleDownloadPDF} disabled={generating || !digestData.pdf_base64}>
+                <Button onClick={handleDownloadPDF} disabled={generating || !digestData.pdf_url}>
                   <Download className="mr-2 h-4 w-4" />
                   Download PDF
                 </Button>
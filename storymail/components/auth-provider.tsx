@@ -1,6 +1,7 @@
 "use client"
 
 import { createContext, useContext, useState, useEffect, type ReactNode } from "react"
+import { clearEmailCache } from "@/lib/email-sync"
 
 interface User {
   id: string
@@ -236,6 +237,7 @@ export function AuthProvider({ children }: { children: ReactNode }) {
       // Clear local storage
       localStorage.removeItem('storymail-user')
       localStorage.removeItem('storymail-access-token')
+      clearEmailCache()
       localStorage.removeItem('storymail-id-token')
       localStorage.removeItem('storymail-refresh-token')
       
@@ -250,6 +252,7 @@ export function AuthProvider({ children }: { children: ReactNode }) {
       // Still clear local data even if API call fails
       localStorage.removeItem('storymail-user')
       localStorage.removeItem('storymail-access-token')
+      clearEmailCache()
       setUser(null)
       setAccessToken(null)
       window.location.href = '/'
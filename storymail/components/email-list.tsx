@@ -3,45 +3,27 @@
 import { Card, CardContent } from "@/components/ui/card"
 import { Avatar, AvatarFallback, AvatarImage } from "@/components/ui/avatar"
 import { Paperclip, Star } from "lucide-react"
-import { useEffect, useState } from "react"
+import { useCallback, useEffect, useState } from "react"
 import { useAuth } from "@/components/auth-provider"
 import { useRouter } from "next/navigation"
-
-const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
+import { syncEmails, type SyncedEmail } from "@/lib/email-sync"
+import { useEmailEvents } from "@/hooks/use-email-events"
 
 interface EmailListProps {
   category: string
 }
 
 export function EmailList({ category }: EmailListProps) {
-  const [emails, setEmails] = useState<any[]>([])
+  const [emails, setEmails] = useState<SyncedEmail[]>([])
   const [loading, setLoading] = useState(true)
   const { accessToken } = useAuth()
   const router = useRouter()
   
-  useEffect(() => {
-    setLoading(true)
-    
-    // Get the ID token which is what the backend expects for authentication
-    const idToken = localStorage.getItem('storymail-id-token')
-    
-    console.log(`Fetching emails for category: ${category}`)
-    
-    fetch(`${API_URL}/api/emails/?category=${encodeURIComponent(category)}`, { 
-      headers: {
-        'Authorization': `Bearer ${idToken}`
-      }
-    })
-      .then(res => {
-        if (!res.ok) {
-          console.error('Failed to fetch emails:', res.status, res.statusText)
-          return []
-        }
-        return res.json()
-      })
-      .then(data => {
-        console.log('Received email data:', data)
-        setEmails(data || [])
+  const refresh = useCallback(() => {
+    // Only what changed since the last visit is fetched; the rest comes from the local copy
+    syncEmails()
+      .then(all => {
+        setEmails(all.filter(email => email.category === category))
         setLoading(false)
       })
       .catch((error) => {
@@ -49,7 +31,15 @@ export function EmailList({ category }: EmailListProps) {
         setEmails([])
         setLoading(false)
       })
-  }, [category, accessToken])
+  }, [category])
+
+  useEffect(() => {
+    setLoading(true)
+    refresh()
+  }, [refresh, accessToken])
+
+  // New and recategorized emails are pushed by the server instead of polled for
+  useEmailEvents(refresh)
 
   const handleEmailClick = (emailId: number) => {
     router.push(`/email/${emailId}`)
@@ -70,7 +60,7 @@ export function EmailList({ category }: EmailListProps) {
           <CardContent className="p-4">
             <div className="flex items-start space-x-3">
               <Avatar className="h-10 w-10">
-                <AvatarImage src={email.avatar || "/placeholder.svg"} />
+                <AvatarImage src="/placeholder.svg" />
                 <AvatarFallback>
                   {email.from_name
                     ? email.from_name.split(" ").map((n: string) => n[0]).join("")
@@ -90,7 +80,7 @@ export function EmailList({ category }: EmailListProps) {
                   </div>
                 </div>
                 <h3 className="text-sm mb-1 font-semibold">{email.subject}</h3>
-                <p className="text-sm text-muted-foreground line-clamp-2">{email.text_body || email.summary}</p>
+                <p className="text-sm text-muted-foreground line-clamp-2">{email.preview || email.summary}</p>
               </div>
             </div>
           </CardContent>
@@ -1,11 +1,12 @@
 "use client"
 
-import { useState, useEffect } from "react"
+import { useState, useEffect, useCallback } from "react"
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card"
 import { Badge } from "@/components/ui/badge"
 import { Avatar, AvatarFallback, AvatarImage } from "@/components/ui/avatar"
 import { Skeleton } from "@/components/ui/skeleton"
 import { useRouter } from "next/navigation"
+import { useEmailEvents } from "@/hooks/use-email-events"
 
 interface Email {
   id: number;
@@ -78,38 +79,40 @@ export function RecentEmails({ isLoading = false }: RecentEmailsProps) {
     }
   };
 
-  useEffect(() => {
-    const fetchRecentEmails = async () => {
-      if (isLoading) return;
+  const fetchRecentEmails = useCallback(async () => {
+    if (isLoading) return;
+    
+    try {
+      const idToken = localStorage.getItem('storymail-id-token');
       
-      setLoading(true);
-      try {
-        const idToken = localStorage.getItem('storymail-id-token');
-        
-        const response = await fetch(`${API_URL}/api/emails/?limit=5`, {
-          headers: {
-            'Authorization': `Bearer ${idToken}`,
-            'Content-Type': 'application/json'
-          }
-        });
-        
-        if (!response.ok) {
-          throw new Error('Failed to fetch recent emails');
+      const response = await fetch(`${API_URL}/api/emails/?limit=5`, {
+        headers: {
+          'Authorization': `Bearer ${idToken}`,
+          'Content-Type': 'application/json'
         }
-        
-        const data = await response.json();
-        setEmails(data);
-      } catch (error) {
-        console.error('Error fetching recent emails:', error);
-        setError('Could not load recent emails');
-      } finally {
-        setLoading(false);
+      });
+      
+      if (!response.ok) {
+        throw new Error('Failed to fetch recent emails');
       }
-    };
-    
-    fetchRecentEmails();
+      
+      const data = await response.json();
+      setEmails(data);
+    } catch (error) {
+      console.error('Error fetching recent emails:', error);
+      setError('Could not load recent emails');
+    } finally {
+      setLoading(false);
+    }
   }, [isLoading]);
 
+  useEffect(() => {
+    fetchRecentEmails();
+  }, [fetchRecentEmails]);
+
+  // Refreshed when the server reports new or recategorized emails
+  useEmailEvents(fetchRecentEmails);
+
   // Handle email click
   const handleEmailClick = (emailId: number) => {
     router.push(`/email/${emailId}`);
@@ -0,0 +1,24 @@
+import * as React from "react"
+
+import { subscribeEmailEvents } from "@/lib/email-events"
+
+// Bursts of events (a backfill, a batch of incoming mail) trigger one refresh
+const DEBOUNCE_MS = 500
+
+// Calls `onChange` after the user's emails were added to or recategorized on the server
+export function useEmailEvents(onChange: () => void) {
+  const latest = React.useRef(onChange)
+  latest.current = onChange
+
+  React.useEffect(() => {
+    let timer: ReturnType<typeof setTimeout> | undefined
+    const unsubscribe = subscribeEmailEvents(() => {
+      clearTimeout(timer)
+      timer = setTimeout(() => latest.current(), DEBOUNCE_MS)
+    })
+    return () => {
+      clearTimeout(timer)
+      unsubscribe()
+    }
+  }, [])
+}
@@ -0,0 +1,91 @@
+const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
+const MAX_RETRY_MS = 60000
+
+export interface EmailEvent {
+  type: 'email.added' | 'email.categorized' | 'emails.recategorized' | 'resync'
+  [key: string]: unknown
+}
+
+type Listener = (event: EmailEvent) => void
+
+// One stream per tab, shared by every component listening
+const listeners = new Set<Listener>()
+let controller: AbortController | null = null
+
+function emit(event: EmailEvent) {
+  for (const listener of listeners) listener(event)
+}
+
+// Read GET /api/events/ until it closes. EventSource can't send the
+// Authorization header, so the text/event-stream is parsed by hand.
+async function read(signal: AbortSignal, reconnecting: boolean): Promise<number | null> {
+  const idToken = localStorage.getItem('storymail-id-token')
+  const response = await fetch(`${API_URL}/api/events/`, {
+    headers: {
+      'Authorization': `Bearer ${idToken}`,
+      'Accept': 'text/event-stream'
+    },
+    signal
+  })
+  if (!response.ok || !response.body) {
+    throw new Error(`Error opening email events: ${response.statusText}`)
+  }
+
+  if (reconnecting) {
+    // Whatever happened while we weren't connected is picked up by a sync
+    emit({ type: 'resync' })
+  }
+
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+  let buffer = ''
+  let retry: number | null = null
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) return retry
+    buffer += value
+    let end
+    while ((end = buffer.indexOf('\n\n')) >= 0) {
+      const frame = buffer.slice(0, end)
+      buffer = buffer.slice(end + 2)
+      let data = ''
+      for (const line of frame.split('\n')) {
+        if (line.startsWith('data:')) data += line.slice(5).trim()
+        else if (line.startsWith('retry:')) retry = Number(line.slice(6))
+      }
+      if (data) emit(JSON.parse(data))
+    }
+  }
+}
+
+async function run(signal: AbortSignal) {
+  let delay = 1000
+  let reconnecting = false
+  while (!signal.aborted) {
+    try {
+      // The server closes streams after a while; reconnect at its retry interval
+      delay = (await read(signal, reconnecting)) ?? delay
+    } catch (error) {
+      if (signal.aborted) return
+      console.error('Email events disconnected:', error)
+      delay = Math.min(delay * 2, MAX_RETRY_MS)
+    }
+    reconnecting = true
+    await new Promise(resolve => setTimeout(resolve, delay))
+  }
+}
+
+// Call `listener` for each of the user's email events; returns the unsubscribe function
+export function subscribeEmailEvents(listener: Listener): () => void {
+  listeners.add(listener)
+  if (!controller) {
+    controller = new AbortController()
+    run(controller.signal)
+  }
+  return () => {
+    listeners.delete(listener)
+    if (listeners.size === 0 && controller) {
+      controller.abort()
+      controller = null
+    }
+  }
+}
@@ -0,0 +1,100 @@
+const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
+const CACHE_KEY = 'storymail-email-sync'
+
+export interface SyncedEmail {
+  id: number
+  from_email: string | null
+  from_name: string | null
+  to_email: string | null
+  subject: string | null
+  date: string
+  preview: string | null
+  summary: string | null
+  category: string | null
+  thread_id: number | null
+  updated_at: string
+}
+
+interface SyncCache {
+  cursor: string | null
+  emails: Record<number, SyncedEmail>
+}
+
+// Kept in memory too, in case the cache is larger than the localStorage quota
+let memory: SyncCache | null = null
+let inFlight: Promise<SyncedEmail[]> | null = null
+
+function emptyCache(): SyncCache {
+  return { cursor: null, emails: {} }
+}
+
+function loadCache(): SyncCache {
+  if (memory) return memory
+  try {
+    const saved = localStorage.getItem(CACHE_KEY)
+    memory = saved ? JSON.parse(saved) : emptyCache()
+  } catch {
+    memory = emptyCache()
+  }
+  return memory!
+}
+
+function saveCache(cache: SyncCache) {
+  memory = cache
+  try {
+    localStorage.setItem(CACHE_KEY, JSON.stringify(cache))
+  } catch {
+    localStorage.removeItem(CACHE_KEY)
+  }
+}
+
+export function clearEmailCache() {
+  memory = null
+  localStorage.removeItem(CACHE_KEY)
+}
+
+// Apply what changed since the stored cursor (GET /api/sync/), page by page
+async function pull(): Promise<SyncedEmail[]> {
+  let cache = loadCache()
+  const idToken = localStorage.getItem('storymail-id-token')
+
+  while (true) {
+    const params = cache.cursor ? `?cursor=${encodeURIComponent(cache.cursor)}` : ''
+    const response = await fetch(`${API_URL}/api/sync/${params}`, {
+      headers: {
+        'Authorization': `Bearer ${idToken}`
+      }
+    })
+    if (response.status === 410) {
+      // Cursor too old to replay deletions: start over
+      cache = emptyCache()
+      continue
+    }
+    if (!response.ok) {
+      throw new Error(`Error syncing emails: ${response.statusText}`)
+    }
+
+    const page = await response.json()
+    for (const id of page.deleted) {
+      delete cache.emails[id]
+    }
+    for (const email of page.emails) {
+      cache.emails[email.id] = email
+    }
+    cache.cursor = page.cursor
+    saveCache(cache)
+    if (!page.has_more) break
+  }
+
+  return Object.values(cache.emails).sort((a, b) => Date.parse(b.date) - Date.parse(a.date))
+}
+
+// All of the user's emails, newest first, fetching only what changed since the last call
+export function syncEmails(): Promise<SyncedEmail[]> {
+  if (!inFlight) {
+    inFlight = pull().finally(() => {
+      inFlight = null
+    })
+  }
+  return inFlight
+}